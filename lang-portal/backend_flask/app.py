@@ -1,8 +1,10 @@
 from flask import Flask, jsonify
 from flask_cors import CORS
 from config import Config
-from routes import words, groups, study, admin, dashboard
+from routes import words, groups, study, admin, dashboard, sync, export
+from lib.backups import init_backups
 from lib.db import init_db
+from lib.replication import init_replica
 
 def create_app(config_class=Config):
     # Initialize Flask app
@@ -12,6 +14,13 @@ def create_app(config_class=Config):
     # Enable CORS
     CORS(app)
     
+    # Read replicas serve their copies of the databases
+    if app.config.get('REPLICA_DIR'):
+        init_replica(app)
+
+    # Request timing (for backup reports) and online backups
+    init_backups(app)
+
     # Initialize database
     init_db(app)
     
@@ -21,6 +30,8 @@ def create_app(config_class=Config):
     groups.register_routes(app)
     study.register_routes(app)
     admin.register_routes(app)
+    sync.register_routes(app)
+    export.register_routes(app)
     
     return app
 
@@ -6,12 +6,97 @@ class Config:
     SQLITE_DB_PATH = os.path.join(BASE_DIR, 'words.db')
     SQLALCHEMY_DATABASE_URI = f'sqlite:///{SQLITE_DB_PATH}'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
-    
+    # WAL lets long readers (exports) keep a snapshot without blocking writers
+    SQLITE_JOURNAL_MODE = 'wal'
+    # Vocabulary reads go through memory-mapped pages instead of read() calls
+    SQLITE_MMAP_SIZE = 256 * 1024 * 1024
+    # Prepared statements kept per connection; each of lib/repository's
+    # queries is compiled into this cache on its first use
+    SQLITE_STATEMENT_CACHE_SIZE = 256
+    # 'single' keeps everything in words.db; 'split' keeps study sessions
+    # and reviews, with their change_log entries and review counts, in
+    # HISTORY_DB_PATH, attached to every connection, so review writes
+    # don't touch the vocabulary file. `invoke migrate`
+    # moves the history tables over the first time it runs with 'split'
+    # (or 'sharded').
+    STORAGE_LAYOUT = 'single'
+    HISTORY_DB_PATH = os.path.join(BASE_DIR, 'history.db')
+    # 'sharded' keeps each learner's history in SHARD_DIR/<learner>.db,
+    # chosen by the X-Learner-Id request header; up to SHARD_CACHE_SIZE
+    # idle shard connections stay open
+    SHARD_DIR = os.path.join(BASE_DIR, 'shards')
+    SHARD_CACHE_SIZE = 256
+
+    # Read replicas. `invoke ship-replication` on the primary writes page
+    # diffs of its databases to REPLICATION_DIR; `invoke apply-replication`
+    # patches them into a replica's REPLICA_DIR. An app with REPLICA_DIR
+    # set serves reads from those copies and redirects writes to
+    # REPLICATION_PRIMARY_URL. Replicas further behind than
+    # REPLICATION_KEEP_SEGMENTS ships start over from full snapshots.
+    REPLICATION_DIR = os.path.join(BASE_DIR, 'replication')
+    REPLICATION_KEEP_SEGMENTS = 100
+    REPLICA_DIR = None
+    REPLICATION_PRIMARY_URL = None
+
+    # Online backups (POST /api/admin/backup, `invoke backup`) into
+    # BACKUP_DIR/<timestamp>: BACKUP_PAGES_PER_STEP pages are copied at a
+    # time with a BACKUP_STEP_SLEEP pause after each step, and the newest
+    # BACKUP_KEEP verified backups are kept. With BACKUP_INTERVAL_SECONDS
+    # set, the app also backs up on that schedule.
+    BACKUP_DIR = os.path.join(BASE_DIR, 'backups')
+    BACKUP_PAGES_PER_STEP = 256
+    BACKUP_STEP_SLEEP = 0.01
+    BACKUP_KEEP = 7
+    BACKUP_INTERVAL_SECONDS = 0
+
     # API settings
     JSON_SORT_KEYS = False
     ITEMS_PER_PAGE = 100
     TESTING = False
 
+    # Import settings
+    IMPORT_BATCH_SIZE = 5000
+    EXPORT_BATCH_SIZE = 5000
+    REVIEW_EXPORT_DIR = os.path.join(BASE_DIR, 'exports', 'reviews')
+
+    # Bulk group operations commit after every chunk of this many
+    # memberships, so the write lock is only held briefly
+    GROUP_BATCH_SIZE = 5000
+
+    # Review history partitions (`invoke partition-reviews`): the current
+    # and previous REVIEW_HOT_MONTHS - 1 months stay in word_review_items,
+    # older months get a table each, and months older than
+    # REVIEW_ARCHIVE_AFTER_MONTHS move to the archive database
+    REVIEW_HOT_MONTHS = 2
+    REVIEW_ARCHIVE_AFTER_MONTHS = 12
+    REVIEW_ARCHIVE_PATH = os.path.join(BASE_DIR, 'review_archive.db')
+
+    # Vocabulary pack built by `invoke build-pack`. When serving from the
+    # pack, word and group lookups skip SQLite until words, groups or
+    # memberships change after the build; words missing from the pack,
+    # and every lookup while it is stale, fall back to the database.
+    VOCAB_PACK_PATH = os.path.join(BASE_DIR, 'exports', 'vocab.pack')
+    SERVE_FROM_VOCAB_PACK = False
+
+    # How stale the in-process autocomplete index may get before a request
+    # checks change_log for word edits
+    AUTOCOMPLETE_REFRESH_SECONDS = 1.0
+
+    # Embeddings behind GET /api/words/similar. 'hashing' works offline;
+    # 'openai' calls an OpenAI-compatible /v1/embeddings endpoint, such as
+    # the ollama service in opea-comps
+    EMBEDDER = 'hashing'
+    EMBEDDING_URL = 'http://localhost:8008'
+    EMBEDDING_MODEL = 'nomic-embed-text'
+    VECTOR_INDEX_DIR = os.path.join(BASE_DIR, 'words.vectors')
+    VECTOR_REFRESH_SECONDS = 1.0
+
 class TestConfig(Config):
     SQLITE_DB_PATH = 'test_words.db'
+    REVIEW_ARCHIVE_PATH = 'test_review_archive.db'
+    HISTORY_DB_PATH = 'test_history.db'
+    SHARD_DIR = 'test_shards'
+    BACKUP_DIR = 'test_backups'
     TESTING = True
+    AUTOCOMPLETE_REFRESH_SECONDS = 0
+    VECTOR_REFRESH_SECONDS = 0
@@ -0,0 +1,148 @@
+from bisect import bisect_left, insort
+from lib.normalize import normalize_key
+import threading
+import time
+
+DEFAULT_AUTOCOMPLETE_LIMIT = 10
+MAX_AUTOCOMPLETE_LIMIT = 50
+
+# Below this many changed entries the sorted list is patched in place
+# (each insert/delete shifts the list); above it, one sort merges them
+INPLACE_CHANGES = 64
+# Above this many changed words, rebuilding from scratch is cheaper
+REBUILD_CHANGES = 100_000
+
+def word_entries(word_id, spanish, english):
+    """Index entries for a word: its folded Spanish and English forms"""
+    keys = {normalize_key(spanish), normalize_key(english)}
+    return [f"{key}\x00{word_id}" for key in keys if key]
+
+class PrefixIndex:
+    """Sorted in-memory list of folded word forms for typeahead.
+
+    Entries are "<folded form>\\0<word id>" strings in one sorted list, so
+    a prefix lookup is a bisect plus a short forward scan. The index
+    records the change_log version it reflects and catches up from the
+    log instead of reloading every word.
+    """
+
+    def __init__(self):
+        self.entries = []
+        self.words = {}  # word id -> "spanish\0english" for responses
+        self.version = None
+        self.checked_at = 0.0
+        self.lock = threading.Lock()
+
+    def rebuild(self, conn):
+        own_transaction = not conn.in_transaction
+        if own_transaction:
+            conn.execute("BEGIN")
+        try:
+            version = conn.execute("SELECT COALESCE(MAX(version), 0) FROM change_log").fetchone()[0]
+            rows = conn.execute("SELECT id, spanish, english FROM words")
+            entries = []
+            words = {}
+            for word_id, spanish, english in rows:
+                words[word_id] = f"{spanish}\x00{english}"
+                entries.extend(word_entries(word_id, spanish, english))
+        finally:
+            if own_transaction:
+                conn.rollback()
+
+        entries.sort()
+        self.entries = entries
+        self.words = words
+        self.version = version
+
+    def apply_changes(self, conn):
+        """Apply word changes logged since the index was built"""
+        # Writers are serialized, so every version up to the current
+        # maximum is already committed when this reads it
+        latest = conn.execute("SELECT COALESCE(MAX(version), 0) FROM change_log").fetchone()[0]
+        if latest == self.version:
+            return
+        if latest < self.version:
+            # The database was reset underneath us
+            self.rebuild(conn)
+            return
+        changes = conn.execute("""
+            SELECT c.row_id, w.spanish, w.english
+            FROM change_log c
+            LEFT JOIN words w ON w.id = c.row_id
+            WHERE c.version > ? AND c.version <= ?
+              AND c.table_name = 'words'
+        """, (self.version, latest)).fetchall()
+        if len(changes) > REBUILD_CHANGES:
+            self.rebuild(conn)
+            return
+
+        removed = []
+        added = []
+        for word_id, spanish, english in changes:
+            old = self.words.pop(word_id, None)
+            if old is not None:
+                removed.extend(word_entries(word_id, *old.split('\x00')))
+            if spanish is not None:
+                self.words[word_id] = f"{spanish}\x00{english}"
+                added.extend(word_entries(word_id, spanish, english))
+
+        if len(removed) <= INPLACE_CHANGES:
+            for entry in removed:
+                i = bisect_left(self.entries, entry)
+                if i < len(self.entries) and self.entries[i] == entry:
+                    del self.entries[i]
+        else:
+            removed = set(removed)
+            self.entries = [entry for entry in self.entries if entry not in removed]
+
+        if len(added) <= INPLACE_CHANGES:
+            for entry in added:
+                insort(self.entries, entry)
+        else:
+            # Timsort merges the two sorted runs in linear time
+            self.entries.extend(sorted(added))
+            self.entries.sort()
+
+        self.version = latest
+
+    def refresh(self, connect, max_age):
+        """Catch up with the database at most once every `max_age` seconds.
+
+        `connect` is only called when a refresh is due, so most lookups
+        never touch SQLite.
+        """
+        if self.version is not None and time.monotonic() - self.checked_at < max_age:
+            return
+        with self.lock:
+            if self.version is not None and time.monotonic() - self.checked_at < max_age:
+                return
+            conn = connect()
+            if self.version is None:
+                self.rebuild(conn)
+            else:
+                self.apply_changes(conn)
+            self.checked_at = time.monotonic()
+
+    def complete(self, prefix, limit=DEFAULT_AUTOCOMPLETE_LIMIT):
+        """Return up to `limit` words with a Spanish or English form starting with `prefix`"""
+        key = normalize_key(prefix).replace('\x00', '')
+        word_ids = []
+        with self.lock:
+            entries = self.entries
+            i = bisect_left(entries, key)
+            while i < len(entries) and len(word_ids) < limit and entries[i].startswith(key):
+                word_id = int(entries[i].rpartition('\x00')[2])
+                if word_id not in word_ids:
+                    word_ids.append(word_id)
+                i += 1
+            texts = [self.words[word_id] for word_id in word_ids]
+
+        items = []
+        for word_id, text in zip(word_ids, texts):
+            spanish, english = text.split('\x00')
+            items.append({"id": word_id, "spanish": spanish, "english": english})
+        return items
+
+def get_prefix_index(app):
+    """Return the app's index, shared by the threads of this process"""
+    return app.extensions.setdefault('prefix_index', PrefixIndex())
@@ -0,0 +1,258 @@
+from flask import g
+from collections import deque
+from datetime import datetime, timezone
+from lib.storage import list_learners, shard_archive_path, shard_path
+import fcntl
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+# Online backups. Connection.backup copies a database BACKUP_PAGES_PER_STEP
+# pages at a time; the source is only read-locked during a step and the
+# backup sleeps BACKUP_STEP_SLEEP seconds after each one, so a writer waits
+# for at most one step. A commit by another connection restarts the copy;
+# after MAX_PACED_RESTARTS restarts the paced copy gives up and the file is
+# copied in a single step instead (which, under WAL, still doesn't block
+# writers). Every copy is checked with PRAGMA integrity_check before its
+# backup counts as complete.
+MAX_PACED_RESTARTS = 3
+MANIFEST_FILE = 'manifest.json'
+PARTIAL_SUFFIX = '.partial'
+
+class BackupInProgressError(RuntimeError):
+    """Raised when another backup holds the backup directory"""
+
+class BackupVerificationError(ValueError):
+    """Raised when a copy fails PRAGMA integrity_check"""
+
+class _TooManyRestarts(Exception):
+    pass
+
+def backup_files(config):
+    """Databases a backup copies, as name -> path"""
+    files = {'words': config['SQLITE_DB_PATH']}
+    layout = config.get('STORAGE_LAYOUT')
+    if layout == 'split':
+        files['history'] = config['HISTORY_DB_PATH']
+    if os.path.exists(config['REVIEW_ARCHIVE_PATH']):
+        files['review_archive'] = config['REVIEW_ARCHIVE_PATH']
+    if layout == 'sharded':
+        for learner in list_learners(config['SHARD_DIR']):
+            files[f'shard-{learner}'] = shard_path(config['SHARD_DIR'], learner)
+            archive_path = shard_archive_path(config['SHARD_DIR'], learner)
+            if os.path.exists(archive_path):
+                files[f'shard-{learner}-archive'] = archive_path
+    return files
+
+def backup_database(source_path, target_path, pages, sleep):
+    """Copy one database online, `pages` pages per step.
+
+    Returns:
+        dict: steps taken, restarts caused by concurrent writes, page
+        count, and whether the copy fell back to a single step
+    """
+    stats = {"steps": 0, "restarts": 0, "pages": 0, "single_step": False}
+    remaining_before = None
+
+    def progress(status, remaining, total):
+        nonlocal remaining_before
+        stats["steps"] += 1
+        stats["pages"] = total
+        # A restarted copy makes no progress between steps
+        if remaining_before is not None and remaining >= remaining_before:
+            stats["restarts"] += 1
+            if stats["restarts"] >= MAX_PACED_RESTARTS:
+                raise _TooManyRestarts()
+        remaining_before = remaining
+        if remaining:
+            time.sleep(sleep)
+
+    source = sqlite3.connect(source_path, timeout=30)
+    target = sqlite3.connect(target_path)
+    try:
+        try:
+            source.backup(target, pages=pages, progress=progress)
+        except _TooManyRestarts:
+            stats["single_step"] = True
+            stats["steps"] += 1
+            source.backup(target)
+        # A standalone file: no WAL to carry around with it
+        target.execute("PRAGMA journal_mode = DELETE")
+    finally:
+        target.close()
+        source.close()
+    return stats
+
+def verify_backup(path):
+    conn = sqlite3.connect(path)
+    try:
+        problems = [row[0] for row in conn.execute("PRAGMA integrity_check")]
+    finally:
+        conn.close()
+    if problems != ['ok']:
+        raise BackupVerificationError(f"{os.path.basename(path)}: {'; '.join(problems[:5])}")
+
+def list_backups(backup_dir):
+    """Manifests of the complete backups, newest first"""
+    if not os.path.isdir(backup_dir):
+        return []
+    manifests = []
+    for name in sorted(os.listdir(backup_dir), reverse=True):
+        path = os.path.join(backup_dir, name, MANIFEST_FILE)
+        if not name.endswith(PARTIAL_SUFFIX) and os.path.exists(path):
+            with open(path, 'r') as f:
+                manifests.append(json.load(f))
+    return manifests
+
+def rotate_backups(backup_dir, keep):
+    """Delete all but the newest `keep` backups and any partial ones
+
+    Returns:
+        list: Names of the deleted backups
+    """
+    removed = [manifest['name'] for manifest in list_backups(backup_dir)[keep:]]
+    removed += [name for name in os.listdir(backup_dir) if name.endswith(PARTIAL_SUFFIX)]
+    for name in removed:
+        shutil.rmtree(os.path.join(backup_dir, name), ignore_errors=True)
+    return removed
+
+def run_backup(files, backup_dir, pages, sleep, keep):
+    """Back up every file into a new timestamped directory, verify the
+    copies, then rotate old backups.
+
+    Only one backup runs per directory at a time, across processes.
+
+    Returns:
+        dict: The backup's manifest
+    """
+    os.makedirs(backup_dir, exist_ok=True)
+    with open(os.path.join(backup_dir, 'lock'), 'a') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise BackupInProgressError("A backup is already running")
+
+        started_at = time.time()
+        name = datetime.fromtimestamp(started_at, timezone.utc).strftime('%Y%m%dT%H%M%S.%fZ')
+        partial = os.path.join(backup_dir, name + PARTIAL_SUFFIX)
+        os.makedirs(partial)
+        manifest = {"name": name, "started_at": started_at, "files": {}}
+        try:
+            for file_name, source_path in files.items():
+                target_path = os.path.join(partial, f'{file_name}.db')
+                stats = backup_database(source_path, target_path, pages, sleep)
+                verify_backup(target_path)
+                manifest["files"][file_name] = {
+                    **stats, "size": os.path.getsize(target_path), "integrity": "ok"
+                }
+        except Exception:
+            shutil.rmtree(partial, ignore_errors=True)
+            raise
+
+        manifest["duration_seconds"] = round(time.time() - started_at, 3)
+        with open(os.path.join(partial, MANIFEST_FILE), 'w') as f:
+            json.dump(manifest, f)
+        os.replace(partial, os.path.join(backup_dir, name))
+        manifest["rotated"] = rotate_backups(backup_dir, keep)
+        return manifest
+
+class LatencyMonitor:
+    """Durations of the app's most recent requests, to compare latency
+    before and during a backup"""
+
+    def __init__(self, size=10000):
+        self.requests = deque(maxlen=size)  # (finished at, seconds)
+
+    def start(self):
+        g.request_started = time.perf_counter()
+
+    def finish(self, response):
+        started = g.get('request_started')
+        if started is not None:
+            self.requests.append((time.time(), time.perf_counter() - started))
+        return response
+
+    def summary(self, since, until):
+        durations = sorted(seconds for finished, seconds in list(self.requests)
+                           if since <= finished < until)
+        if not durations:
+            return {"requests": 0, "median_ms": None, "p95_ms": None}
+        return {
+            "requests": len(durations),
+            "median_ms": round(durations[len(durations) // 2] * 1000, 3),
+            "p95_ms": round(durations[min(int(len(durations) * 0.95), len(durations) - 1)] * 1000, 3)
+        }
+
+class BackupRunner:
+    """Runs backups of the app's databases in a background thread, on
+    demand and every BACKUP_INTERVAL_SECONDS when that is set"""
+
+    def __init__(self, app, monitor):
+        self.app = app
+        self.monitor = monitor
+        self.lock = threading.Lock()
+        self.thread = None
+        self.last = None
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self):
+        with self.lock:
+            if self.running:
+                raise BackupInProgressError("A backup is already running")
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def wait(self, timeout=None):
+        thread = self.thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def run(self):
+        config = self.app.config
+        try:
+            manifest = run_backup(
+                backup_files(config), config['BACKUP_DIR'], config['BACKUP_PAGES_PER_STEP'],
+                config['BACKUP_STEP_SLEEP'], config['BACKUP_KEEP']
+            )
+        except (BackupInProgressError, BackupVerificationError, sqlite3.Error, OSError) as e:
+            self.last = {"error": str(e), "failed_at": time.time()}
+            return
+        started = manifest['started_at']
+        finished = started + manifest['duration_seconds']
+        manifest['latency'] = {
+            "before": self.monitor.summary(started - manifest['duration_seconds'], started),
+            "during": self.monitor.summary(started, finished)
+        }
+        self.last = manifest
+
+    def schedule(self, interval):
+        """Start a backup whenever the newest one is `interval` seconds old"""
+        def loop():
+            while True:
+                backups = list_backups(self.app.config['BACKUP_DIR'])
+                age = time.time() - backups[0]['started_at'] if backups else interval
+                if age >= interval:
+                    try:
+                        self.start()
+                    except BackupInProgressError:
+                        pass
+                    self.wait()
+                    age = 0
+                time.sleep(max(interval - age, 1))
+
+        threading.Thread(target=loop, daemon=True).start()
+
+def init_backups(app):
+    """Time requests and set up the backup runner (and its schedule)"""
+    monitor = LatencyMonitor()
+    app.before_request(monitor.start)
+    app.after_request(monitor.finish)
+    runner = app.extensions['backups'] = BackupRunner(app, monitor)
+    if app.config.get('BACKUP_INTERVAL_SECONDS'):
+        runner.schedule(app.config['BACKUP_INTERVAL_SECONDS'])
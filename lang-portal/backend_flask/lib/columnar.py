@@ -0,0 +1,181 @@
+import json
+import os
+import numpy as np
+from lib.partitions import HOT_TABLE, create_history_view
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # Parquet output is optional
+    pyarrow = None
+
+STATE_FILE = '_state.json'
+DEFAULT_ROWS_PER_PART = 1_000_000
+
+def read_state(directory):
+    """Return the export state: last exported review id and written parts"""
+    path = os.path.join(directory, STATE_FILE)
+    if not os.path.exists(path):
+        return {"last_id": 0, "parts": []}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def write_state(directory, state):
+    path = os.path.join(directory, STATE_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+def resolve_format(file_format):
+    if file_format == 'auto':
+        return 'parquet' if pyarrow is not None else 'npz'
+    if file_format == 'parquet' and pyarrow is None:
+        raise ValueError("Parquet export requires pyarrow")
+    if file_format not in ('npz', 'parquet'):
+        raise ValueError("format must be npz, parquet or auto")
+    return file_format
+
+def write_npz(path, columns):
+    """Write one part as compressed NumPy arrays.
+
+    ids and timestamps are delta-encoded against the first row, ids are
+    int32 and `correct` is packed 8 reviews per byte.
+    """
+    ids = columns['id']
+    timestamps = columns['created_at']
+    np.savez_compressed(
+        path,
+        rows=np.int64(len(ids)),
+        id_first=ids[0],
+        id_delta=np.diff(ids).astype(np.int32),
+        word_id=columns['word_id'].astype(np.int32),
+        study_session_id=columns['study_session_id'].astype(np.int32),
+        correct_bits=np.packbits(columns['correct'].astype(bool)),
+        created_at_first=timestamps[0],
+        created_at_delta=np.diff(timestamps).astype(np.int32),
+    )
+
+def write_parquet(path, columns):
+    """Write one part as Parquet; booleans are bit-packed by the format itself"""
+    table = pyarrow.table({
+        'id': pyarrow.array(columns['id'], pyarrow.int64()),
+        'word_id': pyarrow.array(columns['word_id'], pyarrow.int32()),
+        'study_session_id': pyarrow.array(columns['study_session_id'], pyarrow.int32()),
+        'correct': pyarrow.array(columns['correct'].astype(bool)),
+        'created_at': pyarrow.array(columns['created_at'], pyarrow.timestamp('s')),
+    })
+    pyarrow.parquet.write_table(
+        table, path,
+        compression='zstd',
+        use_dictionary=False,
+        column_encoding={
+            'id': 'DELTA_BINARY_PACKED',
+            'created_at': 'DELTA_BINARY_PACKED',
+        },
+    )
+
+def read_review_part(path):
+    """Load an exported part back into plain NumPy columns"""
+    if path.endswith('.parquet'):
+        table = pyarrow.parquet.read_table(path)
+        columns = {name: table[name].to_numpy() for name in table.column_names}
+        columns['created_at'] = columns['created_at'].astype('datetime64[s]').astype(np.int64)
+        return columns
+
+    with np.load(path) as part:
+        rows = int(part['rows'])
+        return {
+            'id': np.concatenate(([part['id_first']], part['id_first'] + np.cumsum(part['id_delta']))),
+            'word_id': part['word_id'],
+            'study_session_id': part['study_session_id'],
+            'correct': np.unpackbits(part['correct_bits'], count=rows).astype(bool),
+            'created_at': np.concatenate((
+                [part['created_at_first']],
+                part['created_at_first'] + np.cumsum(part['created_at_delta'], dtype=np.int64)
+            )),
+        }
+
+def write_part(directory, month, chunks, file_format):
+    columns = {
+        name: np.concatenate([chunk[name] for chunk in chunks])
+        for name in chunks[0]
+    }
+    month_dir = os.path.join(directory, month)
+    os.makedirs(month_dir, exist_ok=True)
+    name = f"part-{columns['id'][0]:010d}-{columns['id'][-1]:010d}.{file_format}"
+    path = os.path.join(month_dir, name)
+    if file_format == 'parquet':
+        write_parquet(path, columns)
+    else:
+        write_npz(path, columns)
+    return {"month": month, "file": name, "rows": len(columns['id'])}
+
+def export_review_history(conn, directory, file_format='auto',
+                          rows_per_part=DEFAULT_ROWS_PER_PART, batch_size=100_000,
+                          archive_path=None):
+    """Append reviews added since the last export as monthly columnar parts.
+
+    Rows are read in id order with fetchmany, bucketed by the month of
+    created_ts (offline uploads can add old months) and written as a new
+    part per month, so earlier files are never rewritten. With an
+    archive path, reviews already moved into partitions are read too.
+
+    Returns:
+        dict: format, exported row count, last exported id and new parts
+    """
+    file_format = resolve_format(file_format)
+    os.makedirs(directory, exist_ok=True)
+    state = read_state(directory)
+
+    source = create_history_view(conn, archive_path) if archive_path else HOT_TABLE
+    cursor = conn.execute(f"""
+        SELECT id, word_id, study_session_id, correct,
+               created_ts,
+               strftime('%Y-%m', created_ts, 'unixepoch')
+        FROM {source}
+        WHERE id > ?
+        ORDER BY id
+    """, (state['last_id'],))
+
+    pending = {}
+    pending_rows = {}
+    parts = []
+    last_id = state['last_id']
+    exported = 0
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        exported += len(rows)
+
+        ids, word_ids, session_ids, correct, timestamps, months = zip(*rows)
+        batch = {
+            'id': np.array(ids, dtype=np.int64),
+            'word_id': np.array(word_ids, dtype=np.int32),
+            'study_session_id': np.array(session_ids, dtype=np.int32),
+            'correct': np.array(correct, dtype=bool),
+            'created_at': np.array(timestamps, dtype=np.int64),
+        }
+        months = np.array(months)
+        for month in np.unique(months):
+            mask = months == month
+            pending.setdefault(month, []).append({k: v[mask] for k, v in batch.items()})
+            pending_rows[month] = pending_rows.get(month, 0) + int(mask.sum())
+            if pending_rows[month] >= rows_per_part:
+                parts.append(write_part(directory, month, pending.pop(month), file_format))
+                pending_rows[month] = 0
+
+    for month, chunks in pending.items():
+        parts.append(write_part(directory, month, chunks, file_format))
+
+    state['last_id'] = last_id
+    state['parts'].extend(parts)
+    write_state(directory, state)
+
+    return {
+        "format": file_format,
+        "rows": exported,
+        "last_id": last_id,
+        "parts": parts
+    }
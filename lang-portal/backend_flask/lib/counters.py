@@ -0,0 +1,31 @@
+# groups.words_count is kept by triggers on word_groups (migrations/017);
+# this is the value those triggers maintain
+ACTUAL_WORDS_COUNT_SQL = "SELECT COUNT(*) FROM word_groups WHERE group_id = groups.id"
+
+# Rewrites only the groups whose count has drifted
+RECONCILE_WORDS_COUNT_SQL = f"""
+    UPDATE groups
+    SET words_count = ({ACTUAL_WORDS_COUNT_SQL})
+    WHERE words_count IS NOT ({ACTUAL_WORDS_COUNT_SQL})
+"""
+
+def find_words_count_drift(conn):
+    """Groups whose stored words_count differs from their membership count.
+
+    Returns:
+        list: (group_id, name, stored, actual) tuples in group id order
+    """
+    return [tuple(row) for row in conn.execute(f"""
+        SELECT id, name, words_count, actual
+        FROM (SELECT id, name, words_count, ({ACTUAL_WORDS_COUNT_SQL}) AS actual FROM groups)
+        WHERE words_count IS NOT actual
+        ORDER BY id
+    """)]
+
+def reconcile_words_count(conn):
+    """Reset drifted words_count values to the membership count. The caller commits.
+
+    Returns:
+        int: Number of groups corrected
+    """
+    return conn.execute(RECONCILE_WORDS_COUNT_SQL).rowcount
@@ -1,30 +1,234 @@
-from flask import current_app, jsonify, g
+from flask import current_app, jsonify, g, request
+from collections import OrderedDict
+from lib.replication import pinned_path
+from lib.storage import (
+    HISTORY_SCHEMA, LEARNER_ID, attach_history, create_shard, list_learners, shard_archive_path,
+    shard_path
+)
 import sqlite3
+import threading
+import os
+
+MIGRATIONS_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations'
+)
+
+# Migration files whose first line is this comment change only history
+# tables; in the split and sharded layouts they run against the history
+# files
+HISTORY_MIGRATION_HEADER = f'-- database: {HISTORY_SCHEMA}'
+
+# Request header naming the learner whose shard a request uses
+LEARNER_HEADER = 'X-Learner-Id'
+
+def history_db_path(config, learner=None):
+    """The history file to attach, or None in the single-file layout"""
+    if config.get('STORAGE_LAYOUT') == 'split':
+        return config['HISTORY_DB_PATH']
+    if config.get('STORAGE_LAYOUT') == 'sharded':
+        return shard_path(config['SHARD_DIR'], learner)
+    return None
+
+def review_archive_path():
+    """Review archive database of the current request's history"""
+    if current_app.config.get('STORAGE_LAYOUT') == 'sharded':
+        return shard_archive_path(current_app.config['SHARD_DIR'], g.learner)
+    return pinned_path(current_app.config['REVIEW_ARCHIVE_PATH'])
+
+def open_connection(db_path, journal_mode=None, history_path=None, mmap_size=None, **kwargs):
+    """Open a SQLite connection with the pragmas every app connection uses"""
+    conn = sqlite3.connect(pinned_path(db_path), **kwargs)
+    # Enable foreign key constraints
+    conn.execute("PRAGMA foreign_keys = ON")
+    if journal_mode:
+        conn.execute(f"PRAGMA journal_mode = {journal_mode}")
+    if mmap_size:
+        conn.execute(f"PRAGMA main.mmap_size = {int(mmap_size)}")
+    if history_path:
+        attach_history(conn, pinned_path(history_path), journal_mode)
+    return conn
+
+class ShardRouter:
+    """Hands out connections to learner shards, keeping the most recently
+    used ones open.
+
+    A checked-out connection belongs to one request until it is checked
+    back in, so connections are never shared between threads at the same
+    time. At most `capacity` idle connections stay open; checking in one
+    more closes the least recently used.
+    """
+
+    def __init__(self, open_shard, capacity):
+        self.open_shard = open_shard
+        self.capacity = capacity
+        self.idle = OrderedDict()  # learner -> connection, least recently used first
+        self.lock = threading.Lock()
+
+    def checkout(self, learner):
+        with self.lock:
+            conn = self.idle.pop(learner, None)
+        if conn is None:
+            conn = self.open_shard(learner)
+        return conn
+
+    def checkin(self, learner, conn):
+        # Never hand the next request an open transaction (or its locks)
+        if conn.in_transaction:
+            conn.rollback()
+        evicted = []
+        with self.lock:
+            if learner in self.idle:
+                # A concurrent request of the same learner returned first
+                evicted.append(conn)
+            else:
+                self.idle[learner] = conn
+                while len(self.idle) > self.capacity:
+                    evicted.append(self.idle.popitem(last=False)[1])
+        for stale in evicted:
+            stale.close()
+
+    def close_all(self):
+        with self.lock:
+            idle, self.idle = self.idle, OrderedDict()
+        for conn in idle.values():
+            conn.close()
+
+def open_shard_connection(config, learner):
+    """App connection to the vocabulary with one learner's shard attached"""
+    conn = open_connection(
+        config['SQLITE_DB_PATH'],
+        config.get('SQLITE_JOURNAL_MODE'),
+        create_shard(config['SHARD_DIR'], learner),
+        config.get('SQLITE_MMAP_SIZE'),
+        detect_types=sqlite3.PARSE_DECLTYPES,
+        cached_statements=config.get('SQLITE_STATEMENT_CACHE_SIZE', 128),
+        check_same_thread=False
+    )
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def resolve_learner():
+    """Pick the learner (and so the shard) of a request in the sharded layout"""
+    learner = request.headers.get(LEARNER_HEADER) or request.args.get('learner')
+    if not learner or not LEARNER_ID.fullmatch(learner):
+        return jsonify({
+            "error": "Invalid learner",
+            "message": f"Send the learner id in the {LEARNER_HEADER} header "
+                       "(letters, digits, '-' and '_')"
+        }), 400
+    g.learner = learner
 
 def get_db():
     if 'db' not in g:
-        g.db = sqlite3.connect(
+        router = current_app.extensions.get('shard_router')
+        if router is not None:
+            g.db = router.checkout(g.learner)
+            return g.db
+
+        g.db = open_connection(
             current_app.config['SQLITE_DB_PATH'],
-            detect_types=sqlite3.PARSE_DECLTYPES
+            current_app.config.get('SQLITE_JOURNAL_MODE'),
+            history_db_path(current_app.config),
+            current_app.config.get('SQLITE_MMAP_SIZE'),
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            cached_statements=current_app.config.get('SQLITE_STATEMENT_CACHE_SIZE', 128)
         )
         g.db.row_factory = sqlite3.Row
         
-        # Enable foreign key constraints
-        cursor = g.db.cursor()
-        cursor.execute("PRAGMA foreign_keys = ON")
-        g.db.commit()
-        
     return g.db
 
+def other_learner_dbs():
+    """Yield (learner, connection) for every other learner's shard.
+
+    For the few requests that change every learner's history. Each
+    connection comes from the shard router and goes back to it once the
+    caller moves on; nothing is yielded outside the sharded layout.
+    """
+    router = current_app.extensions.get('shard_router')
+    if router is None:
+        return
+    for learner in list_learners(current_app.config['SHARD_DIR']):
+        if learner == g.learner:
+            continue
+        conn = router.checkout(learner)
+        try:
+            yield learner, conn
+        finally:
+            router.checkin(learner, conn)
+
 def close_db(e=None):
     db = g.pop('db', None)
     if db is not None:
-        db.close()
+        router = current_app.extensions.get('shard_router')
+        if router is not None:
+            router.checkin(g.learner, db)
+        else:
+            db.close()
 
 def init_db(app):
     """Register database functions with the Flask app"""
+    if app.config.get('STORAGE_LAYOUT') == 'sharded':
+        app.extensions['shard_router'] = ShardRouter(
+            lambda learner: open_shard_connection(app.config, learner),
+            app.config['SHARD_CACHE_SIZE']
+        )
+        app.before_request(resolve_learner)
     app.teardown_appcontext(close_db)
 
+def run_migrations(conn, migrations_path=MIGRATIONS_PATH, start=1, history_paths=()):
+    """Apply migration files that have not been recorded yet.
+
+    Files run in filename order and each one is recorded in
+    schema_migrations, so non-idempotent migrations (ALTER TABLE) only
+    ever run once. Files numbered below `start` are skipped.
+
+    With `history_paths` (the history files of a split or sharded layout
+    whose history tables have been moved), files starting with
+    HISTORY_MIGRATION_HEADER run against each of those files instead;
+    schema_migrations in the main file records both kinds. A history
+    migration is recorded once every file has run it, so write it to be
+    safe to run again (IF NOT EXISTS) in case one file fails.
+
+    Returns:
+        list: File names of the migrations that were applied
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            name TEXT PRIMARY KEY,
+            applied_at DATETIME NOT NULL
+        )
+    """)
+    applied = {row[0] for row in conn.execute("SELECT name FROM schema_migrations")}
+
+    migration_files = sorted(
+        f for f in os.listdir(migrations_path)
+        if f.endswith('.sql') and int(f.split('_', 1)[0]) >= start
+    )
+
+    ran = []
+    for file_name in migration_files:
+        if file_name in applied:
+            continue
+        with open(os.path.join(migrations_path, file_name), 'r') as f:
+            sql = f.read()
+        if history_paths and sql.startswith(HISTORY_MIGRATION_HEADER):
+            for history_path in history_paths:
+                history = sqlite3.connect(history_path)
+                try:
+                    history.executescript(sql)
+                finally:
+                    history.close()
+        else:
+            conn.executescript(sql)
+        conn.execute("""
+            INSERT INTO schema_migrations (name, applied_at)
+            VALUES (?, datetime('now'))
+        """, (file_name,))
+        conn.commit()
+        ran.append(file_name)
+
+    return ran
+
 def validate_page(page, total_items, per_page=100):
     """Validates page number and returns error response if invalid"""
     if page < 1:
@@ -0,0 +1,112 @@
+from lib.normalize import normalize_key
+import numpy as np
+import json
+import re
+import urllib.error
+import urllib.request
+import zlib
+
+# Texts sent to a remote embedder per request
+EMBED_BATCH_SIZE = 256
+
+class EmbeddingError(RuntimeError):
+    pass
+
+def normalize_rows(vectors):
+    """Scale rows to unit length so a dot product is the cosine similarity"""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return (vectors / norms).astype(np.float32)
+
+def word_text(spanish, english):
+    """Text embedded for a word: both languages, so either can match"""
+    return f"{spanish} {english}"
+
+class Embedder:
+    """Turns texts into unit-length float32 vectors.
+
+    `name` identifies the model and its settings; vectors stored under one
+    name are never compared with vectors from another.
+    """
+
+    name = None
+
+    def embed(self, texts):
+        """Return a (len(texts), dim) float32 matrix of unit vectors"""
+        raise NotImplementedError
+
+class HashingEmbedder(Embedder):
+    """Offline embedder hashing character n-grams into a fixed-size vector.
+
+    Deterministic and dependency free, so it works without any model
+    server. Similarity is lexical: words sharing stems or translations
+    ('cocina' / 'kitchen', 'kitchen table') end up close, but unrelated
+    spellings of related ideas do not.
+    """
+
+    def __init__(self, dim=256, ngram_sizes=(3, 4)):
+        self.dim = dim
+        self.ngram_sizes = ngram_sizes
+        self.name = f"hashing-{dim}-{'-'.join(map(str, ngram_sizes))}"
+        self._features = {}  # n-gram -> (column, sign), shared by every text
+
+    def feature(self, gram):
+        cached = self._features.get(gram)
+        if cached is None:
+            # crc32 rather than hash(), which is salted per process
+            h = zlib.crc32(gram.encode())
+            cached = self._features[gram] = (h % self.dim, 1.0 if h & 0x80000000 else -1.0)
+        return cached
+
+    def embed(self, texts):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in re.findall(r"\w+", normalize_key(text).lower()):
+                padded = f"<{token}>"
+                grams = [padded]
+                for n in self.ngram_sizes:
+                    grams.extend(padded[i:i + n] for i in range(len(padded) - n + 1))
+                for gram in grams:
+                    column, sign = self.feature(gram)
+                    vectors[row, column] += sign
+        return normalize_rows(vectors)
+
+class OpenAIEmbedder(Embedder):
+    """Embedder calling an OpenAI-compatible /v1/embeddings endpoint.
+
+    Works with a local ollama server (the opea-comps service) as well as
+    hosted APIs.
+    """
+
+    def __init__(self, url, model, timeout=30):
+        self.url = url.rstrip('/') + '/v1/embeddings'
+        self.model = model
+        self.timeout = timeout
+        self.name = f"openai-{model}"
+
+    def embed(self, texts):
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        vectors = []
+        for start in range(0, len(texts), EMBED_BATCH_SIZE):
+            vectors.extend(self.request(texts[start:start + EMBED_BATCH_SIZE]))
+        return normalize_rows(np.array(vectors, dtype=np.float32))
+
+    def request(self, texts):
+        body = json.dumps({"model": self.model, "input": texts}).encode()
+        request = urllib.request.Request(self.url, data=body,
+                                         headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                data = json.load(response)['data']
+            return [item['embedding'] for item in sorted(data, key=lambda item: item['index'])]
+        except (urllib.error.URLError, OSError, ValueError, KeyError, TypeError) as e:
+            raise EmbeddingError(f"Embedding request to {self.url} failed: {e}")
+
+def make_embedder(config):
+    """Build the embedder selected by config EMBEDDER ('hashing' or 'openai')"""
+    if config['EMBEDDER'] == 'hashing':
+        return HashingEmbedder()
+    if config['EMBEDDER'] == 'openai':
+        return OpenAIEmbedder(config['EMBEDDING_URL'], config['EMBEDDING_MODEL'])
+    raise ValueError(f"Unknown embedder: {config['EMBEDDER']}")
@@ -0,0 +1,150 @@
+from lib.normalize import normalize_key
+import numpy as np
+import re
+
+DEFAULT_FUZZY_LIMIT = 10
+MAX_FUZZY_LIMIT = 50
+MAX_EDIT_DISTANCE = 3
+# Words sharing the most trigrams with the query that are scored by edit distance
+FUZZY_CANDIDATES = 500
+
+# Spellings learners confuse because they sound alike, applied in order to
+# folded forms: 'avlar' and 'hablar' both become 'ablar'
+SOUNDS_ALIKE = [
+    (re.compile(r'ch'), '\x00'),  # keep 'ch' out of the silent-h rule
+    (re.compile(r'h'), ''),
+    (re.compile('\x00'), 'ch'),
+    (re.compile(r'v'), 'b'),
+    (re.compile(r'z'), 's'),
+    (re.compile(r'c(?=[ei])'), 's'),
+    (re.compile(r'qu(?=[ei])|c(?=[aou])|c$'), 'k'),
+    (re.compile(r'll'), 'y'),
+]
+
+# Recreates word_trigrams in one pass (see migrations/013); used after
+# bulk loads that skip the per-row trigger
+REBUILD_TRIGRAMS_SQL = """
+    DELETE FROM word_trigrams;
+    -- Materialized so the generated spanish_key is computed once per word
+    -- rather than once per trigram
+    WITH forms (word_id, padded) AS MATERIALIZED (
+        SELECT id, '  ' || spanish_key || ' ' FROM words
+        UNION ALL
+        SELECT id, '  ' || lower(trim(english)) || ' ' FROM words
+    )
+    INSERT OR IGNORE INTO word_trigrams (trigram, length, word_id)
+    SELECT substr(f.padded, p.n, 3), length(f.padded) - 3, f.word_id
+    FROM forms f JOIN trigram_positions p ON p.n <= length(f.padded) - 2
+    -- Inserting in key order appends to the index instead of splitting pages
+    ORDER BY 1, 2, 3;
+"""
+
+def trigrams(form):
+    """Padded trigrams of a folded form, matching the word_trigrams triggers"""
+    padded = f"  {form} "
+    return {padded[i:i + 3] for i in range(len(form) + 1)}
+
+def sounds_alike_form(form):
+    """Folded form with the SOUNDS_ALIKE spellings merged"""
+    for pattern, replacement in SOUNDS_ALIKE:
+        form = pattern.sub(replacement, form)
+    return form
+
+def default_max_distance(form):
+    """Allow one typo in short words, two in most words and three in long ones"""
+    if len(form) <= 3:
+        return 1
+    if len(form) <= 8:
+        return 2
+    return 3
+
+def edit_distances(query, candidates):
+    """Levenshtein distance from `query` to every candidate at once.
+
+    Candidates are padded into one code point matrix and the DP table is
+    filled a query character at a time for all of them together.
+
+    Returns:
+        numpy.ndarray: One distance per candidate
+    """
+    lengths = np.array([len(text) for text in candidates])
+    width = int(lengths.max(initial=0))
+    codes = np.zeros((len(candidates), width), dtype=np.uint32)
+    for row, text in enumerate(candidates):
+        codes[row, :len(text)] = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32)
+
+    previous = np.tile(np.arange(width + 1), (len(candidates), 1))
+    for i, char in enumerate(query, start=1):
+        current = np.empty_like(previous)
+        current[:, 0] = i
+        substitution = previous[:, :-1] + (codes != ord(char))
+        deletion = previous[:, 1:] + 1
+        best = np.minimum(substitution, deletion)
+        # Insertions depend on the cell to the left, so that step runs per column
+        for j in range(1, width + 1):
+            current[:, j] = np.minimum(best[:, j - 1], current[:, j - 1] + 1)
+        previous = current
+    return previous[np.arange(len(candidates)), lengths]
+
+def fuzzy_search(db, text, limit=DEFAULT_FUZZY_LIMIT, max_distance=None):
+    """Find words within a few typos of `text` in Spanish or English.
+
+    Candidates are the words of similar length sharing the most trigrams
+    with the query, read from word_trigrams; they are then ranked by
+    edit distance to the closer of their folded Spanish and English forms.
+
+    Returns:
+        list: Words with their edit distance, closest first
+    """
+    form = normalize_key(text)
+    if max_distance is None:
+        max_distance = default_max_distance(form)
+    query_trigrams = sorted(trigrams(form))
+
+    # Each edit changes at most 3 trigrams, so a match keeps at least this many
+    min_shared = max(len(query_trigrams) - 3 * max_distance, 1)
+    candidates = db.execute(f"""
+        SELECT word_id, COUNT(*) AS shared
+        FROM word_trigrams
+        WHERE trigram IN ({', '.join('?' * len(query_trigrams))})
+          AND length BETWEEN ? AND ?
+        GROUP BY word_id
+        HAVING shared >= ?
+        ORDER BY shared DESC, abs(MIN(length) - ?), word_id
+        LIMIT ?
+    """, query_trigrams + [len(form) - max_distance, len(form) + max_distance,
+                           min_shared, len(form), FUZZY_CANDIDATES]).fetchall()
+    if not candidates:
+        return []
+
+    shared = dict(candidates)
+    words = db.execute(f"""
+        SELECT id, spanish, english, pronunciation, spanish_key
+        FROM words
+        WHERE id IN ({', '.join('?' * len(shared))})
+    """, list(shared)).fetchall()
+
+    distances = np.minimum(
+        edit_distances(form, [word['spanish_key'] for word in words]),
+        edit_distances(form, [word['english'].strip(' ').lower() for word in words])
+    )
+    # Among equally distant words, prefer the one that sounds like the query
+    sound_distances = edit_distances(
+        sounds_alike_form(form),
+        [sounds_alike_form(word['spanish_key']) for word in words]
+    )
+    matches = sorted(
+        (int(distance), int(sound_distance), -shared[word['id']], word['id'], word)
+        for distance, sound_distance, word in zip(distances, sound_distances, words)
+        if distance <= max_distance
+    )
+    return [
+        {
+            "id": word['id'],
+            "spanish": word['spanish'],
+            "english": word['english'],
+            "pronunciation": word['pronunciation'],
+            "distance": distance
+        }
+        for distance, _, _, _, word in matches[:limit]
+    ]
@@ -0,0 +1,250 @@
+import itertools
+import json
+import sqlite3
+
+DEFAULT_GROUP_BATCH_SIZE = 5000
+
+# Upper bound of the last chunk: the largest rowid SQLite can store
+MAX_WORD_ID = (1 << 63) - 1
+
+# Bulk group operations are set-based statements run in chunks of
+# `batch_size` memberships, committing after each chunk so the write lock
+# is released between them. groups.words_count is kept by the word_groups
+# triggers (migrations/017), so nothing here touches it.
+#
+# With learner shards, study sessions live in every learner's own file;
+# `other_histories` returns connections to the shards other than `db`'s so
+# deletes and merges see all of them.
+
+class GroupInUseError(ValueError):
+    """Raised when a group cannot be deleted because study sessions use it"""
+
+def require_group(db, group_id):
+    """Raise LookupError unless the group exists"""
+    if not db.execute("SELECT 1 FROM groups WHERE id = ?", (group_id,)).fetchone():
+        raise LookupError(f"Group not found: {group_id}")
+
+def id_chunks(ids, batch_size):
+    """Split ids into sorted, de-duplicated JSON arrays for json_each()"""
+    ids = sorted(set(ids))
+    for start in range(0, len(ids), batch_size):
+        yield json.dumps(ids[start:start + batch_size])
+
+def membership_ranges(db, group_id, batch_size):
+    """Yield (after, upto) word id ranges covering a group in chunks.
+
+    Each bound is looked up from the primary key when the previous range
+    has been processed, so ranges stay correct while the caller moves or
+    deletes the memberships it was given.
+    """
+    after = 0
+    while True:
+        row = db.execute("""
+            SELECT word_id FROM word_groups
+            WHERE group_id = ? AND word_id > ?
+            ORDER BY word_id
+            LIMIT 1 OFFSET ?
+        """, (group_id, after, batch_size - 1)).fetchone()
+        if row is None:
+            yield after, MAX_WORD_ID
+            return
+        yield after, row[0]
+        after = row[0]
+
+def group_words_count(db, group_id):
+    return db.execute("SELECT words_count FROM groups WHERE id = ?", (group_id,)).fetchone()[0]
+
+def add_words_to_group(db, group_id, word_ids, batch_size=DEFAULT_GROUP_BATCH_SIZE):
+    """Link many words to a group; unknown words and existing members are skipped.
+
+    Returns:
+        dict: requested, added and words_count
+    """
+    require_group(db, group_id)
+    requested = len(set(word_ids))
+    added = 0
+    for chunk in id_chunks(word_ids, batch_size):
+        cursor = db.execute("""
+            INSERT INTO word_groups (group_id, word_id)
+            SELECT ?, w.id
+            FROM json_each(?) j
+            JOIN words w ON w.id = j.value
+            WHERE true
+            ON CONFLICT (group_id, word_id) DO NOTHING
+        """, (group_id, chunk))
+        added += max(cursor.rowcount, 0)
+        db.commit()
+
+    return {
+        "requested": requested,
+        "added": added,
+        "words_count": group_words_count(db, group_id)
+    }
+
+def remove_words_from_group(db, group_id, word_ids, batch_size=DEFAULT_GROUP_BATCH_SIZE):
+    """Unlink many words from a group; words that are not members are skipped.
+
+    Returns:
+        dict: requested, removed and words_count
+    """
+    require_group(db, group_id)
+    requested = len(set(word_ids))
+    removed = 0
+    for chunk in id_chunks(word_ids, batch_size):
+        cursor = db.execute("""
+            DELETE FROM word_groups
+            WHERE group_id = ?
+              AND word_id IN (SELECT value FROM json_each(?))
+        """, (group_id, chunk))
+        removed += max(cursor.rowcount, 0)
+        db.commit()
+
+    return {
+        "requested": requested,
+        "removed": removed,
+        "words_count": group_words_count(db, group_id)
+    }
+
+def clone_group(db, group_id, name=None, batch_size=DEFAULT_GROUP_BATCH_SIZE):
+    """Create a new group holding the same words as an existing one.
+
+    Returns:
+        dict: id, name and words_count of the new group
+    """
+    require_group(db, group_id)
+    if name is None:
+        source_name = db.execute("SELECT name FROM groups WHERE id = ?", (group_id,)).fetchone()[0]
+        name = f"{source_name} (copy)"
+
+    clone_id = db.execute("INSERT INTO groups (name) VALUES (?)", (name,)).lastrowid
+    db.commit()
+
+    for after, upto in membership_ranges(db, group_id, batch_size):
+        db.execute("""
+            INSERT INTO word_groups (group_id, word_id)
+            SELECT ?, word_id
+            FROM word_groups
+            WHERE group_id = ? AND word_id > ? AND word_id <= ?
+            ON CONFLICT (group_id, word_id) DO NOTHING
+        """, (clone_id, group_id, after, upto))
+        db.commit()
+
+    return {
+        "id": clone_id,
+        "name": name,
+        "words_count": group_words_count(db, clone_id)
+    }
+
+def merge_groups(db, group_id, source_ids, batch_size=DEFAULT_GROUP_BATCH_SIZE,
+                 other_histories=None):
+    """Move the words and study sessions of other groups into a group and
+    delete those groups.
+
+    Each source is moved chunk by chunk (copy then delete), so an
+    interrupted merge can simply be run again.
+
+    Returns:
+        dict: merged (group count), added and words_count
+    """
+    sources = sorted(set(source_ids) - {group_id})
+    require_group(db, group_id)
+    for source_id in sources:
+        require_group(db, source_id)
+
+    added = 0
+    for source_id in sources:
+        for after, upto in membership_ranges(db, source_id, batch_size):
+            cursor = db.execute("""
+                INSERT INTO word_groups (group_id, word_id)
+                SELECT ?, word_id
+                FROM word_groups
+                WHERE group_id = ? AND word_id > ? AND word_id <= ?
+                ON CONFLICT (group_id, word_id) DO NOTHING
+            """, (group_id, source_id, after, upto))
+            added += max(cursor.rowcount, 0)
+            db.execute("""
+                DELETE FROM word_groups
+                WHERE group_id = ? AND word_id > ? AND word_id <= ?
+            """, (source_id, after, upto))
+            db.commit()
+
+        for history in other_histories() if other_histories else ():
+            history.execute("UPDATE study_sessions SET group_id = ? WHERE group_id = ?",
+                            (group_id, source_id))
+            history.commit()
+        db.execute("UPDATE study_sessions SET group_id = ? WHERE group_id = ?",
+                   (group_id, source_id))
+        db.execute("DELETE FROM groups WHERE id = ?", (source_id,))
+        db.commit()
+
+    return {
+        "merged": len(sources),
+        "added": added,
+        "words_count": group_words_count(db, group_id)
+    }
+
+def group_in_use(db, group_id, other_histories=None):
+    """Whether any study session, in any learner's history, uses a group"""
+    others = other_histories() if other_histories else ()
+    return any(
+        history.execute("SELECT 1 FROM study_sessions WHERE group_id = ? LIMIT 1",
+                        (group_id,)).fetchone()
+        for history in itertools.chain([db], others)
+    )
+
+def delete_group(db, group_id, batch_size=DEFAULT_GROUP_BATCH_SIZE, other_histories=None):
+    """Delete a group, unlinking its words chunk by chunk first.
+
+    Groups with study sessions are kept; merge them into another group
+    instead. The unlinked word ids are noted in a TEMP table, so if a
+    session is created for the group while its words are being unlinked
+    they are linked again before GroupInUseError is raised.
+
+    Returns:
+        int: Number of words that were unlinked
+    """
+    require_group(db, group_id)
+    if group_in_use(db, group_id, other_histories):
+        raise GroupInUseError("Group has study sessions")
+
+    db.execute("CREATE TEMP TABLE IF NOT EXISTS unlinked_words (word_id INTEGER PRIMARY KEY)")
+    db.execute("DELETE FROM temp.unlinked_words")
+    try:
+        removed = 0
+        for after, upto in membership_ranges(db, group_id, batch_size):
+            db.execute("""
+                INSERT INTO temp.unlinked_words (word_id)
+                SELECT word_id FROM word_groups
+                WHERE group_id = ? AND word_id > ? AND word_id <= ?
+            """, (group_id, after, upto))
+            cursor = db.execute("""
+                DELETE FROM word_groups
+                WHERE group_id = ? AND word_id > ? AND word_id <= ?
+            """, (group_id, after, upto))
+            removed += max(cursor.rowcount, 0)
+            db.commit()
+
+        try:
+            if group_in_use(db, group_id, other_histories):
+                raise GroupInUseError("Group has study sessions")
+            # The history's restrict trigger catches a session created since
+            db.execute("DELETE FROM groups WHERE id = ?", (group_id,))
+            db.commit()
+        except (GroupInUseError, sqlite3.IntegrityError):
+            db.rollback()
+            db.execute("""
+                INSERT INTO word_groups (group_id, word_id)
+                SELECT ?, u.word_id
+                FROM temp.unlinked_words u
+                JOIN words w ON w.id = u.word_id
+                WHERE true
+                ON CONFLICT (group_id, word_id) DO NOTHING
+            """, (group_id,))
+            db.commit()
+            raise GroupInUseError("Group has study sessions")
+        return removed
+    finally:
+        if db.in_transaction:
+            db.rollback()
+        db.execute("DELETE FROM temp.unlinked_words")
+        db.commit()
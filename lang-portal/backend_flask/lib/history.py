@@ -0,0 +1,134 @@
+from lib.search import InvalidCursorError
+from lib.timestamps import SECONDS_PER_DAY, day_of
+from datetime import datetime
+import base64
+import json
+
+class InvalidFilterError(ValueError):
+    pass
+
+def parse_history_filters(args):
+    """Read the session history filters from query parameters.
+
+    group_id and activity_id are ids; date, from and to are YYYY-MM-DD
+    days (or 'today'), from and to both inclusive.
+
+    Raises:
+        InvalidFilterError: With the API error message as its argument
+    """
+    filters = {}
+    for name, label in (('group_id', 'group'), ('activity_id', 'activity')):
+        value = args.get(name)
+        if value is not None:
+            try:
+                filters[name] = int(value)
+            except ValueError:
+                raise InvalidFilterError(f"Invalid {label} ID")
+    for name in ('date', 'from', 'to'):
+        value = args.get(name)
+        if value is None:
+            continue
+        if value != 'today':
+            try:
+                datetime.strptime(value, '%Y-%m-%d')
+            except ValueError:
+                raise InvalidFilterError("Invalid date")
+        # Today in the same UTC clock as the created_ts timestamps
+        filters[name] = day_of('now' if value == 'today' else value)
+    return filters
+
+def encode_cursor(created_ts, session_id):
+    return base64.urlsafe_b64encode(json.dumps([created_ts, session_id]).encode()).decode()
+
+def decode_cursor(cursor):
+    try:
+        created_ts, session_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(created_ts, int) or isinstance(created_ts, bool):
+            raise TypeError
+        return created_ts, int(session_id)
+    except (ValueError, TypeError):
+        raise InvalidCursorError("Invalid cursor")
+
+def history_conditions(filters):
+    """WHERE terms and parameters for `filters`.
+
+    Every term is an equality or a range on created_ts, so each filter
+    combination is a search of idx_study_sessions_group_created_ts,
+    idx_study_sessions_activity_created_ts or idx_study_sessions_created_ts
+    that already returns rows newest first. Dates are day numbers; their
+    bounds are integer comparisons on created_ts.
+    """
+    conditions = []
+    params = []
+    if 'group_id' in filters:
+        conditions.append("s.group_id = ?")
+        params.append(filters['group_id'])
+    if 'activity_id' in filters:
+        conditions.append("s.study_activity_id = ?")
+        params.append(filters['activity_id'])
+    if 'date' in filters:
+        conditions.append("s.created_ts >= ? AND s.created_ts < ?")
+        params.extend([filters['date'] * SECONDS_PER_DAY, (filters['date'] + 1) * SECONDS_PER_DAY])
+    if 'from' in filters:
+        conditions.append("s.created_ts >= ?")
+        params.append(filters['from'] * SECONDS_PER_DAY)
+    if 'to' in filters:
+        conditions.append("s.created_ts < ?")
+        params.append((filters['to'] + 1) * SECONDS_PER_DAY)
+    return conditions, params
+
+def count_query(filters):
+    """SQL and parameters counting the sessions matching `filters`"""
+    conditions, params = history_conditions(filters)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return f"SELECT COUNT(*) FROM study_sessions s {where}", params
+
+def history_query(filters, cursor=None):
+    """SQL and parameters for a page of sessions, newest first.
+
+    The statement ends in LIMIT ? OFFSET ?, left for the caller to bind.
+    With a cursor (the last session of the previous page) it seeks
+    straight past that row instead of skipping rows with OFFSET.
+    """
+    conditions, params = history_conditions(filters)
+    if cursor is not None:
+        conditions.append("(s.created_ts, s.id) < (?, ?)")
+        params.extend(decode_cursor(cursor))
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return f"""
+        SELECT s.id, s.group_id, s.study_activity_id,
+               s.created_at, s.completed_at, s.created_ts,
+               g.name as group_name,
+               a.name as activity_name
+        FROM study_sessions s
+        JOIN groups g ON s.group_id = g.id
+        JOIN study_activities a ON s.study_activity_id = a.id
+        {where}
+        ORDER BY s.created_ts DESC, s.id DESC
+        LIMIT ? OFFSET ?
+    """, params
+
+def count_study_sessions(db, filters):
+    sql, params = count_query(filters)
+    return db.execute(sql, params).fetchone()[0]
+
+def list_study_sessions(db, filters, limit, cursor=None, offset=0):
+    """One page of session history, continuing from `cursor` or `offset`.
+
+    Returns:
+        tuple: (sessions, next_cursor); next_cursor is None on the last page
+    """
+    sql, params = history_query(filters, cursor)
+    rows = db.execute(sql, params + [limit + 1, 0 if cursor else offset]).fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]['created_ts'], rows[-1]['id'])
+
+    sessions = []
+    for row in rows:
+        session = dict(row)
+        del session['created_ts']
+        sessions.append(session)
+    return sessions, next_cursor
@@ -0,0 +1,407 @@
+from itertools import islice
+import csv
+import html
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import zipfile
+from lib.normalize import normalize_text, spanish_key_sql
+
+DEFAULT_BATCH_SIZE = 5000
+
+class InvalidWordError(ValueError):
+    """Raised when an import payload contains an invalid word"""
+
+def word_fields(item, position, require_pronunciation=True):
+    """Validate one vocabulary item and return it as an insert tuple.
+
+    Accepts the format produced by vocab_importer:
+    {"spanish": ..., "english": ..., "pronunciation": ...}
+    Card exports often have no pronunciation; with require_pronunciation
+    off it defaults to an empty string. Text is stored in NFC.
+    """
+    if not isinstance(item, dict):
+        raise InvalidWordError(f"Item {position} must be an object")
+    fields = []
+    for key in ('spanish', 'pronunciation', 'english'):
+        value = item.get(key)
+        if key == 'pronunciation' and not require_pronunciation and not value:
+            value = ''
+        elif not isinstance(value, str) or not value.strip():
+            raise InvalidWordError(f"Item {position} is missing required field: {key}")
+        fields.append(normalize_text(value.strip()))
+    return tuple(fields)
+
+def iter_json_array(stream, chunk_size=1 << 16):
+    """Yield the items of a top-level JSON array without loading it whole.
+
+    Reads `stream` in chunks and decodes one item at a time, so memory use
+    depends on the largest item rather than on the file size.
+    """
+    decoder = json.JSONDecoder()
+    buffer, pos, eof = '', 0, False
+    state = 'start'
+
+    while True:
+        while pos < len(buffer) and buffer[pos].isspace():
+            pos += 1
+
+        if pos == len(buffer):
+            if eof:
+                raise ValueError("Unexpected end of JSON array")
+            chunk = stream.read(chunk_size)
+            buffer, pos, eof = buffer[pos:] + chunk, 0, not chunk
+            continue
+
+        char = buffer[pos]
+        if state == 'start':
+            if char != '[':
+                raise ValueError("Expected a JSON array")
+            pos += 1
+            state = 'first'
+        elif state == 'separator':
+            if char == ']':
+                return
+            if char != ',':
+                raise ValueError(f"Expected ',' or ']' in JSON array, got {char!r}")
+            pos += 1
+            state = 'item'
+        elif char == ']' and state == 'first':
+            return
+        else:
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+                # A value is only known to be whole once the next separator
+                # is buffered (a number like 1.5 can be split as "1" | ".5")
+                following = buffer[end:].lstrip()[:1]
+                complete = eof or following in (',', ']')
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                complete = False
+            if not complete:
+                chunk = stream.read(chunk_size)
+                buffer, pos, eof = buffer[pos:] + chunk, 0, not chunk
+                continue
+            yield item
+            pos = end
+            state = 'separator'
+
+def read_word_file(path, columns=None):
+    """Yield word tuples from a JSON array, NDJSON, CSV or TSV vocabulary file.
+
+    The format is picked from the extension (.json, .ndjson/.jsonl, .csv,
+    .tsv/.txt). Delimited files need a header row naming the spanish,
+    english and (optionally) pronunciation columns, unless `columns` names
+    them positionally, e.g. ['spanish', 'english'] for a headerless card
+    export. Lines starting with '#' (Anki export headers) are skipped.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        if extension == '.json':
+            items = iter_json_array(f)
+            require_pronunciation = True
+        elif extension in ('.ndjson', '.jsonl'):
+            items = (json.loads(line) for line in f if line.strip())
+            require_pronunciation = True
+        elif extension in ('.csv', '.tsv', '.txt'):
+            lines = (line for line in f if not line.startswith('#'))
+            items = csv.DictReader(
+                lines,
+                fieldnames=columns,
+                delimiter=',' if extension == '.csv' else '\t'
+            )
+            require_pronunciation = False
+        else:
+            raise ValueError(f"Unsupported vocabulary file format: {path}")
+
+        for position, item in enumerate(items, start=1):
+            yield word_fields(item, position, require_pronunciation)
+
+def resolve_group(cursor, group_id=None, group_name=None):
+    """Return the id of the target group, creating it by name if needed.
+
+    Returns None when neither group_id nor group_name is given and raises
+    LookupError when group_id does not exist.
+    """
+    if group_id is not None:
+        cursor.execute("SELECT id FROM groups WHERE id = ?", (group_id,))
+        row = cursor.fetchone()
+        if not row:
+            raise LookupError("Group not found")
+        return row[0]
+
+    if group_name:
+        cursor.execute("SELECT id FROM groups WHERE name = ? ORDER BY id LIMIT 1", (group_name,))
+        row = cursor.fetchone()
+        if row:
+            return row[0]
+        cursor.execute("INSERT INTO groups (name) VALUES (?)", (group_name,))
+        return cursor.lastrowid
+
+    return None
+
+def create_staging_table(cursor):
+    """Create (or empty) the temp table words are staged in before merging"""
+    cursor.execute("DROP TABLE IF EXISTS temp.staged_words")
+    cursor.execute("""
+        CREATE TEMP TABLE staged_words (
+            spanish TEXT NOT NULL,
+            pronunciation TEXT NOT NULL,
+            english TEXT NOT NULL
+        )
+    """)
+
+def stage_words(cursor, batch):
+    """Append a batch of (spanish, pronunciation, english) tuples to staged_words"""
+    cursor.executemany("""
+        INSERT INTO staged_words (spanish, pronunciation, english)
+        VALUES (?, ?, ?)
+    """, batch)
+
+def merge_staged_words(cursor, group_id=None):
+    """Upsert staged words into words and link them to a group.
+
+    Words are matched on the folded spanish key plus english, so 'Hablar'
+    and 'hablar' with the same translation are one word. Existing words are
+    kept as they are but still linked to the group.
+
+    Returns:
+        tuple: (inserted, linked) row counts
+    """
+    cursor.execute("""
+        INSERT INTO words (spanish, pronunciation, english)
+        SELECT spanish, pronunciation, english
+        FROM staged_words
+        WHERE true
+        ORDER BY rowid
+        ON CONFLICT (spanish_key, english) DO NOTHING
+    """)
+    inserted = max(cursor.rowcount, 0)
+
+    linked = 0
+    if group_id is not None:
+        cursor.execute(f"""
+            INSERT INTO word_groups (group_id, word_id)
+            SELECT ?, w.id
+            FROM staged_words s
+            JOIN words w
+              ON w.spanish_key = {spanish_key_sql('s.spanish')}
+             AND w.english = s.english
+            WHERE true
+            ON CONFLICT (group_id, word_id) DO NOTHING
+        """, (group_id,))
+        linked = max(cursor.rowcount, 0)
+
+    return inserted, linked
+
+def import_words(db, words, group_id=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Import vocabulary with set-based statements inside the caller's transaction.
+
+    Words are staged into a temp table in executemany batches, then merged
+    into words/word_groups with one INSERT ... SELECT each, so the cost per
+    word is a couple of index probes rather than several round trips.
+    Words already present are counted as duplicates but are still linked
+    to the target group. The caller commits.
+
+    Args:
+        db: sqlite3 connection
+        words: Iterable of (spanish, pronunciation, english) tuples
+        group_id: Optional group to link every imported word to
+        batch_size: Rows per executemany call while staging
+
+    Returns:
+        dict: received, inserted, duplicates and linked counts
+    """
+    cursor = db.cursor()
+    create_staging_table(cursor)
+
+    received = 0
+    words = iter(words)
+    while True:
+        batch = list(islice(words, batch_size))
+        if not batch:
+            break
+        stage_words(cursor, batch)
+        received += len(batch)
+
+    inserted, linked = merge_staged_words(cursor, group_id)
+    cursor.execute("DROP TABLE temp.staged_words")
+
+    return {
+        "received": received,
+        "inserted": inserted,
+        "duplicates": received - inserted,
+        "linked": linked
+    }
+
+# Anki packages (.apkg) are zip files holding the deck's SQLite collection.
+# Notes keep all their fields in one column, separated by \x1f.
+ANKI_COLLECTIONS = ('collection.anki21', 'collection.anki2')
+ANKI_FIELD_SEPARATOR = '\x1f'
+ANKI_FIELD_ALIASES = {
+    'spanish': ('spanish', 'español', 'espanol', 'front', 'word', 'expression'),
+    'english': ('english', 'back', 'meaning', 'translation'),
+    'pronunciation': ('pronunciation', 'reading', 'ipa'),
+}
+HTML_TAG = re.compile(r'<[^>]+>')
+
+class AnkiPackageError(ValueError):
+    """Raised when an .apkg file cannot be read"""
+
+def anki_field(fields, index):
+    """SQL function: field `index` of a note's fields, stripped of HTML, in NFC"""
+    if index is None:
+        return ''
+    parts = fields.split(ANKI_FIELD_SEPARATOR)
+    if index >= len(parts):
+        return ''
+    return normalize_text(' '.join(html.unescape(HTML_TAG.sub(' ', parts[index])).split()))
+
+def map_anki_fields(field_names, overrides=None):
+    """Pick the note field index holding each word column.
+
+    `overrides` maps word columns to note field names, e.g.
+    {"spanish": "Front", "english": "Back"}; otherwise fields are matched
+    by common names and fall back to the first two fields.
+    """
+    lowered = [name.lower() for name in field_names]
+    mapping = {}
+    for column, aliases in ANKI_FIELD_ALIASES.items():
+        wanted = (overrides or {}).get(column)
+        candidates = (wanted.lower(),) if wanted else aliases
+        mapping[column] = next((lowered.index(c) for c in candidates if c in lowered), None)
+
+    if mapping['spanish'] is None and not (overrides or {}).get('spanish'):
+        mapping['spanish'] = 0
+    if mapping['english'] is None and not (overrides or {}).get('english') and len(field_names) > 1:
+        mapping['english'] = 1
+    if mapping['spanish'] is None or mapping['english'] is None:
+        raise AnkiPackageError(f"Cannot map note fields {field_names} to spanish/english")
+    return mapping
+
+def extract_anki_collection(package_path, directory):
+    """Unpack the SQLite collection from an .apkg into `directory`"""
+    try:
+        with zipfile.ZipFile(package_path) as package:
+            names = set(package.namelist())
+            for name in ANKI_COLLECTIONS:
+                if name in names:
+                    return package.extract(name, directory)
+    except zipfile.BadZipFile:
+        raise AnkiPackageError("File is not an Anki package")
+    if 'collection.anki21b' in names:
+        raise AnkiPackageError(
+            "Compressed Anki 2.1.50+ packages are not supported; "
+            "export with 'Support older Anki versions' enabled"
+        )
+    raise AnkiPackageError("Anki package has no collection")
+
+def anki_note_types(cursor):
+    """Return {note type id: [field names in order]} for the attached deck"""
+    models = cursor.execute("SELECT models FROM deck.col").fetchone()[0]
+    if models and models != '{}':
+        return {
+            int(mid): [f['name'] for f in sorted(model['flds'], key=lambda f: f['ord'])]
+            for mid, model in json.loads(models).items()
+        }
+
+    # Newer schemas keep note types in their own tables
+    note_types = {}
+    cursor.execute("SELECT ntid, name FROM deck.fields ORDER BY ntid, ord")
+    for ntid, name in cursor.fetchall():
+        note_types.setdefault(ntid, []).append(name)
+    return note_types
+
+def import_anki_package(db, package_path, group_id=None, group_name=None, fields=None):
+    """Import every note of an Anki package with set-based statements.
+
+    The collection is ATTACHed and its notes are moved into the staging
+    table with one INSERT ... SELECT per note type, then merged like any
+    other import. ATTACH cannot run inside a transaction, so this commits
+    any pending work first and commits the import itself. The target group
+    (see resolve_group) is only created once the collection has been read,
+    so a broken package leaves no empty group behind.
+
+    Returns:
+        dict: group_id plus received, inserted, duplicates, linked and
+        skipped counts
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        collection = extract_anki_collection(package_path, directory)
+        db.commit()
+        try:
+            db.execute("ATTACH DATABASE ? AS deck", (collection,))
+        except sqlite3.DatabaseError:
+            raise AnkiPackageError("Anki collection could not be read")
+        try:
+            db.create_function('anki_field', 2, anki_field, deterministic=True)
+            cursor = db.cursor()
+            try:
+                note_types = anki_note_types(cursor)
+            except (sqlite3.DatabaseError, json.JSONDecodeError, KeyError):
+                raise AnkiPackageError("Anki collection could not be read")
+
+            mappings = {note_type: map_anki_fields(field_names, fields)
+                        for note_type, field_names in note_types.items()}
+            group_id = resolve_group(cursor, group_id, group_name)
+
+            create_staging_table(cursor)
+            received = 0
+            for note_type, mapping in mappings.items():
+                cursor.execute("""
+                    INSERT INTO staged_words (spanish, pronunciation, english)
+                    SELECT spanish, pronunciation, english
+                    FROM (
+                        SELECT anki_field(flds, ?) AS spanish,
+                               anki_field(flds, ?) AS pronunciation,
+                               anki_field(flds, ?) AS english
+                        FROM deck.notes
+                        WHERE mid = ?
+                        ORDER BY id
+                    )
+                    WHERE spanish <> '' AND english <> ''
+                """, (mapping['spanish'], mapping['pronunciation'], mapping['english'], note_type))
+                received += max(cursor.rowcount, 0)
+
+            total_notes = cursor.execute("SELECT COUNT(*) FROM deck.notes").fetchone()[0]
+            inserted, linked = merge_staged_words(cursor, group_id)
+            cursor.execute("DROP TABLE temp.staged_words")
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.execute("DETACH DATABASE deck")
+
+    return {
+        "group_id": group_id,
+        "received": received,
+        "inserted": inserted,
+        "duplicates": received - inserted,
+        "linked": linked,
+        "skipped": total_notes - received
+    }
+
+def import_vocabulary_file(db, path, group_id=None, group_name=None, columns=None,
+                           fields=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Import an .apkg deck or a JSON/NDJSON/CSV/TSV word file into the
+    group resolve_group picks, and commit. Nothing is kept, not even a
+    newly created group, when the file cannot be imported.
+
+    Returns:
+        dict: group_id plus the import's counts
+    """
+    if os.path.splitext(path)[1].lower() == '.apkg':
+        return import_anki_package(db, path, group_id, group_name, fields)
+
+    try:
+        group_id = resolve_group(db.cursor(), group_id, group_name)
+        result = import_words(db, read_word_file(path, columns), group_id, batch_size)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return {"group_id": group_id, **result}
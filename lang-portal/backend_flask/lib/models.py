@@ -1,68 +1,75 @@
-from .db import db
+from dataclasses import dataclass
 
-class Word(db.Model):
-    __tablename__ = 'words'
-    
-    id = db.Column(db.Integer, primary_key=True)
-    spanish = db.Column(db.String, nullable=False)
-    pronunciation = db.Column(db.String, nullable=False)
-    english = db.Column(db.String, nullable=False)
+# Row types returned by lib/repository. Slotted dataclasses carry no
+# per-row __dict__, are built straight from the cursor's tuples (fields in
+# the same order as the query's columns) and jsonify serializes them as
+# objects.
 
-    # Relationships
-    groups = db.relationship('Group', secondary='word_groups', back_populates='words')
-    reviews = db.relationship('WordReviewItem', back_populates='word')
+@dataclass(slots=True)
+class StudyActivity:
+    id: int
+    name: str
+    url: str
+    preview_url: str
 
-class Group(db.Model):
-    __tablename__ = 'groups'
-    
-    id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String, nullable=False)
-    words_count = db.Column(db.Integer, default=0)
+@dataclass(slots=True)
+class Group:
+    id: int
+    name: str
+    words_count: int
 
-    # Relationships
-    words = db.relationship('Word', secondary='word_groups', back_populates='groups')
-    study_sessions = db.relationship('StudySession', back_populates='group')
+@dataclass(slots=True)
+class Word:
+    id: int
+    spanish: str
+    english: str
+    pronunciation: str
 
-class WordGroup(db.Model):
-    __tablename__ = 'word_groups'
-    
-    id = db.Column(db.Integer, primary_key=True)
-    word_id = db.Column(db.Integer, db.ForeignKey('words.id'), nullable=False)
-    group_id = db.Column(db.Integer, db.ForeignKey('groups.id'), nullable=False)
+@dataclass(slots=True)
+class GroupWord:
+    id: int
+    spanish: str
+    english: str
+    pronunciation: str
 
-class StudyActivity(db.Model):
-    __tablename__ = 'study_activities'
-    
-    id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String, nullable=False)
-    url = db.Column(db.String, nullable=False)
-    preview_url = db.Column(db.String)
+@dataclass(slots=True)
+class SessionWord:
+    id: int
+    spanish: str
+    english: str
+    pronunciation: str
+    reviewed: int
+    correct: int
 
-    # Relationships
-    sessions = db.relationship('StudySession', back_populates='activity')
+@dataclass(slots=True)
+class SessionStats:
+    total_words: int
+    correct_count: int
+    accuracy: float
 
-class StudySession(db.Model):
-    __tablename__ = 'study_sessions'
-    
-    id = db.Column(db.Integer, primary_key=True)
-    group_id = db.Column(db.Integer, db.ForeignKey('groups.id'), nullable=False)
-    study_activity_id = db.Column(db.Integer, db.ForeignKey('study_activities.id'), nullable=False)
-    created_at = db.Column(db.DateTime, nullable=False)
+@dataclass(slots=True)
+class StudySession:
+    id: int
+    group_id: int
+    study_activity_id: int
+    created_at: str
+    completed_at: str
 
-    # Relationships
-    group = db.relationship('Group', back_populates='study_sessions')
-    activity = db.relationship('StudyActivity', back_populates='sessions')
-    reviews = db.relationship('WordReviewItem', back_populates='session')
+@dataclass(slots=True)
+class CompletedSession:
+    id: int
+    group_id: int
+    study_activity_id: int
+    created_at: str
+    completed_at: str
+    client_id: str
+    review_items_count: int
 
-class WordReviewItem(db.Model):
-    __tablename__ = 'word_review_items'
-    
-    id = db.Column(db.Integer, primary_key=True)
-    word_id = db.Column(db.Integer, db.ForeignKey('words.id'), nullable=False)
-    study_session_id = db.Column(db.Integer, db.ForeignKey('study_sessions.id'), nullable=False)
-    correct = db.Column(db.Boolean, nullable=False)
-    created_at = db.Column(db.DateTime, nullable=False)
-
-    # Relationships
-    word = db.relationship('Word', back_populates='reviews')
-    session = db.relationship('StudySession', back_populates='reviews') 
\ No newline at end of file
+@dataclass(slots=True)
+class LastStudySession:
+    id: int
+    activity_id: int
+    activity_name: str
+    group_id: int
+    group_name: str
+    created_at: str
@@ -0,0 +1,32 @@
+import unicodedata
+
+# Accent folding shared with the words.spanish_key generated column
+# (migrations/011_add_words_spanish_key.sql). SQLite's lower() only folds
+# ASCII, so accented capitals are mapped straight to their lowercase base.
+# The SQL side can only replace precomposed characters, so every path that
+# writes word text stores it in NFC (normalize_text) and the folding sees
+# one form of each accented letter.
+FOLDED_CHARACTERS = {
+    'á': 'a', 'é': 'e', 'í': 'i', 'ó': 'o', 'ú': 'u', 'ü': 'u', 'ñ': 'n',
+    'Á': 'a', 'É': 'e', 'Í': 'i', 'Ó': 'o', 'Ú': 'u', 'Ü': 'u', 'Ñ': 'n',
+}
+
+_FOLD_TABLE = str.maketrans({
+    **FOLDED_CHARACTERS,
+    **{chr(c): chr(c + 32) for c in range(ord('A'), ord('Z') + 1)},
+})
+
+def spanish_key_sql(column):
+    """SQL expression computing the folded key of `column`"""
+    expr = f"trim({column})"
+    for char, base in FOLDED_CHARACTERS.items():
+        expr = f"replace({expr}, '{char}', '{base}')"
+    return f"lower({expr})"
+
+def normalize_text(text):
+    """Compose combining accents ('a' + U+0301 -> 'á'), as word text is stored"""
+    return unicodedata.normalize('NFC', text)
+
+def normalize_key(text):
+    """Fold text the same way as words.spanish_key ('Habló ' -> 'hablo')"""
+    return normalize_text(text).strip(' ').translate(_FOLD_TABLE)
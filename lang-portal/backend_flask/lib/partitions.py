@@ -0,0 +1,334 @@
+from datetime import datetime, timezone
+from lib.storage import history_schema, review_counts_table
+from lib.timestamps import SECONDS_PER_DAY, epoch_now
+import calendar
+import json
+
+# Review history is split by month. New reviews go to word_review_items
+# (the hot table, holding the most recent months); `partition_reviews`
+# moves older months into one table per month, word_review_items_YYYY_MM,
+# and moves old partitions again into a separate archive database that is
+# ATTACHed as review_archive when a query needs it. review_partitions
+# (migrations/019) lists every partition with its created_ts range, so a
+# query only reads the tables overlapping the time it asks about.
+# Partitions have no foreign keys (the archive is another file), so words
+# and sessions with partitioned reviews are deleted through delete_reviews.
+# Location 'main' means the file holding the hot table: words.db, or the
+# history file in the split storage layout (lib/storage.py).
+HOT_TABLE = 'word_review_items'
+ARCHIVE_SCHEMA = 'review_archive'
+HISTORY_VIEW = 'word_review_history'
+
+REVIEW_COLUMNS = 'id, word_id, study_session_id, correct, created_at, created_ts, created_day, client_id'
+
+DEFAULT_HOT_MONTHS = 2
+DEFAULT_ARCHIVE_AFTER_MONTHS = 12
+DEFAULT_PARTITION_BATCH_SIZE = 5000
+
+PARTITION_DDL = """
+    CREATE TABLE IF NOT EXISTS {schema}.{name} (
+        id INTEGER PRIMARY KEY,
+        word_id INTEGER NOT NULL,
+        study_session_id INTEGER NOT NULL,
+        correct BOOLEAN NOT NULL,
+        created_at DATETIME NOT NULL,
+        created_ts INTEGER NOT NULL,
+        created_day INTEGER NOT NULL,
+        client_id TEXT
+    );
+    CREATE INDEX IF NOT EXISTS {schema}.{name}_session
+        ON {name} (study_session_id);
+    CREATE UNIQUE INDEX IF NOT EXISTS {schema}.{name}_client_id
+        ON {name} (client_id);
+"""
+
+def month_index(epoch):
+    """Months since year 0 of an epoch timestamp (UTC)"""
+    moment = datetime.fromtimestamp(epoch, timezone.utc)
+    return moment.year * 12 + moment.month - 1
+
+def month_start(index):
+    """Epoch timestamp at the start of a month index"""
+    year, month = divmod(index, 12)
+    return calendar.timegm((year, month + 1, 1, 0, 0, 0))
+
+def partition_name(index):
+    year, month = divmod(index, 12)
+    return f"{HOT_TABLE}_{year:04d}_{month + 1:02d}"
+
+def attach_archive(db, archive_path):
+    """ATTACH the archive database unless this connection already has it.
+
+    ATTACH cannot run inside a transaction, so call this before writing.
+    """
+    attached = {row[1] for row in db.execute("PRAGMA database_list")}
+    if ARCHIVE_SCHEMA not in attached:
+        db.execute(f"ATTACH DATABASE ? AS {ARCHIVE_SCHEMA}", (archive_path,))
+
+def list_partitions(db, since_ts=None):
+    """(name, location) of the partitions holding reviews from `since_ts` on, oldest first"""
+    return db.execute("""
+        SELECT name, location FROM review_partitions
+        WHERE end_ts > ?
+        ORDER BY start_ts
+    """, (since_ts or 0,)).fetchall()
+
+def review_tables(db, archive_path, since_ts=None):
+    """Qualified names of the tables holding reviews created from `since_ts` on.
+
+    The hot table is always included; the archive is attached only when
+    one of the partitions lives there.
+    """
+    home = history_schema(db)
+    tables = [f"{home}.{HOT_TABLE}"]
+    for name, location in list_partitions(db, since_ts):
+        if location == 'archive':
+            attach_archive(db, archive_path)
+            tables.append(f"{ARCHIVE_SCHEMA}.{name}")
+        else:
+            tables.append(f"{home}.{name}")
+    return tables
+
+def review_source(db, archive_path, since_ts=None):
+    """FROM clause term for reviews created from `since_ts` on.
+
+    Recent ranges resolve to the hot table itself, so hot-path queries
+    never touch a partition; older ranges become a UNION ALL of just the
+    partitions they overlap.
+    """
+    tables = review_tables(db, archive_path, since_ts)
+    if len(tables) == 1:
+        return HOT_TABLE
+    return "(" + " UNION ALL ".join(
+        f"SELECT {REVIEW_COLUMNS} FROM {table}" for table in tables
+    ) + ")"
+
+def create_history_view(db, archive_path):
+    """(Re)create the temp view word_review_history over every partition.
+
+    A TEMP view can span the attached archive, which a view stored in the
+    main database cannot; it lasts as long as the connection.
+    """
+    tables = review_tables(db, archive_path)
+    db.execute(f"DROP VIEW IF EXISTS temp.{HISTORY_VIEW}")
+    db.execute(f"CREATE TEMP VIEW {HISTORY_VIEW} AS " + " UNION ALL ".join(
+        f"SELECT {REVIEW_COLUMNS} FROM {table}" for table in tables
+    ))
+    return HISTORY_VIEW
+
+def partitioned_client_ids(db, archive_path, client_ids, since_ts):
+    """Client ids already stored in partitions that cover `since_ts` onwards.
+
+    The hot table's unique index catches retried uploads of recent
+    reviews; this catches retries of reviews that were moved since.
+    """
+    client_ids = list(client_ids)
+    found = set()
+    for table in review_tables(db, archive_path, since_ts)[1:]:
+        for start in range(0, len(client_ids), 500):
+            chunk = client_ids[start:start + 500]
+            found.update(row[0] for row in db.execute(f"""
+                SELECT client_id FROM {table}
+                WHERE client_id IN ({', '.join('?' * len(chunk))})
+            """, chunk))
+    return found
+
+def move_hot_month(db, index, batch_size):
+    """Move one month of the hot table into its partition, a chunk per transaction.
+
+    While review_partition_moves has a row, the word_review_items delete
+    triggers leave words' review counts and the change feed alone: the
+    reviews still exist, they only change table.
+
+    Returns:
+        int: Reviews moved
+    """
+    name = partition_name(index)
+    home = history_schema(db)
+    start_ts, end_ts = month_start(index), month_start(index + 1)
+    db.executescript(PARTITION_DDL.format(schema=home, name=name))
+    db.execute("""
+        INSERT INTO review_partitions (name, location, start_ts, end_ts)
+        VALUES (?, 'main', ?, ?)
+        ON CONFLICT (name) DO NOTHING
+    """, (name, start_ts, end_ts))
+    db.commit()
+
+    db.execute("CREATE TEMP TABLE IF NOT EXISTS moving_reviews (id INTEGER PRIMARY KEY)")
+    moved = 0
+    while True:
+        db.execute("DELETE FROM temp.moving_reviews")
+        db.execute(f"""
+            INSERT INTO temp.moving_reviews (id)
+            SELECT id FROM {HOT_TABLE}
+            WHERE created_day >= ? AND created_day < ?
+            LIMIT ?
+        """, (start_ts // SECONDS_PER_DAY, end_ts // SECONDS_PER_DAY, batch_size))
+        chunk = db.execute("SELECT COUNT(*) FROM temp.moving_reviews").fetchone()[0]
+        if not chunk:
+            break
+
+        # A client id already in the partition is a retried upload: keep
+        # the partitioned copy and delete the hot one as an ordinary delete,
+        # so the triggers take it out of the review counts and the feed
+        duplicates = db.execute(f"""
+            DELETE FROM {HOT_TABLE}
+            WHERE id IN (SELECT id FROM temp.moving_reviews)
+              AND client_id IN (SELECT client_id FROM {home}.{name})
+        """).rowcount
+        db.execute("INSERT INTO review_partition_moves DEFAULT VALUES")
+        db.execute(f"""
+            INSERT INTO {home}.{name} ({REVIEW_COLUMNS})
+            SELECT {REVIEW_COLUMNS} FROM {HOT_TABLE}
+            WHERE id IN (SELECT id FROM temp.moving_reviews)
+        """)
+        db.execute(f"DELETE FROM {HOT_TABLE} WHERE id IN (SELECT id FROM temp.moving_reviews)")
+        db.execute("DELETE FROM review_partition_moves")
+        db.commit()
+        moved += chunk - duplicates
+
+    db.execute("DROP TABLE temp.moving_reviews")
+    db.commit()
+    return moved
+
+def archive_partition(db, archive_path, name):
+    """Copy a partition into the archive database, then drop the original.
+
+    The copy is committed before the registry switches over, so an
+    interrupted move leaves the original table in place and is redone on the
+    next run.
+    """
+    home = history_schema(db)
+    attach_archive(db, archive_path)
+    db.execute(f"DROP TABLE IF EXISTS {ARCHIVE_SCHEMA}.{name}")
+    db.executescript(PARTITION_DDL.format(schema=ARCHIVE_SCHEMA, name=name))
+    db.execute(f"""
+        INSERT INTO {ARCHIVE_SCHEMA}.{name} ({REVIEW_COLUMNS})
+        SELECT {REVIEW_COLUMNS} FROM {home}.{name}
+    """)
+    db.commit()
+
+    db.execute("UPDATE review_partitions SET location = 'archive' WHERE name = ?", (name,))
+    db.execute(f"DROP TABLE {home}.{name}")
+    db.commit()
+
+def partition_reviews(db, archive_path, hot_months=DEFAULT_HOT_MONTHS,
+                      archive_after_months=DEFAULT_ARCHIVE_AFTER_MONTHS,
+                      batch_size=DEFAULT_PARTITION_BATCH_SIZE, now=None):
+    """Move reviews older than `hot_months` (counting the current month)
+    into monthly partitions, and partitions older than
+    `archive_after_months` into the archive database.
+
+    Returns:
+        dict: Reviews moved per partition and the partitions archived
+    """
+    current = month_index(epoch_now() if now is None else now)
+    hot_start = month_start(current - hot_months + 1)
+    archive_before = month_start(current - archive_after_months + 1)
+
+    moved = {}
+    while True:
+        oldest = db.execute(f"""
+            SELECT MIN(created_day) FROM {HOT_TABLE}
+            WHERE created_day < ?
+        """, (hot_start // SECONDS_PER_DAY,)).fetchone()[0]
+        if oldest is None:
+            break
+        index = month_index(oldest * SECONDS_PER_DAY)
+        moved[partition_name(index)] = move_hot_month(db, index, batch_size)
+
+    archived = []
+    for (name,) in db.execute("""
+        SELECT name FROM review_partitions
+        WHERE location = 'main' AND end_ts <= ?
+        ORDER BY start_ts
+    """, (archive_before,)).fetchall():
+        archive_partition(db, archive_path, name)
+        archived.append(name)
+
+    return {
+        "moved": moved,
+        "archived": archived
+    }
+
+def subtract_review_counts(db, table, condition='1', params=()):
+    """Take the reviews of `table` matching `condition` out of the words' review counts"""
+    counts = review_counts_table(db)
+    key = 'id' if counts == 'words' else 'word_id'
+    db.execute(f"""
+        UPDATE {counts} AS counts
+        SET correct_count = correct_count - r.correct_reviews,
+            wrong_count = wrong_count - r.wrong_reviews
+        FROM (
+            SELECT word_id,
+                   SUM(correct <> 0) AS correct_reviews,
+                   SUM(correct = 0) AS wrong_reviews
+            FROM {table}
+            WHERE {condition}
+            GROUP BY word_id
+        ) r
+        WHERE r.word_id = counts.{key}
+    """, params)
+
+def delete_reviews(db, archive_path, column, ids):
+    """Delete the reviews whose `column` (word_id or study_session_id) is
+    one of `ids` from the hot table and every partition.
+
+    Run before deleting those words or sessions: only the hot table's
+    rows would go with them. Partitioned reviews are taken out of the
+    review counts here; the hot table's triggers do that for its own.
+    Attaches the archive if needed, so call it outside a transaction; the
+    caller commits.
+
+    Returns:
+        int: Reviews deleted
+    """
+    condition = f"{column} IN (SELECT value FROM json_each(?))"
+    params = (json.dumps(list(ids)),)
+    deleted = 0
+    for i, table in enumerate(review_tables(db, archive_path)):
+        if i:
+            subtract_review_counts(db, table, condition, params)
+        deleted += db.execute(f"DELETE FROM {table} WHERE {condition}", params).rowcount
+    return deleted
+
+def delete_study_sessions(db, archive_path, session_ids):
+    """Delete sessions with all their reviews, partitioned ones included;
+    the caller commits
+
+    Returns:
+        dict: sessions and reviews deleted
+    """
+    reviews = delete_reviews(db, archive_path, 'study_session_id', session_ids)
+    sessions = db.execute("""
+        DELETE FROM study_sessions WHERE id IN (SELECT value FROM json_each(?))
+    """, (json.dumps(list(session_ids)),)).rowcount
+    return {
+        "sessions": sessions,
+        "reviews": reviews
+    }
+
+def clear_history(db, archive_path):
+    """Delete every study session and review, partitioned ones included;
+    the caller commits"""
+    db.executescript("""
+        DELETE FROM word_review_items;
+        DELETE FROM study_sessions;
+    """)
+    drop_partitions(db, archive_path)
+
+def drop_partitions(db, archive_path):
+    """Drop every partition, taking its reviews out of the words' review counts.
+
+    For resetting history, after the caller has cleared the hot table
+    (whose delete triggers only see the hot rows). Attaches the archive
+    if needed, so call it outside a transaction; the caller commits.
+    """
+    partitions = list_partitions(db)
+    if any(location == 'archive' for _, location in partitions):
+        attach_archive(db, archive_path)
+    for name, location in partitions:
+        schema = ARCHIVE_SCHEMA if location == 'archive' else history_schema(db)
+        subtract_review_counts(db, f"{schema}.{name}")
+        db.execute(f"DROP TABLE IF EXISTS {schema}.{name}")
+    db.execute("DELETE FROM review_partitions")
@@ -0,0 +1,392 @@
+from flask import current_app, g, has_app_context, jsonify, redirect, request
+from contextlib import contextmanager
+import fcntl
+import json
+import os
+import shutil
+import sqlite3
+import struct
+import time
+
+# Read replicas get the primary's databases as page diffs. Shipping backs
+# every replicated file up into a snapshot under REPLICATION_DIR, compares
+# it page by page with the previous snapshot and writes the changed pages
+# to a numbered segment. A replica builds each applied version in its own
+# directory under `versions` (patched copies of the files a segment
+# changes, hard links to the rest) and then repoints the `current` symlink
+# with one rename, so all files switch together. Requests resolve the link
+# once (pinned_path), so every file a request opens comes from one whole
+# shipped version. The WAL itself is not shipped: checkpoints recycle it
+# between ships, while a snapshot diff never misses a page.
+SEGMENT_MAGIC = b'LPRS'
+SEGMENT_HEADER = struct.Struct('<4sQdI')  # magic, sequence, shipped at, files
+FILE_HEADER = struct.Struct('<HIII')      # name length, page size, page count, pages
+PAGE_NUMBER = struct.Struct('<I')
+
+STATE_FILE = 'state.json'
+REPLICA_STATE_FILE = 'replica.json'
+DEFAULT_KEEP_SEGMENTS = 100
+
+CURRENT_LINK = 'current'
+VERSIONS_DIR = 'versions'
+# Applied versions kept on a replica: the current one and the one before,
+# which requests that started before the last swap may still open files of
+KEEP_VERSIONS = 2
+
+# Methods a replica serves itself; anything else goes to the primary
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+def replicated_files(config):
+    """Databases replicas copy, as name -> path on the primary"""
+    if config.get('STORAGE_LAYOUT') == 'sharded':
+        raise ValueError("Learner shards can't be replicated")
+    files = {'words': config['SQLITE_DB_PATH']}
+    if config.get('STORAGE_LAYOUT') == 'split':
+        files['history'] = config['HISTORY_DB_PATH']
+    if os.path.exists(config['REVIEW_ARCHIVE_PATH']):
+        files['review_archive'] = config['REVIEW_ARCHIVE_PATH']
+    return files
+
+def replica_path(replica_dir, name):
+    """A replica file, through the link to the current version"""
+    return os.path.join(replica_dir, CURRENT_LINK, f'{name}.db')
+
+def version_path(replica_dir, sequence):
+    return os.path.join(replica_dir, VERSIONS_DIR, f'{sequence:010d}')
+
+def pinned_path(path):
+    """`path` inside the replica version the current request reads.
+
+    The current link is resolved on the first call of a request, so
+    files opened later in the request (an attached archive) come from the
+    same version even if a new one was swapped in meanwhile. Paths that
+    are not replica files are returned unchanged.
+    """
+    replica_dir = current_app.config.get('REPLICA_DIR') if has_app_context() else None
+    link = os.path.join(replica_dir, CURRENT_LINK) if replica_dir else None
+    if link is None or os.path.dirname(path) != link:
+        return path
+    if 'replica_version' not in g:
+        g.replica_version = os.path.realpath(link)
+    return os.path.join(g.replica_version, os.path.basename(path))
+
+def segment_path(directory, sequence):
+    return os.path.join(directory, 'segments', f'{sequence:010d}.seg')
+
+def snapshot_path(directory, name):
+    return os.path.join(directory, 'snapshots', f'{name}.db')
+
+@contextmanager
+def directory_lock(directory, operation):
+    """flock of the shipping directory: shipping takes it exclusively,
+    replicas share it while they read segments and snapshots"""
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, 'lock'), 'a') as f:
+        fcntl.flock(f, operation)
+        yield
+
+def read_json(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def write_json(path, data):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+def read_state(directory):
+    """Latest shipped sequence and when it was shipped"""
+    return read_json(os.path.join(directory, STATE_FILE), {"sequence": 0, "shipped_at": None})
+
+def read_replica_state(replica_dir):
+    """Sequence a replica has applied"""
+    return read_json(os.path.join(replica_dir, REPLICA_STATE_FILE),
+                     {"sequence": 0, "shipped_at": None, "applied_at": None})
+
+def changed_pages(old_path, new_path, page_size):
+    """Yield (page number, page) for pages of new_path that differ from old_path"""
+    old = open(old_path, 'rb') if os.path.exists(old_path) else None
+    try:
+        with open(new_path, 'rb') as new:
+            page_no = 0
+            while page := new.read(page_size):
+                if old is None or old.read(page_size) != page:
+                    yield page_no, page
+                page_no += 1
+    finally:
+        if old is not None:
+            old.close()
+
+class Shipper:
+    """Ships the primary's databases into a replication directory.
+
+    Keeps a connection to every source so `PRAGMA data_version` can tell
+    which files were written since the last ship; untouched files are not
+    backed up again.
+    """
+
+    def __init__(self, files, directory, keep_segments=DEFAULT_KEEP_SEGMENTS):
+        self.files = files
+        self.directory = directory
+        self.keep_segments = keep_segments
+        self.sources = {}
+        self.versions = {}
+
+    def data_version(self, name):
+        if name not in self.sources:
+            self.sources[name] = sqlite3.connect(self.files[name])
+        return self.sources[name].execute("PRAGMA data_version").fetchone()[0]
+
+    def backup(self, name, path):
+        """Copy a consistent snapshot of one source, in rollback journal mode
+        so replicas never look for a WAL"""
+        if os.path.exists(path):
+            os.remove(path)
+        target = sqlite3.connect(path)
+        try:
+            self.sources[name].backup(target)
+            target.execute("PRAGMA journal_mode = DELETE")
+            return target.execute("PRAGMA page_size").fetchone()[0]
+        finally:
+            target.close()
+
+    def ship(self):
+        """Write one segment with every page changed since the last ship.
+
+        Returns:
+            dict: Sequence and changed pages per file, or None if nothing changed
+        """
+        os.makedirs(os.path.join(self.directory, 'segments'), exist_ok=True)
+        os.makedirs(os.path.join(self.directory, 'snapshots'), exist_ok=True)
+        with directory_lock(self.directory, fcntl.LOCK_EX):
+            state = read_state(self.directory)
+            versions = {name: self.data_version(name) for name in self.files}
+            names = [name for name in self.files if versions[name] != self.versions.get(name)]
+            if not names:
+                return None
+
+            sequence = state['sequence'] + 1
+            shipped_at = time.time()
+            pages = {}
+            tmp_path = segment_path(self.directory, sequence) + '.tmp'
+            with open(tmp_path, 'wb') as segment:
+                segment.write(SEGMENT_HEADER.pack(SEGMENT_MAGIC, sequence, shipped_at, len(names)))
+                for name in names:
+                    pages[name] = self.write_file_pages(segment, name)
+                segment.flush()
+                os.fsync(segment.fileno())
+
+            if not any(pages.values()):
+                # Written and rolled back, or only read
+                os.remove(tmp_path)
+                self.discard_backups(names)
+                self.versions.update(versions)
+                return None
+
+            os.replace(tmp_path, segment_path(self.directory, sequence))
+            for name in names:
+                os.replace(snapshot_path(self.directory, name) + '.next',
+                           snapshot_path(self.directory, name))
+            write_json(os.path.join(self.directory, STATE_FILE),
+                       {"sequence": sequence, "shipped_at": shipped_at})
+            self.versions.update(versions)
+            self.prune(sequence)
+            return {"sequence": sequence, "pages": pages}
+
+    def write_file_pages(self, segment, name):
+        snapshot = snapshot_path(self.directory, name)
+        page_size = self.backup(name, snapshot + '.next')
+        page_count = os.path.getsize(snapshot + '.next') // page_size
+        encoded = name.encode('utf-8')
+        header_at = segment.tell()
+        segment.write(FILE_HEADER.pack(len(encoded), page_size, page_count, 0) + encoded)
+        count = 0
+        for page_no, page in changed_pages(snapshot, snapshot + '.next', page_size):
+            segment.write(PAGE_NUMBER.pack(page_no) + page)
+            count += 1
+        end = segment.tell()
+        segment.seek(header_at)
+        segment.write(FILE_HEADER.pack(len(encoded), page_size, page_count, count))
+        segment.seek(end)
+        return count
+
+    def discard_backups(self, names):
+        for name in names:
+            os.remove(snapshot_path(self.directory, name) + '.next')
+
+    def prune(self, sequence):
+        """Drop segments older than the newest keep_segments; replicas
+        further behind start over from the snapshots"""
+        for old in range(sequence - self.keep_segments, 0, -1):
+            path = segment_path(self.directory, old)
+            if not os.path.exists(path):
+                break
+            os.remove(path)
+
+    def close(self):
+        for conn in self.sources.values():
+            conn.close()
+        self.sources = {}
+
+def read_segment_header(path):
+    with open(path, 'rb') as f:
+        magic, sequence, shipped_at, files = SEGMENT_HEADER.unpack(f.read(SEGMENT_HEADER.size))
+    if magic != SEGMENT_MAGIC:
+        raise ValueError(f"{path} is not a replication segment")
+    return sequence, shipped_at
+
+def apply_segment(path, working, current, target):
+    """Patch the working copies in `target` with one segment's pages,
+    copying a file from the `current` version the first time it changes"""
+    with open(path, 'rb') as segment:
+        magic, _, _, files = SEGMENT_HEADER.unpack(segment.read(SEGMENT_HEADER.size))
+        if magic != SEGMENT_MAGIC:
+            raise ValueError(f"{path} is not a replication segment")
+        for _ in range(files):
+            name_length, page_size, page_count, pages = FILE_HEADER.unpack(
+                segment.read(FILE_HEADER.size)
+            )
+            name = segment.read(name_length).decode('utf-8')
+            if name not in working:
+                working[name] = copy_file(os.path.join(current, f'{name}.db'),
+                                          os.path.join(target, f'{name}.db'))
+            with open(working[name], 'r+b') as copy:
+                for _ in range(pages):
+                    page_no, = PAGE_NUMBER.unpack(segment.read(PAGE_NUMBER.size))
+                    copy.seek(page_no * page_size)
+                    copy.write(segment.read(page_size))
+                copy.truncate(page_count * page_size)
+
+def copy_file(source, target):
+    """Copy a file (an empty file when the source doesn't exist)"""
+    with open(target, 'wb') as copy:
+        if os.path.exists(source):
+            with open(source, 'rb') as original:
+                while chunk := original.read(1 << 20):
+                    copy.write(chunk)
+    return target
+
+def swap_current(replica_dir, target):
+    """Point the current link at a version directory in one rename"""
+    link = os.path.join(replica_dir, CURRENT_LINK)
+    tmp_link = link + '.next'
+    if os.path.lexists(tmp_link):
+        os.remove(tmp_link)
+    os.symlink(os.path.relpath(target, replica_dir), tmp_link)
+    os.replace(tmp_link, link)
+
+def prune_versions(replica_dir):
+    versions_dir = os.path.join(replica_dir, VERSIONS_DIR)
+    for name in sorted(os.listdir(versions_dir))[:-KEEP_VERSIONS]:
+        shutil.rmtree(os.path.join(versions_dir, name), ignore_errors=True)
+
+def apply_segments(directory, replica_dir):
+    """Bring a replica up to the latest shipped sequence.
+
+    A new replica, or one behind the oldest kept segment, copies the
+    snapshots instead.
+
+    Returns:
+        int: Sequences applied
+    """
+    os.makedirs(replica_dir, exist_ok=True)
+    with directory_lock(directory, fcntl.LOCK_SH):
+        state = read_state(directory)
+        replica = read_replica_state(replica_dir)
+        pending = range(replica['sequence'] + 1, state['sequence'] + 1)
+        if not pending:
+            return 0
+
+        current = os.path.realpath(os.path.join(replica_dir, CURRENT_LINK))
+        target = version_path(replica_dir, state['sequence'])
+        # Left behind by an interrupted apply; it was never current
+        shutil.rmtree(target, ignore_errors=True)
+        os.makedirs(target)
+
+        working = {}
+        if replica['sequence'] and os.path.isdir(current) and all(
+            os.path.exists(segment_path(directory, sequence)) for sequence in pending
+        ):
+            for sequence in pending:
+                apply_segment(segment_path(directory, sequence), working, current, target)
+            # Files no segment changed are shared with the current version;
+            # published versions are never written to
+            for file_name in os.listdir(current):
+                name, extension = os.path.splitext(file_name)
+                if extension == '.db' and name not in working:
+                    os.link(os.path.join(current, file_name), os.path.join(target, file_name))
+        else:
+            for file_name in os.listdir(os.path.join(directory, 'snapshots')):
+                name, extension = os.path.splitext(file_name)
+                if extension == '.db':
+                    working[name] = copy_file(snapshot_path(directory, name),
+                                              os.path.join(target, file_name))
+
+        for path in working.values():
+            with open(path, 'rb') as f:
+                os.fsync(f.fileno())
+        swap_current(replica_dir, target)
+        write_json(os.path.join(replica_dir, REPLICA_STATE_FILE), {
+            "sequence": state['sequence'],
+            "shipped_at": state['shipped_at'],
+            "applied_at": time.time()
+        })
+        prune_versions(replica_dir)
+        return len(pending)
+
+def replication_status(directory, replica_dir=None):
+    """Shipped sequence, plus how far behind the replica is.
+
+    A replica's lag is how long ago the oldest segment it has not applied
+    was shipped; 0 when it is up to date.
+    """
+    state = read_state(directory)
+    if replica_dir is None:
+        return {"role": "primary", **state}
+
+    replica = read_replica_state(replica_dir)
+    behind = max(state['sequence'] - replica['sequence'], 0)
+    lag = 0.0
+    if behind:
+        first_pending = segment_path(directory, replica['sequence'] + 1)
+        shipped_at = (read_segment_header(first_pending)[1]
+                      if os.path.exists(first_pending) else state['shipped_at'])
+        lag = max(time.time() - shipped_at, 0.0)
+    return {
+        "role": "replica",
+        "sequence": replica['sequence'],
+        "primary_sequence": state['sequence'],
+        "segments_behind": behind,
+        "lag_seconds": round(lag, 3),
+        "applied_at": replica['applied_at']
+    }
+
+def redirect_writes():
+    """Send writes to the primary with a 307, which keeps method and body"""
+    if request.method in READ_METHODS:
+        return None
+    primary = current_app.config.get('REPLICATION_PRIMARY_URL')
+    if not primary:
+        return jsonify({
+            "error": "Read-only replica",
+            "message": "This node only serves reads"
+        }), 503
+    return redirect(primary.rstrip('/') + request.full_path.rstrip('?'), code=307)
+
+def init_replica(app):
+    """Serve reads from the copies in REPLICA_DIR and send writes to the primary"""
+    config = app.config
+    if config.get('STORAGE_LAYOUT') == 'sharded':
+        raise ValueError("Learner shards can't be replicated")
+    replica_dir = config['REPLICA_DIR']
+    config.update(
+        SQLITE_DB_PATH=replica_path(replica_dir, 'words'),
+        HISTORY_DB_PATH=replica_path(replica_dir, 'history'),
+        REVIEW_ARCHIVE_PATH=replica_path(replica_dir, 'review_archive'),
+        # Replica files stay in rollback journal mode; WAL would write to them
+        SQLITE_JOURNAL_MODE=None
+    )
+    app.before_request(redirect_writes)
@@ -0,0 +1,183 @@
+import sqlite3
+from lib.models import (
+    CompletedSession, Group, GroupWord, LastStudySession, SessionStats, SessionWord,
+    StudyActivity, StudySession, Word
+)
+
+# Named queries used by the routes. sqlite3 keeps prepared statements in a
+# per-connection cache keyed by the SQL text (SQLITE_STATEMENT_CACHE_SIZE
+# entries), so giving every query one fixed text means each is compiled
+# on its first use on a connection and reused after that. Queries with
+# {placeholders} in their text (a review partition table) get one text
+# per distinct value.
+
+class Query:
+    __slots__ = ('name', 'sql', 'row_factory', 'texts')
+
+    def __init__(self, name, sql, model=None):
+        self.name = name
+        self.sql = sql
+        # Rows become `model` instances, or plain tuples without one
+        self.row_factory = (lambda cursor, row: model(*row)) if model else None
+        self.texts = {}
+
+    def text(self, parts):
+        if not parts:
+            return self.sql
+        key = tuple(sorted(parts.items()))
+        text = self.texts.get(key)
+        if text is None:
+            text = self.texts[key] = self.sql.format(**parts)
+        return text
+
+QUERIES = {}
+
+def register(name, sql, model=None):
+    QUERIES[name] = Query(name, sql, model)
+
+# Study activities
+register('activities', """
+    SELECT id, name, url, preview_url
+    FROM study_activities
+    ORDER BY id
+""", StudyActivity)
+register('activity_exists', "SELECT 1 FROM study_activities WHERE id = ?")
+
+# Words
+register('word_detail', """
+    SELECT w.id, w.spanish, w.english, w.pronunciation,
+           GROUP_CONCAT(g.id), GROUP_CONCAT(g.name)
+    FROM words w
+    LEFT JOIN word_groups wg ON w.id = wg.word_id
+    LEFT JOIN groups g ON wg.group_id = g.id
+    WHERE w.id = ?
+    GROUP BY w.id
+""")
+# Served from idx_words_spanish_key_english; matches ignore accents and case
+register('words_by_key', """
+    SELECT id, spanish, english, pronunciation
+    FROM words
+    WHERE spanish_key = ?
+    ORDER BY id
+""", Word)
+
+# Groups
+register('group_count', "SELECT COUNT(*) FROM groups")
+register('group_page', """
+    SELECT id, name, words_count
+    FROM groups
+    ORDER BY id
+    LIMIT ? OFFSET ?
+""", Group)
+register('group_exists', "SELECT 1 FROM groups WHERE id = ?")
+register('group_words', """
+    SELECT w.id, w.spanish, w.english, w.pronunciation
+    FROM words w
+    JOIN word_groups wg ON w.id = wg.word_id
+    WHERE wg.group_id = ?
+    ORDER BY wg.word_id
+""", GroupWord)
+# The primary key rejects duplicates and the foreign keys missing words
+# and groups; words_count is kept by the word_groups triggers
+register('add_group_word', """
+    INSERT INTO word_groups (group_id, word_id)
+    VALUES (?, ?)
+    ON CONFLICT DO NOTHING
+""")
+register('remove_group_word', """
+    DELETE FROM word_groups
+    WHERE group_id = ? AND word_id = ?
+""")
+
+# Study sessions
+register('session_targets_exist', """
+    SELECT EXISTS(SELECT 1 FROM groups WHERE id = ?),
+           EXISTS(SELECT 1 FROM study_activities WHERE id = ?)
+""")
+register('create_session', """
+    INSERT INTO study_sessions
+    (group_id, study_activity_id, created_at, created_ts, created_day)
+    VALUES (?, ?, ?, ?, ?)
+""")
+register('complete_session', """
+    UPDATE study_sessions
+    SET completed_at = datetime('now')
+    WHERE id = ?
+""")
+register('create_review', """
+    INSERT INTO word_review_items
+    (word_id, study_session_id, correct, created_at, created_ts, created_day)
+    VALUES (?, ?, ?, ?, ?, ?)
+""")
+register('session', """
+    SELECT id, group_id, study_activity_id, created_at, completed_at
+    FROM study_sessions
+    WHERE id = ?
+""", StudySession)
+register('session_state', """
+    SELECT completed_at, created_ts
+    FROM study_sessions
+    WHERE id = ?
+""")
+register('session_created_ts', "SELECT created_ts FROM study_sessions WHERE id = ?")
+register('completed_session', """
+    SELECT s.id, s.group_id, s.study_activity_id, s.created_at,
+           s.completed_at, s.client_id,
+           (SELECT COUNT(*) FROM {reviews} r
+            WHERE r.study_session_id = s.id) AS review_items_count
+    FROM study_sessions s
+    WHERE s.id = ?
+""", CompletedSession)
+register('session_words', """
+    SELECT w.id, w.spanish, w.english, w.pronunciation,
+           1 AS reviewed,  -- If we have the word, it was reviewed
+           r.correct
+    FROM words w
+    JOIN {reviews} r ON r.word_id = w.id
+    WHERE r.study_session_id = ?
+    ORDER BY w.id
+""", SessionWord)
+register('session_stats', """
+    SELECT COUNT(*) AS total_words,
+           SUM(CASE WHEN correct = 1 THEN 1 ELSE 0 END) AS correct_count,
+           ROUND(AVG(CASE WHEN correct = 1 THEN 100.0 ELSE 0 END), 2) AS accuracy
+    FROM {reviews}
+    WHERE study_session_id = ?
+""", SessionStats)
+
+# Dashboard
+register('last_study_session', """
+    SELECT s.id, s.study_activity_id, a.name, s.group_id, g.name, s.created_at
+    FROM study_sessions s
+    JOIN study_activities a ON a.id = s.study_activity_id
+    JOIN groups g ON g.id = s.group_id
+    ORDER BY s.created_ts DESC
+    LIMIT 1
+""", LastStudySession)
+register('word_count', "SELECT COUNT(*) FROM words")
+# {counts} is lib/storage.review_counts_table: words, or the history file's own counts
+register('studied_word_count', "SELECT COUNT(*) FROM {counts} WHERE studied")
+register('session_count', "SELECT COUNT(*) FROM study_sessions")
+register('study_days_since', """
+    SELECT DISTINCT created_day
+    FROM study_sessions
+    WHERE created_day >= ?
+""")
+
+def execute(db, name, params=(), **parts):
+    """Run a registered query; extra keyword arguments fill its {placeholders}"""
+    query = QUERIES[name]
+    cursor = db.cursor()
+    cursor.row_factory = query.row_factory
+    return cursor.execute(query.text(parts), params)
+
+def fetch_all(db, name, params=(), **parts):
+    return execute(db, name, params, **parts).fetchall()
+
+def fetch_one(db, name, params=(), **parts):
+    return execute(db, name, params, **parts).fetchone()
+
+def scalar(db, name, params=(), **parts):
+    """First column of the first row, or None without rows"""
+    row = execute(db, name, params, **parts).fetchone()
+    return row[0] if row is not None else None
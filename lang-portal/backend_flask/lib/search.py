@@ -0,0 +1,115 @@
+import base64
+import json
+import re
+
+MAX_QUERY_LENGTH = 100
+DEFAULT_SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+# Above this many matches results are returned in id order (see search_words)
+RANK_LIMIT = 2000
+
+# Letters, digits and apostrophes; everything else separates terms
+SEARCH_TERM = re.compile(r"[\w']+")
+
+class InvalidCursorError(ValueError):
+    pass
+
+def fts_query(text):
+    """Turn user input into an FTS5 query where every term is a prefix.
+
+    Terms are quoted, so FTS5 operators (OR, NOT, NEAR, column filters,
+    quotes) in the input are matched as plain text rather than parsed.
+
+    Returns:
+        str: MATCH expression, or None if the input has no searchable terms
+    """
+    terms = [term.replace('"', '""') for term in SEARCH_TERM.findall(text)]
+    if not terms:
+        return None
+    return ' '.join(f'"{term}"*' for term in terms)
+
+def encode_cursor(rank, word_id):
+    return base64.urlsafe_b64encode(json.dumps([rank, word_id]).encode()).decode()
+
+def decode_cursor(cursor):
+    """Return (rank, word_id); rank is None for unranked result sets"""
+    try:
+        rank, word_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return (None if rank is None else float(rank)), int(word_id)
+    except (ValueError, TypeError):
+        raise InvalidCursorError("Invalid cursor")
+
+def count_matches(db, query, cap):
+    """Count matches up to `cap`; stops early so broad queries stay cheap"""
+    return db.execute("""
+        SELECT COUNT(*) FROM (
+            SELECT rowid FROM words_fts WHERE words_fts MATCH ? LIMIT ?
+        )
+    """, (query, cap)).fetchone()[0]
+
+def search_words(db, text, group_id=None, cursor=None, limit=DEFAULT_SEARCH_LIMIT):
+    """Find words matching `text`, best bm25 rank first, with keyset pagination.
+
+    bm25 has to score every match before the first row comes back, so
+    queries matching more than RANK_LIMIT words (one or two letter
+    prefixes) are returned in id order instead, which FTS5 streams
+    straight from the index. The choice is made on the first page and
+    carried in the cursor. The cursor holds the last (rank, id) returned,
+    so later pages seek past it instead of using OFFSET.
+
+    Returns:
+        dict: items (at most `limit` words), ranked, and next_cursor (None on the last page)
+    """
+    query = fts_query(text)
+    if query is None:
+        return {"items": [], "ranked": True, "next_cursor": None}
+
+    conditions = ["words_fts MATCH ?"]
+    params = [query]
+    if cursor is None:
+        ranked = count_matches(db, query, RANK_LIMIT + 1) <= RANK_LIMIT
+    else:
+        rank, word_id = decode_cursor(cursor)
+        ranked = rank is not None
+        if ranked:
+            conditions.append("(words_fts.rank > ? OR (words_fts.rank = ? AND words_fts.rowid > ?))")
+            params.extend([rank, rank, word_id])
+        else:
+            conditions.append("words_fts.rowid > ?")
+            params.append(word_id)
+
+    join = ""
+    if group_id is not None:
+        join = "JOIN word_groups wg ON wg.word_id = w.id AND wg.group_id = ?"
+        params.insert(0, group_id)
+
+    rank_column = "words_fts.rank" if ranked else "NULL"
+    order = "words_fts.rank, words_fts.rowid" if ranked else "words_fts.rowid"
+    rows = db.execute(f"""
+        SELECT w.id, w.spanish, w.english, w.pronunciation, {rank_column} AS rank
+        FROM words_fts
+        JOIN words w ON w.id = words_fts.rowid
+        {join}
+        WHERE {' AND '.join(conditions)}
+        ORDER BY {order}
+        LIMIT ?
+    """, params + [limit + 1]).fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]['rank'], rows[-1]['id'])
+
+    return {
+        "items": [
+            {
+                "id": row['id'],
+                "spanish": row['spanish'],
+                "english": row['english'],
+                "pronunciation": row['pronunciation']
+            }
+            for row in rows
+        ],
+        "ranked": ranked,
+        "next_cursor": next_cursor
+    }
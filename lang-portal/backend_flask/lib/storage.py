@@ -0,0 +1,488 @@
+import os
+import re
+import sqlite3
+import threading
+
+# Storage layouts. 'single' keeps everything in words.db. 'split' keeps the
+# read-mostly vocabulary (words, groups, word_groups, study_activities,
+# change_log, ...) in words.db and moves the write-heavy history tables
+# into their own file, ATTACHed to every connection as `history`, with
+# the history rows' change_log entries and review counts, so review
+# writes stop dirtying the vocabulary file's pages and WAL. 'sharded'
+# does the same with one history file (shard) per learner;
+# lib/db.ShardRouter picks the shard for a request.
+HISTORY_SCHEMA = 'history'
+
+# Learner ids name shard files, so they are kept to safe characters
+LEARNER_ID = re.compile(r'[A-Za-z0-9][A-Za-z0-9_-]{0,63}')
+
+# Owner of the history that existed before the database was sharded
+DEFAULT_LEARNER = 'default'
+
+# New shards are copies of this empty, fully migrated history file
+SHARD_TEMPLATE = '_template.db'
+
+# Tables that move to the history file, along with every review partition
+# stored in the main database (lib/partitions.py)
+HISTORY_TABLES = ('study_sessions', 'word_review_items', 'review_partitions', 'review_partition_moves')
+
+# SQLite cannot enforce a foreign key whose parent is in another file, so
+# the history copies of these tables keep only the study_sessions one
+HISTORY_TABLE_DDL = {
+    'study_sessions': """
+        CREATE TABLE study_sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            group_id INTEGER NOT NULL,
+            study_activity_id INTEGER NOT NULL,
+            created_at DATETIME NOT NULL,
+            completed_at DATETIME,
+            client_id TEXT,
+            created_ts INTEGER,
+            created_day INTEGER
+        )
+    """,
+    'word_review_items': """
+        CREATE TABLE word_review_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            word_id INTEGER NOT NULL,
+            study_session_id INTEGER NOT NULL,
+            correct BOOLEAN NOT NULL,
+            created_at DATETIME NOT NULL,
+            client_id TEXT,
+            created_ts INTEGER,
+            created_day INTEGER,
+            FOREIGN KEY (study_session_id) REFERENCES study_sessions(id) ON DELETE CASCADE
+        )
+    """,
+}
+
+# The history file keeps its own change_log for its rows and its own
+# per-word review counts (word_review_counts, in place of the words
+# columns of migrations/015), so writing history never touches the
+# vocabulary file and each learner shard counts only its learner's
+# reviews. These are the history file's versions of the triggers on the
+# history tables that write those; the bodies must stay in sync with
+# migrations 007, 015, 018 and 019.
+HISTORY_LOCAL_DDL = (
+    """
+        CREATE TABLE IF NOT EXISTS {schema}.change_log (
+            version INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            link_id INTEGER,
+            deleted BOOLEAN NOT NULL DEFAULT 0
+        )
+    """,
+    "CREATE INDEX IF NOT EXISTS {schema}.idx_change_log_row ON change_log (table_name, row_id, link_id)",
+    """
+        CREATE TABLE IF NOT EXISTS {schema}.word_review_counts (
+            word_id INTEGER PRIMARY KEY,
+            correct_count INTEGER NOT NULL DEFAULT 0,
+            wrong_count INTEGER NOT NULL DEFAULT 0,
+            studied BOOLEAN GENERATED ALWAYS AS (correct_count + wrong_count > 0) VIRTUAL
+        )
+    """,
+    "CREATE INDEX IF NOT EXISTS {schema}.idx_word_review_counts_studied ON word_review_counts (studied)",
+)
+
+HISTORY_TRIGGERS = {
+    'word_review_counts_insert': """
+        AFTER INSERT ON word_review_items
+        BEGIN
+            INSERT INTO word_review_counts (word_id, correct_count, wrong_count)
+            VALUES (NEW.word_id, NEW.correct <> 0, NEW.correct = 0)
+            ON CONFLICT (word_id) DO UPDATE
+            SET correct_count = correct_count + excluded.correct_count,
+                wrong_count = wrong_count + excluded.wrong_count;
+        END
+    """,
+    'word_review_counts_delete': """
+        AFTER DELETE ON word_review_items
+        WHEN NOT EXISTS (SELECT 1 FROM review_partition_moves)
+        BEGIN
+            UPDATE word_review_counts
+            SET correct_count = correct_count - (OLD.correct <> 0),
+                wrong_count = wrong_count - (OLD.correct = 0)
+            WHERE word_id = OLD.word_id;
+        END
+    """,
+    'word_review_counts_update': """
+        AFTER UPDATE OF word_id, correct ON word_review_items
+        BEGIN
+            UPDATE word_review_counts
+            SET correct_count = correct_count - (OLD.correct <> 0),
+                wrong_count = wrong_count - (OLD.correct = 0)
+            WHERE word_id = OLD.word_id;
+            INSERT INTO word_review_counts (word_id, correct_count, wrong_count)
+            VALUES (NEW.word_id, NEW.correct <> 0, NEW.correct = 0)
+            ON CONFLICT (word_id) DO UPDATE
+            SET correct_count = correct_count + excluded.correct_count,
+                wrong_count = wrong_count + excluded.wrong_count;
+        END
+    """,
+    'change_log_study_sessions_insert': """
+        AFTER INSERT ON study_sessions
+        BEGIN
+            DELETE FROM change_log WHERE table_name = 'study_sessions' AND row_id = NEW.id AND link_id IS NULL;
+            INSERT INTO change_log (table_name, row_id) VALUES ('study_sessions', NEW.id);
+        END
+    """,
+    'change_log_study_sessions_update': """
+        AFTER UPDATE OF group_id, study_activity_id, created_at, completed_at, client_id
+        ON study_sessions
+        BEGIN
+            DELETE FROM change_log WHERE table_name = 'study_sessions' AND row_id = NEW.id AND link_id IS NULL;
+            INSERT INTO change_log (table_name, row_id) VALUES ('study_sessions', NEW.id);
+        END
+    """,
+    'change_log_study_sessions_delete': """
+        AFTER DELETE ON study_sessions
+        BEGIN
+            DELETE FROM change_log WHERE table_name = 'study_sessions' AND row_id = OLD.id AND link_id IS NULL;
+            INSERT INTO change_log (table_name, row_id, deleted) VALUES ('study_sessions', OLD.id, 1);
+        END
+    """,
+    'change_log_word_review_items_insert': """
+        AFTER INSERT ON word_review_items
+        BEGIN
+            DELETE FROM change_log WHERE table_name = 'word_review_items' AND row_id = NEW.id AND link_id IS NULL;
+            INSERT INTO change_log (table_name, row_id) VALUES ('word_review_items', NEW.id);
+        END
+    """,
+    'change_log_word_review_items_update': """
+        AFTER UPDATE OF word_id, study_session_id, correct, created_at, client_id
+        ON word_review_items
+        BEGIN
+            DELETE FROM change_log WHERE table_name = 'word_review_items' AND row_id = NEW.id AND link_id IS NULL;
+            INSERT INTO change_log (table_name, row_id) VALUES ('word_review_items', NEW.id);
+        END
+    """,
+    'change_log_word_review_items_delete': """
+        AFTER DELETE ON word_review_items
+        WHEN NOT EXISTS (SELECT 1 FROM review_partition_moves)
+        BEGIN
+            DELETE FROM change_log WHERE table_name = 'word_review_items' AND row_id = OLD.id AND link_id IS NULL;
+            INSERT INTO change_log (table_name, row_id, deleted) VALUES ('word_review_items', OLD.id, 1);
+        END
+    """,
+}
+
+# The foreign keys the history file cannot declare. RAISE(ABORT) surfaces
+# as sqlite3.IntegrityError, like a declared foreign key would.
+FOREIGN_KEY_TRIGGERS = {
+    'history_study_sessions_fk_insert': """
+        BEFORE INSERT ON history.study_sessions
+        WHEN NOT EXISTS (SELECT 1 FROM groups WHERE id = NEW.group_id)
+          OR NOT EXISTS (SELECT 1 FROM study_activities WHERE id = NEW.study_activity_id)
+        BEGIN
+            SELECT RAISE(ABORT, 'FOREIGN KEY constraint failed');
+        END
+    """,
+    'history_study_sessions_fk_update': """
+        BEFORE UPDATE OF group_id, study_activity_id ON history.study_sessions
+        WHEN NOT EXISTS (SELECT 1 FROM groups WHERE id = NEW.group_id)
+          OR NOT EXISTS (SELECT 1 FROM study_activities WHERE id = NEW.study_activity_id)
+        BEGIN
+            SELECT RAISE(ABORT, 'FOREIGN KEY constraint failed');
+        END
+    """,
+    'history_word_review_items_fk_insert': """
+        BEFORE INSERT ON history.word_review_items
+        WHEN NOT EXISTS (SELECT 1 FROM words WHERE id = NEW.word_id)
+        BEGIN
+            SELECT RAISE(ABORT, 'FOREIGN KEY constraint failed');
+        END
+    """,
+    'history_word_review_items_fk_update': """
+        BEFORE UPDATE OF word_id ON history.word_review_items
+        WHEN NOT EXISTS (SELECT 1 FROM words WHERE id = NEW.word_id)
+        BEGIN
+            SELECT RAISE(ABORT, 'FOREIGN KEY constraint failed');
+        END
+    """,
+    'history_groups_restrict_delete': """
+        BEFORE DELETE ON main.groups
+        WHEN EXISTS (SELECT 1 FROM study_sessions WHERE group_id = OLD.id)
+        BEGIN
+            SELECT RAISE(ABORT, 'FOREIGN KEY constraint failed');
+        END
+    """,
+    'history_study_activities_restrict_delete': """
+        BEFORE DELETE ON main.study_activities
+        WHEN EXISTS (SELECT 1 FROM study_sessions WHERE study_activity_id = OLD.id)
+        BEGIN
+            SELECT RAISE(ABORT, 'FOREIGN KEY constraint failed');
+        END
+    """,
+    'history_words_cascade_delete': """
+        AFTER DELETE ON main.words
+        BEGIN
+            DELETE FROM word_review_items WHERE word_id = OLD.id;
+            DELETE FROM word_review_counts WHERE word_id = OLD.id;
+        END
+    """,
+}
+
+def attached_schemas(db):
+    return {row[1] for row in db.execute("PRAGMA database_list")}
+
+def history_schema(db):
+    """Schema holding the history tables on this connection: 'history' in
+    the split layout, 'main' otherwise"""
+    return HISTORY_SCHEMA if HISTORY_SCHEMA in attached_schemas(db) else 'main'
+
+def history_is_split(db, history_path):
+    """Whether the history tables have already been moved to `history_path`"""
+    if not os.path.exists(history_path):
+        return False
+    return not db.execute("""
+        SELECT 1 FROM main.sqlite_master WHERE type = 'table' AND name = 'study_sessions'
+    """).fetchone()
+
+def review_counts_table(db):
+    """Table holding the per-word review counts (correct_count, wrong_count,
+    studied) on this connection: words in the single-file layout, the
+    history file's word_review_counts (keyed by word_id) otherwise"""
+    if HISTORY_SCHEMA in attached_schemas(db):
+        return f"{HISTORY_SCHEMA}.word_review_counts"
+    return 'words'
+
+def has_local_history(db):
+    """Whether the attached history file keeps its own change_log and review counts"""
+    return db.execute(f"""
+        SELECT 1 FROM {HISTORY_SCHEMA}.sqlite_master WHERE type = 'table' AND name = 'word_review_counts'
+    """).fetchone() is not None
+
+def create_local_history(db):
+    """Create the attached history file's change_log, review counts and
+    the same-file triggers that keep them; the caller commits"""
+    for sql in HISTORY_LOCAL_DDL:
+        db.execute(sql.format(schema=HISTORY_SCHEMA))
+    for name, body in HISTORY_TRIGGERS.items():
+        db.execute(f"CREATE TRIGGER IF NOT EXISTS {HISTORY_SCHEMA}.{name} {body}")
+
+def attach_history(db, history_path, journal_mode=None):
+    """ATTACH the history file and create the cross-file foreign key triggers.
+
+    ATTACH cannot run inside a transaction, so call this right after
+    opening the connection.
+    """
+    if HISTORY_SCHEMA not in attached_schemas(db):
+        db.execute(f"ATTACH DATABASE ? AS {HISTORY_SCHEMA}", (history_path,))
+    if journal_mode:
+        db.execute(f"PRAGMA {HISTORY_SCHEMA}.journal_mode = {journal_mode}")
+    for name, body in FOREIGN_KEY_TRIGGERS.items():
+        db.execute(f"CREATE TEMP TRIGGER IF NOT EXISTS {name} {body}")
+
+def split_history(db, history_path):
+    """Move the history tables out of the connection's main database into
+    `history_path`, then attach it.
+
+    Run with the app stopped, after every pending migration has been
+    applied to the single file. Tables, indexes and same-file triggers are
+    created in the history file first; the rows are copied and the main
+    tables dropped in one transaction, so an interrupted split leaves the
+    main database as it was and can simply be run again.
+
+    The history file gets its own change_log, which takes over the history
+    tables' entries, and its own review counts, which start from the
+    words' counters (then zeroed, as the vocabulary no longer keeps them).
+
+    Returns:
+        dict: Rows moved per table
+    """
+    tables = list(HISTORY_TABLES) + [row[0] for row in db.execute("""
+        SELECT name FROM main.review_partitions WHERE location = 'main' ORDER BY start_ts
+    """)]
+    placeholders = ', '.join('?' * len(tables))
+    schema = db.execute(f"""
+        SELECT type, name, tbl_name, sql FROM main.sqlite_master
+        WHERE tbl_name IN ({placeholders}) AND sql IS NOT NULL
+        ORDER BY type = 'table' DESC, type = 'index' DESC
+    """, tables).fetchall()
+
+    history = sqlite3.connect(history_path)
+    try:
+        for table in reversed(tables):
+            history.execute(f"DROP TABLE IF EXISTS {table}")
+        history.execute("DROP TABLE IF EXISTS change_log")
+        history.execute("DROP TABLE IF EXISTS word_review_counts")
+        for object_type, name, table, sql in schema:
+            if object_type == 'table':
+                history.execute(HISTORY_TABLE_DDL.get(name, sql))
+            elif name not in HISTORY_TRIGGERS:
+                history.execute(sql)
+        history.commit()
+    finally:
+        history.close()
+
+    # Dropping a parent table runs its foreign key actions; the children
+    # are being moved with it. The history file's triggers are only
+    # created once the rows are in place, so copying them changes no
+    # counts and logs nothing.
+    db.execute("PRAGMA foreign_keys = OFF")
+    if HISTORY_SCHEMA not in attached_schemas(db):
+        db.execute(f"ATTACH DATABASE ? AS {HISTORY_SCHEMA}", (history_path,))
+    moved = {}
+    try:
+        db.execute("BEGIN")
+        for table in tables:
+            columns = ', '.join(row[1] for row in db.execute(f"PRAGMA main.table_info({table})"))
+            moved[table] = db.execute(f"""
+                INSERT INTO {HISTORY_SCHEMA}.{table} ({columns})
+                SELECT {columns} FROM main.{table}
+            """).rowcount
+        # Keep AUTOINCREMENT from reusing the ids of deleted rows
+        db.execute(f"DELETE FROM {HISTORY_SCHEMA}.sqlite_sequence WHERE name IN ({placeholders})",
+                   tables)
+        db.execute(f"""
+            INSERT INTO {HISTORY_SCHEMA}.sqlite_sequence (name, seq)
+            SELECT name, seq FROM main.sqlite_sequence
+            WHERE name IN ({placeholders})
+        """, tables)
+        create_local_history(db)
+        move_history_log(db)
+        db.execute(f"""
+            INSERT INTO {HISTORY_SCHEMA}.word_review_counts (word_id, correct_count, wrong_count)
+            SELECT id, correct_count, wrong_count FROM main.words WHERE studied
+        """)
+        db.execute("UPDATE main.words SET correct_count = 0, wrong_count = 0 WHERE studied")
+        for table in reversed(tables):
+            db.execute(f"DROP TABLE main.{table}")
+        db.commit()
+    except sqlite3.Error:
+        db.rollback()
+        raise
+    finally:
+        db.execute("PRAGMA foreign_keys = ON")
+    attach_history(db, history_path)
+    return moved
+
+def move_history_log(db):
+    """Move the history tables' change_log entries from the vocabulary
+    file into the attached history file's log, keeping their versions"""
+    db.execute(f"""
+        INSERT INTO {HISTORY_SCHEMA}.change_log (version, table_name, row_id, link_id, deleted)
+        SELECT version, table_name, row_id, link_id, deleted FROM main.change_log
+        WHERE table_name IN ('study_sessions', 'word_review_items')
+    """)
+    db.execute("""
+        DELETE FROM main.change_log
+        WHERE table_name IN ('study_sessions', 'word_review_items')
+    """)
+
+def localize_history(db, review_tables):
+    """Give the attached history file its own change_log and review counts
+    if it was split off before history files kept them.
+
+    `review_tables` are the qualified tables holding the history's reviews
+    (lib/partitions.review_tables); the counts are rebuilt from them, as
+    the words' counters may cover other learners too, and those counters
+    are zeroed. Run with the app stopped; `invoke migrate` does, for
+    every history file.
+
+    Returns:
+        bool: Whether the history file was converted
+    """
+    if has_local_history(db):
+        return False
+    try:
+        db.execute("BEGIN")
+        create_local_history(db)
+        move_history_log(db)
+        reviews = " UNION ALL ".join(f"SELECT word_id, correct FROM {table}" for table in review_tables)
+        db.execute(f"""
+            INSERT INTO {HISTORY_SCHEMA}.word_review_counts (word_id, correct_count, wrong_count)
+            SELECT word_id, SUM(correct <> 0), SUM(correct = 0)
+            FROM ({reviews})
+            GROUP BY word_id
+        """)
+        db.execute("UPDATE main.words SET correct_count = 0, wrong_count = 0 WHERE studied")
+        db.commit()
+    except sqlite3.Error:
+        db.rollback()
+        raise
+    return True
+
+def shard_path(shard_dir, learner):
+    return os.path.join(shard_dir, f"{learner}.db")
+
+def shard_archive_path(shard_dir, learner):
+    """Review archive database of one learner (lib/partitions.py)"""
+    return os.path.join(shard_dir, f"{learner}.archive.db")
+
+def list_learners(shard_dir):
+    """Learner ids that have a shard, in name order"""
+    if not os.path.isdir(shard_dir):
+        return []
+    return sorted(
+        name[:-3] for name in os.listdir(shard_dir)
+        if name.endswith('.db') and LEARNER_ID.fullmatch(name[:-3])
+    )
+
+def copy_schema(source_path, target_path):
+    """Create every table, index and trigger of one database in a new, empty one"""
+    source = sqlite3.connect(source_path)
+    try:
+        schema = source.execute("""
+            SELECT sql FROM sqlite_master
+            WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%'
+            ORDER BY type = 'table' DESC, type = 'index' DESC
+        """).fetchall()
+    finally:
+        source.close()
+
+    target = sqlite3.connect(target_path)
+    try:
+        for (sql,) in schema:
+            target.execute(sql)
+        target.commit()
+    finally:
+        target.close()
+
+def shard_history(db, shard_dir):
+    """Move the history tables into the default learner's shard and build
+    the template that new shards are copied from.
+
+    Same conditions as split_history: run with the app stopped, after
+    every pending migration has been applied to the single file.
+
+    Returns:
+        dict: Rows moved per table
+    """
+    os.makedirs(shard_dir, exist_ok=True)
+    default_path = shard_path(shard_dir, DEFAULT_LEARNER)
+    moved = split_history(db, default_path)
+
+    template = os.path.join(shard_dir, SHARD_TEMPLATE)
+    if os.path.exists(template):
+        os.remove(template)
+    copy_schema(default_path, template)
+    return moved
+
+def create_shard(shard_dir, learner):
+    """Path of a learner's shard, copying the template if it is new.
+
+    The copy is written under a temporary name and linked into place, so
+    concurrent first requests of one learner cannot see a half-written
+    shard or overwrite each other's.
+    """
+    path = shard_path(shard_dir, learner)
+    if os.path.exists(path):
+        return path
+
+    staging = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    template = sqlite3.connect(os.path.join(shard_dir, SHARD_TEMPLATE))
+    copy = sqlite3.connect(staging)
+    try:
+        template.backup(copy)
+    finally:
+        copy.close()
+        template.close()
+    try:
+        os.link(staging, path)
+    except FileExistsError:
+        pass
+    finally:
+        os.remove(staging)
+    return path
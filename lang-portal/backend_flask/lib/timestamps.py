@@ -0,0 +1,82 @@
+from datetime import datetime, timezone
+import calendar
+import time
+
+# study_sessions and word_review_items keep their created_at text (what the
+# API returns) next to created_ts, the same instant as integer epoch
+# seconds, and created_day, its UTC day (created_ts / 86400). Queries
+# filter and sort on the integers (migrations/018).
+SECONDS_PER_DAY = 86400
+
+TIMESTAMP_TABLES = ('study_sessions', 'word_review_items')
+
+DEFAULT_BACKFILL_BATCH_SIZE = 5000
+
+def epoch_now():
+    return int(time.time())
+
+def day_bucket(epoch):
+    """UTC day number of an epoch timestamp (days since 1970-01-01)"""
+    return epoch // SECONDS_PER_DAY
+
+def day_of(date_text):
+    """Day number of a YYYY-MM-DD date, or of today (UTC) for 'now'"""
+    if date_text == 'now':
+        return day_bucket(epoch_now())
+    return day_bucket(calendar.timegm(datetime.strptime(date_text, '%Y-%m-%d').timetuple()))
+
+def format_epoch(epoch):
+    """created_at text for an epoch, in SQLite's datetime() format"""
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+def epoch_of(created_at):
+    """Epoch seconds of a created_at text, read as UTC like SQLite does
+    unless it carries its own offset"""
+    return calendar.timegm(datetime.fromisoformat(created_at).utctimetuple())
+
+def timestamp_columns(epoch=None):
+    """(created_at, created_ts, created_day) values for a new row"""
+    epoch = epoch_now() if epoch is None else epoch
+    return format_epoch(epoch), epoch, day_bucket(epoch)
+
+def backfill_timestamps(conn, batch_size=DEFAULT_BACKFILL_BATCH_SIZE, progress=None):
+    """Fill created_ts/created_day for rows written before migration 018.
+
+    Walks each table in id ranges of `batch_size` rows and commits after
+    every range, so it can run against a live database: the write lock
+    is held for one short UPDATE at a time. Rows that already have a
+    timestamp are left alone, so it is safe to run again.
+
+    Args:
+        progress: Optional callable taking (table, last_id, filled)
+
+    Returns:
+        dict: Rows filled per table
+    """
+    filled = {}
+    for table in TIMESTAMP_TABLES:
+        filled[table] = 0
+        after = 0
+        while True:
+            row = conn.execute(f"""
+                SELECT id FROM {table}
+                WHERE id > ?
+                ORDER BY id
+                LIMIT 1 OFFSET ?
+            """, (after, batch_size - 1)).fetchone()
+            upto = row[0] if row else None
+            cursor = conn.execute(f"""
+                UPDATE {table}
+                SET created_ts = CAST(strftime('%s', created_at) AS INTEGER),
+                    created_day = CAST(strftime('%s', created_at) AS INTEGER) / {SECONDS_PER_DAY}
+                WHERE id > ? AND (? IS NULL OR id <= ?)
+                  AND created_ts IS NULL
+            """, (after, upto, upto))
+            filled[table] += max(cursor.rowcount, 0)
+            conn.commit()
+            if upto is None:
+                break
+            after = upto
+            if progress:
+                progress(table, after, filled[table])
+    return filled
@@ -0,0 +1,313 @@
+from contextlib import contextmanager
+from lib.embeddings import make_embedder, word_text
+import numpy as np
+import fcntl
+import json
+import os
+import threading
+import time
+
+DEFAULT_SIMILAR_LIMIT = 10
+MAX_SIMILAR_LIMIT = 50
+
+# Smallest matrix created; grown matrices double
+MIN_CAPACITY = 1024
+# Above this many changed words, re-embedding everything is simpler
+REBUILD_CHANGES = 100_000
+# Words read from SQLite and embedded at a time while building
+BUILD_BATCH_SIZE = 4096
+# Rows scored per matrix-vector product; bounds the temporary score arrays
+SEARCH_BLOCK_ROWS = 1 << 16
+
+class VectorIndex:
+    """Word embeddings kept as one contiguous float32 matrix on disk.
+
+    The directory holds meta.json (embedder, generation, row count and the
+    change_log version reflected), vectors-<generation>.npy, a (capacity,
+    dim) matrix whose first `count` rows are in use, and ids-<generation>.npy
+    with the word id of each row in ascending order. Both arrays are
+    memory mapped, so every worker shares one copy through the page cache.
+
+    Catching up with change_log writes changed rows in place and appends
+    new words into spare capacity before meta.json is replaced, so readers
+    never look past the committed count. Growing or rebuilding writes a
+    new generation and then points meta.json at it. Writers in different
+    processes serialize on an flock of the directory's lock file. Deleted
+    words keep their row with a zero vector, which never scores above zero.
+    """
+
+    def __init__(self, directory, embedder):
+        self.directory = directory
+        self.embedder = embedder
+        self.meta = None
+        self.meta_stat = None
+        self.vectors = None
+        self.ids = None
+        self.checked_at = 0.0
+        self.lock = threading.Lock()
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def array_paths(self, generation):
+        return self.path(f"vectors-{generation}.npy"), self.path(f"ids-{generation}.npy")
+
+    def read_meta(self):
+        """Return meta.json and its (inode, mtime), or (None, None) if unusable"""
+        try:
+            with open(self.path('meta.json')) as f:
+                stat = os.fstat(f.fileno())
+                return json.load(f), (stat.st_ino, stat.st_mtime_ns)
+        except (OSError, ValueError):
+            return None, None
+
+    def load(self):
+        """Map the generation meta.json points at.
+
+        Returns:
+            bool: False if there is no index for this embedder yet
+        """
+        meta, stat = self.read_meta()
+        if stat is not None and stat == self.meta_stat:
+            return True
+        self.meta = self.meta_stat = self.vectors = self.ids = None
+        if meta is None or meta.get('embedder') != self.embedder.name:
+            return False
+        vectors_path, ids_path = self.array_paths(meta['generation'])
+        try:
+            vectors = np.load(vectors_path, mmap_mode='r')
+            ids = np.load(ids_path, mmap_mode='r')
+        except (OSError, ValueError):
+            # Replaced by a writer since meta.json was read, or damaged
+            return False
+        if vectors.ndim != 2 or vectors.dtype != np.float32 or len(ids) != len(vectors) \
+                or meta['count'] > len(ids):
+            return False
+        self.meta, self.meta_stat, self.vectors, self.ids = meta, stat, vectors, ids
+        return True
+
+    @contextmanager
+    def file_lock(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.path('lock'), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+
+    def write_meta(self, generation, count, version):
+        meta = {
+            "embedder": self.embedder.name,
+            "generation": generation,
+            "count": count,
+            "version": version
+        }
+        tmp_path = self.path('meta.json.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self.path('meta.json'))
+
+    def create_generation(self, capacity, dim):
+        """Allocate the arrays of a generation not yet referenced by meta.json"""
+        # Read from disk: meta.json may belong to another embedder
+        meta, _ = self.read_meta()
+        generation = meta['generation'] + 1 if meta else 1
+        vectors_path, ids_path = self.array_paths(generation)
+        vectors = np.lib.format.open_memmap(vectors_path, mode='w+', dtype=np.float32,
+                                            shape=(capacity, dim))
+        ids = np.lib.format.open_memmap(ids_path, mode='w+', dtype=np.int64, shape=(capacity,))
+        return generation, vectors, ids
+
+    def switch_generation(self, generation, vectors, ids, count, version):
+        """Flush a new generation, point meta.json at it and drop the old one"""
+        vectors.flush()
+        ids.flush()
+        meta, _ = self.read_meta()
+        previous = meta['generation'] if meta else None
+        self.write_meta(generation, count, version)
+        if previous is not None and previous != generation:
+            # Readers still mapping the old files keep them until they reload
+            for path in self.array_paths(previous):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def rebuild(self, conn):
+        """Embed every word into a new generation"""
+        own_transaction = not conn.in_transaction
+        if own_transaction:
+            conn.execute("BEGIN")
+        try:
+            version = conn.execute("SELECT COALESCE(MAX(version), 0) FROM change_log").fetchone()[0]
+            count = conn.execute("SELECT COUNT(*) FROM words").fetchone()[0]
+            rows = conn.execute("SELECT id, spanish, english FROM words ORDER BY id")
+            capacity = max(MIN_CAPACITY, count + count // 4)
+            generation = vectors = ids = None
+            written = 0
+            while True:
+                batch = rows.fetchmany(BUILD_BATCH_SIZE)
+                if not batch and vectors is not None:
+                    break
+                embeddings = self.embedder.embed(
+                    [word_text(spanish, english) for _, spanish, english in batch] or ['']
+                )
+                if vectors is None:
+                    generation, vectors, ids = self.create_generation(capacity, embeddings.shape[1])
+                if not batch:
+                    break
+                vectors[written:written + len(batch)] = embeddings
+                ids[written:written + len(batch)] = [word_id for word_id, _, _ in batch]
+                written += len(batch)
+        finally:
+            if own_transaction:
+                conn.rollback()
+
+        self.switch_generation(generation, vectors, ids, written, version)
+
+    def apply_changes(self, conn):
+        """Embed words changed since the index version and write them in place.
+
+        Returns:
+            bool: False if the changes need a rebuild instead
+        """
+        own_transaction = not conn.in_transaction
+        if own_transaction:
+            conn.execute("BEGIN")
+        try:
+            latest = conn.execute("SELECT COALESCE(MAX(version), 0) FROM change_log").fetchone()[0]
+            if latest < self.meta['version']:
+                # The database was reset underneath us
+                return False
+            if latest == self.meta['version']:
+                return True
+            changes = conn.execute("""
+                SELECT c.row_id, w.spanish, w.english
+                FROM change_log c
+                LEFT JOIN words w ON w.id = c.row_id
+                WHERE c.version > ? AND c.version <= ?
+                  AND c.table_name = 'words'
+                ORDER BY c.row_id
+            """, (self.meta['version'], latest)).fetchall()
+        finally:
+            if own_transaction:
+                conn.rollback()
+        if len(changes) > REBUILD_CHANGES:
+            return False
+
+        count = self.meta['count']
+        ids = self.ids[:count]
+        changed_ids = np.array([row[0] for row in changes], dtype=np.int64)
+        rows = np.searchsorted(ids, changed_ids)
+        existing = rows < count
+        existing[existing] = ids[rows[existing]] == changed_ids[existing]
+
+        updated = [(row, change) for row, change, found in zip(rows, changes, existing)
+                   if found and change[1] is not None]
+        deleted = [row for row, change, found in zip(rows, changes, existing)
+                   if found and change[1] is None]
+        added = [change for change, found in zip(changes, existing)
+                 if not found and change[1] is not None]
+        if added and count and added[0][0] < ids[-1]:
+            # Rows are kept in id order, so an id below the last one can't be appended
+            return False
+
+        texts = [word_text(spanish, english) for _, (_, spanish, english) in updated]
+        texts += [word_text(spanish, english) for _, spanish, english in added]
+        embeddings = self.embedder.embed(texts) if texts else None
+
+        generation = self.meta['generation']
+        if count + len(added) > len(self.ids):
+            generation, vectors, new_ids = self.create_generation(
+                max(MIN_CAPACITY, 2 * (count + len(added))), self.vectors.shape[1]
+            )
+            vectors[:count] = self.vectors[:count]
+            new_ids[:count] = ids
+        else:
+            vectors, new_ids = (np.load(path, mmap_mode='r+') for path in self.array_paths(generation))
+
+        if updated:
+            vectors[[row for row, _ in updated]] = embeddings[:len(updated)]
+        if deleted:
+            vectors[deleted] = 0
+        if added:
+            vectors[count:count + len(added)] = embeddings[len(updated):]
+            new_ids[count:count + len(added)] = [word_id for word_id, _, _ in added]
+
+        self.switch_generation(generation, vectors, new_ids, count + len(added), latest)
+        return True
+
+    def refresh(self, connect, max_age):
+        """Catch up with change_log at most once every `max_age` seconds"""
+        if self.meta is not None and time.monotonic() - self.checked_at < max_age:
+            return
+        with self.lock:
+            if self.meta is not None and time.monotonic() - self.checked_at < max_age:
+                return
+            conn = connect()
+            latest = conn.execute("SELECT COALESCE(MAX(version), 0) FROM change_log").fetchone()[0]
+            if not self.load() or self.meta['version'] != latest:
+                with self.file_lock():
+                    # Another process may have caught up while we waited
+                    if not (self.load() and self.apply_changes(conn)):
+                        self.rebuild(conn)
+                    self.load()
+            self.checked_at = time.monotonic()
+
+    def search(self, text, limit=DEFAULT_SIMILAR_LIMIT):
+        """Return (word id, cosine similarity) of the closest words, best first"""
+        query = self.embedder.embed([text])[0]
+        with self.lock:
+            count, vectors, ids = self.meta['count'], self.vectors, self.ids
+
+        best_rows = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+        for start in range(0, count, SEARCH_BLOCK_ROWS):
+            scores = vectors[start:min(start + SEARCH_BLOCK_ROWS, count)] @ query
+            if len(scores) > limit:
+                top = np.argpartition(scores, -limit)[-limit:]
+            else:
+                top = np.arange(len(scores))
+            best_rows = np.concatenate([best_rows, top + start])
+            best_scores = np.concatenate([best_scores, scores[top]])
+            if len(best_rows) > limit:
+                keep = np.argpartition(best_scores, -limit)[-limit:]
+                best_rows, best_scores = best_rows[keep], best_scores[keep]
+
+        order = np.lexsort((best_rows, -best_scores))
+        return [(int(ids[row]), float(score))
+                for row, score in zip(best_rows[order], best_scores[order]) if score > 0]
+
+def find_similar_words(db, index, text, limit=DEFAULT_SIMILAR_LIMIT):
+    """Words whose embedding is closest to the embedding of `text`.
+
+    Returns:
+        list: Words with their cosine similarity score, most similar first
+    """
+    matches = index.search(text, limit)
+    if not matches:
+        return []
+    words = {
+        row['id']: row
+        for row in db.execute(f"""
+            SELECT id, spanish, english, pronunciation
+            FROM words
+            WHERE id IN ({', '.join('?' * len(matches))})
+        """, [word_id for word_id, _ in matches])
+    }
+    return [
+        {
+            "id": word_id,
+            "spanish": words[word_id]['spanish'],
+            "english": words[word_id]['english'],
+            "pronunciation": words[word_id]['pronunciation'],
+            "score": round(score, 4)
+        }
+        for word_id, score in matches
+        if word_id in words
+    ]
+
+def get_vector_index(app):
+    """Return the app's index, shared by the threads of this process"""
+    index = app.extensions.get('vector_index')
+    if index is None:
+        index = app.extensions.setdefault('vector_index', VectorIndex(
+            app.config['VECTOR_INDEX_DIR'], make_embedder(app.config)
+        ))
+    return index
@@ -0,0 +1,297 @@
+from flask import current_app
+from array import array
+from bisect import bisect_left
+import mmap
+import os
+import struct
+import sys
+import zlib
+
+# Pack layout (all integers little-endian uint32 unless noted):
+#
+#   header          HEADER (below)
+#   word_ids        word_count ids, ascending
+#   word_records    word_count x WORD_FIELDS: spanish, english and
+#                   pronunciation as (offset, length) into the string
+#                   table, then (start, count) into word_groups
+#   group_ids       group_count ids, ascending
+#   group_records   group_count x GROUP_FIELDS: name (offset, length),
+#                   then (start, count) into group_words
+#   group_words     membership_count word record indexes, grouped by group
+#   word_groups     membership_count group record indexes, grouped by word
+#   strings         sorted, de-duplicated UTF-8 strings
+#
+# The checksum is a CRC32 of everything after the header.
+MAGIC = b'VPAK'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sHHIIIIqI')
+WORD_FIELDS = 8
+GROUP_FIELDS = 4
+
+# change_log tables a pack is built from
+PACK_TABLES = ('words', 'groups', 'word_groups')
+
+class VocabPackError(ValueError):
+    pass
+
+def u32_bytes(values):
+    data = array('I', values)
+    if sys.byteorder != 'little':
+        data.byteswap()
+    return data.tobytes()
+
+def build_vocab_pack(conn, path):
+    """Compile words and word_groups into an immutable binary pack.
+
+    All rows are read inside one transaction, and the pack records the
+    change_log version it was built from, so clients can continue with
+    GET /api/changes?since=<version>. The file is written next to `path`
+    and renamed into place, so readers never see a partial pack.
+
+    Returns:
+        dict: Path, row counts, data version, checksum and size in bytes
+    """
+    # One read transaction keeps words and memberships consistent
+    own_transaction = not conn.in_transaction
+    if own_transaction:
+        conn.execute("BEGIN")
+    try:
+        data_version = conn.execute("SELECT COALESCE(MAX(version), 0) FROM change_log").fetchone()[0]
+        words = conn.execute("""
+            SELECT id, spanish, english, pronunciation FROM words ORDER BY id
+        """).fetchall()
+        groups = conn.execute("SELECT id, name FROM groups ORDER BY id").fetchall()
+        memberships = conn.execute("""
+            SELECT wg.word_id, wg.group_id
+            FROM word_groups wg
+            JOIN words w ON w.id = wg.word_id
+            JOIN groups g ON g.id = wg.group_id
+        """).fetchall()
+    finally:
+        if own_transaction:
+            conn.rollback()
+
+    strings = sorted({text for word in words for text in word[1:]} | {group[1] for group in groups})
+    string_table = bytearray()
+    string_refs = {}
+    for text in strings:
+        encoded = text.encode('utf-8')
+        string_refs[text] = (len(string_table), len(encoded))
+        string_table += encoded
+
+    word_index = {word[0]: i for i, word in enumerate(words)}
+    group_index = {group[0]: i for i, group in enumerate(groups)}
+    pairs = [(word_index[word_id], group_index[group_id]) for word_id, group_id in memberships]
+
+    words_by_group = [[] for _ in groups]
+    groups_by_word = [[] for _ in words]
+    for word_i, group_i in sorted(pairs):
+        words_by_group[group_i].append(word_i)
+        groups_by_word[word_i].append(group_i)
+
+    word_records = []
+    word_groups = []
+    for word, member_of in zip(words, groups_by_word):
+        for text in word[1:]:
+            word_records.extend(string_refs[text])
+        word_records.extend((len(word_groups), len(member_of)))
+        word_groups.extend(member_of)
+
+    group_records = []
+    group_words = []
+    for group, members in zip(groups, words_by_group):
+        group_records.extend(string_refs[group[1]])
+        group_records.extend((len(group_words), len(members)))
+        group_words.extend(members)
+
+    body = b''.join((
+        u32_bytes(word[0] for word in words),
+        u32_bytes(word_records),
+        u32_bytes(group[0] for group in groups),
+        u32_bytes(group_records),
+        u32_bytes(group_words),
+        u32_bytes(word_groups),
+        bytes(string_table),
+    ))
+    checksum = zlib.crc32(body)
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, 0, len(words), len(groups),
+                         len(pairs), len(string_table), data_version, checksum)
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path + '.tmp', 'wb') as f:
+        f.write(header)
+        f.write(body)
+    os.replace(path + '.tmp', path)
+
+    return {
+        "path": path,
+        "words": len(words),
+        "groups": len(groups),
+        "memberships": len(pairs),
+        "data_version": data_version,
+        "checksum": f"{checksum:08x}",
+        "size": len(header) + len(body)
+    }
+
+class VocabPack:
+    """Read-only view of a vocabulary pack through mmap.
+
+    Lookups binary-search the id columns in place; only the strings of
+    the returned rows are decoded.
+    """
+
+    def __init__(self, path):
+        if sys.byteorder != 'little':
+            raise VocabPackError("Vocabulary packs can only be mapped on little-endian hosts")
+
+        self.path = path
+        self.file = open(path, 'rb')
+        try:
+            self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty file
+            self.file.close()
+            raise VocabPackError("Vocabulary pack is empty")
+
+        try:
+            self.load()
+        except VocabPackError:
+            self.close()
+            raise
+
+    def load(self):
+        if len(self.mmap) < HEADER.size:
+            raise VocabPackError("Vocabulary pack is truncated")
+        (magic, version, _, word_count, group_count, membership_count,
+         strings_size, self.data_version, self.checksum) = HEADER.unpack_from(self.mmap)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise VocabPackError("Not a version 1 vocabulary pack")
+
+        counts = (word_count, word_count * WORD_FIELDS, group_count,
+                  group_count * GROUP_FIELDS, membership_count, membership_count)
+        if HEADER.size + 4 * sum(counts) + strings_size != len(self.mmap):
+            raise VocabPackError("Vocabulary pack is truncated")
+        # Views must be released before the mmap can be closed
+        with memoryview(self.mmap) as view, view[HEADER.size:] as body:
+            if zlib.crc32(body) != self.checksum:
+                raise VocabPackError("Vocabulary pack checksum mismatch")
+
+        view = memoryview(self.mmap)
+        sections = []
+        offset = HEADER.size
+        for count in counts:
+            sections.append(view[offset:offset + count * 4].cast('I'))
+            offset += count * 4
+        (self.word_ids, self.word_records, self.group_ids,
+         self.group_records, self.group_words, self.word_groups) = sections
+        self.strings = view[offset:]
+        self.stat = os.fstat(self.file.fileno())
+        # Newest change_log version the pack was found current at
+        self.current_at = self.data_version
+        self.stale = False
+
+    @property
+    def etag(self):
+        return f"{self.checksum:08x}-{self.data_version}"
+
+    def close(self):
+        for name in ('word_ids', 'word_records', 'group_ids', 'group_records',
+                     'group_words', 'word_groups', 'strings'):
+            view = self.__dict__.pop(name, None)
+            if view is not None:
+                view.release()
+        self.mmap.close()
+        self.file.close()
+
+    def string(self, offset, length):
+        return str(self.strings[offset:offset + length], 'utf-8')
+
+    def find(self, ids, row_id):
+        i = bisect_left(ids, row_id)
+        if i < len(ids) and ids[i] == row_id:
+            return i
+        return None
+
+    def word_at(self, i):
+        base = i * WORD_FIELDS
+        spanish_at, spanish_len, english_at, english_len, pron_at, pron_len = \
+            self.word_records[base:base + 6]
+        return {
+            "id": self.word_ids[i],
+            "spanish": self.string(spanish_at, spanish_len),
+            "english": self.string(english_at, english_len),
+            "pronunciation": self.string(pron_at, pron_len)
+        }
+
+    def get_word(self, word_id):
+        """Return a word with its groups, shaped like GET /api/words/<id>, or None"""
+        i = self.find(self.word_ids, word_id)
+        if i is None:
+            return None
+
+        word = self.word_at(i)
+        start, count = self.word_records[i * WORD_FIELDS + 6:i * WORD_FIELDS + 8]
+        word['groups'] = []
+        for group_i in self.word_groups[start:start + count]:
+            name_at, name_len = self.group_records[group_i * GROUP_FIELDS:group_i * GROUP_FIELDS + 2]
+            word['groups'].append({
+                "id": self.group_ids[group_i],
+                "name": self.string(name_at, name_len)
+            })
+        return word
+
+    def get_group_words(self, group_id):
+        """Return a group's words ordered by id, or None if the group is not in the pack"""
+        i = self.find(self.group_ids, group_id)
+        if i is None:
+            return None
+
+        start, count = self.group_records[i * GROUP_FIELDS + 2:i * GROUP_FIELDS + 4]
+        return [self.word_at(word_i) for word_i in self.group_words[start:start + count]]
+
+# Mapped packs per path, replaced when the file on disk changes
+_packs = {}
+
+def get_pack():
+    """Return the app's mapped vocabulary pack, or None if it is missing or invalid.
+
+    The file is re-mapped when `invoke build-pack` replaces it. The old
+    mapping is left to the garbage collector because requests on other
+    threads may still be reading from it.
+    """
+    path = current_app.config['VOCAB_PACK_PATH']
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+
+    pack = _packs.get(path)
+    if pack is None or (pack.stat.st_ino, pack.stat.st_mtime_ns) != (stat.st_ino, stat.st_mtime_ns):
+        try:
+            pack = _packs[path] = VocabPack(path)
+        except VocabPackError as e:
+            current_app.logger.warning("Ignoring vocabulary pack %s: %s", path, e)
+            _packs.pop(path, None)
+            return None
+    return pack
+
+def current_pack(db):
+    """Return the mapped pack if no word, group or membership change has
+    been logged since it was built, or None.
+
+    A pack remembers the newest version it was found current at, so each
+    call only reads the change_log entries logged since the last one.
+    """
+    pack = get_pack()
+    if pack is None or pack.stale:
+        return None
+    latest, changed = db.execute(f"""
+        SELECT MAX(version), MAX(table_name IN ({', '.join('?' * len(PACK_TABLES))}))
+        FROM change_log
+        WHERE version > ?
+    """, (*PACK_TABLES, pack.current_at)).fetchone()
+    if changed:
+        pack.stale = True
+        return None
+    if latest is not None:
+        pack.current_at = latest
+    return pack
@@ -0,0 +1,161 @@
+from lib.search import InvalidCursorError
+from lib.storage import review_counts_table
+import base64
+import json
+
+# Sort columns of GET /api/words, each matching an index (migrations/015);
+# the last column makes the order total so keyset pages never skip rows.
+# {correct_count} and {wrong_count} are filled in by review_count_columns.
+SORT_KEYS = {
+    'id': ["w.id"],
+    'spanish': ["w.spanish_key", "w.english"],
+    'english': ["w.english COLLATE NOCASE", "w.id"],
+    'correct_count': ["{correct_count}", "w.id"],
+    'wrong_count': ["{wrong_count}", "w.id"],
+}
+SORT_ORDERS = ('asc', 'desc')
+
+# Groups up to this size are read whole and sorted; larger groups walk
+# the sort index and keep the rows that are members
+GROUP_SORT_LIMIT = 5000
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+def decode_cursor(cursor, sort):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(values, list) or len(values) != len(SORT_KEYS[sort]) \
+                or not all(isinstance(value, (str, int)) for value in values):
+            raise TypeError
+        return values
+    except (ValueError, TypeError):
+        raise InvalidCursorError("Invalid cursor")
+
+def count_group_members(db, group_id):
+    """Members of a group, from the trigger-maintained counter (0 if no such group)"""
+    row = db.execute("SELECT words_count FROM groups WHERE id = ?", (group_id,)).fetchone()
+    return row[0] if row else 0
+
+def review_count_columns(db):
+    """Join and column expressions for a listed word's review counts.
+
+    The single-file layout keeps them on words, indexed for every sort
+    order. With a history file they are that history's (the learner's,
+    in the sharded layout) word_review_counts, which has no row for a
+    word never reviewed; sorting or filtering on them then sorts the
+    filtered words instead of walking an index.
+
+    Returns:
+        tuple: (join, {'correct_count', 'wrong_count', 'studied': SQL})
+    """
+    counts = review_counts_table(db)
+    if counts == 'words':
+        return "", {column: f"w.{column}" for column in ('correct_count', 'wrong_count', 'studied')}
+    return f"LEFT JOIN {counts} c ON c.word_id = w.id", {
+        column: f"IFNULL(c.{column}, 0)" for column in ('correct_count', 'wrong_count', 'studied')
+    }
+
+def word_list_source(db, group_id=None, studied=None):
+    """FROM and WHERE clauses (with parameters) for the filtered word list,
+    and the review count columns (see review_count_columns)"""
+    join, columns = review_count_columns(db)
+    conditions = []
+    params = []
+    source = "words w"
+    if group_id is not None:
+        if count_group_members(db, group_id) <= GROUP_SORT_LIMIT:
+            # CROSS JOIN keeps word_groups as the outer loop: read the group, then sort it
+            source = "word_groups wg CROSS JOIN words w ON w.id = wg.word_id"
+            conditions.append("wg.group_id = ?")
+        else:
+            conditions.append("EXISTS (SELECT 1 FROM word_groups wg WHERE wg.word_id = w.id AND wg.group_id = ?)")
+        params.append(group_id)
+    if join:
+        source = f"{source} {join}"
+    if studied is not None:
+        conditions.append(f"{columns['studied']} = ?")
+        params.append(int(studied))
+    return source, conditions, params, columns
+
+def count_words(db, group_id=None, studied=None):
+    if group_id is not None and studied is None:
+        return count_group_members(db, group_id)
+    source, conditions, params, _ = word_list_source(db, group_id, studied)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return db.execute(f"SELECT COUNT(*) FROM {source} {where}", params).fetchone()[0]
+
+def page_query(source, conditions, keys, direction, columns):
+    """SQL for a page of the word list, ending in LIMIT ? OFFSET ? for the caller to bind.
+
+    Rows carry their sort key values as k0, k1 for the next cursor.
+    """
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    key_columns = ', '.join(f"{key} AS k{i}" for i, key in enumerate(keys))
+    return f"""
+        SELECT w.id, w.spanish, w.pronunciation, w.english,
+               {columns['correct_count']} AS correct_count,
+               {columns['wrong_count']} AS wrong_count, {key_columns}
+        FROM {source}
+        {where}
+        ORDER BY {', '.join(f'{key} {direction}' for key in keys)}
+        LIMIT ? OFFSET ?
+    """
+
+def cursor_seeks(keys, values, order):
+    """Conditions selecting the rows after a cursor, in page order.
+
+    A (key, id) > (?, ?) row value only seeks on the key, stepping over
+    every row tied with the cursor, so two key-ordered seeks are used
+    instead: the rest of the tie, then everything past it.
+    """
+    comparison = '<' if order == 'desc' else '>'
+    seeks = []
+    if len(keys) == 2:
+        seeks.append((f"{keys[0]} = ? AND {keys[1]} {comparison} ?", values))
+    seeks.append((f"{keys[0]} {comparison} ?", values[:1]))
+    return seeks
+
+def list_words(db, limit, sort='id', order='asc', group_id=None, studied=None,
+               cursor=None, offset=0):
+    """One page of words in the requested order, continuing from `cursor` or `offset`.
+
+    Returns:
+        tuple: (words, next_cursor); next_cursor is None on the last page
+    """
+    source, conditions, params, columns = word_list_source(db, group_id, studied)
+    keys = [key.format(**columns) for key in SORT_KEYS[sort]]
+    direction = 'DESC' if order == 'desc' else 'ASC'
+    if cursor is None:
+        rows = db.execute(page_query(source, conditions, keys, direction, columns),
+                          params + [limit + 1, offset]).fetchall()
+    else:
+        rows = []
+        for condition, values in cursor_seeks(keys, decode_cursor(cursor, sort), order):
+            rows += db.execute(page_query(source, conditions + [condition], keys, direction, columns),
+                               params + values + [limit + 1 - len(rows), 0]).fetchall()
+            if len(rows) > limit:
+                break
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor([last[f"k{i}"] for i in range(len(SORT_KEYS[sort]))])
+
+    memberships = {}
+    if rows:
+        for word_id, member_of in db.execute(f"""
+            SELECT word_id, group_id FROM word_groups
+            WHERE word_id IN ({', '.join('?' * len(rows))})
+            ORDER BY group_id
+        """, [row['id'] for row in rows]):
+            memberships.setdefault(word_id, []).append(member_of)
+
+    words = []
+    for row in rows:
+        word = {key: row[key] for key in
+                ('id', 'spanish', 'pronunciation', 'english', 'correct_count', 'wrong_count')}
+        word['group_ids'] = memberships.get(row['id'], [])
+        words.append(word)
+    return words, next_cursor
@@ -0,0 +1,101 @@
+-- Change feed for offline sync. Each synced row keeps exactly one entry
+-- (its latest change), so the log stays compacted as rows are rewritten.
+CREATE TABLE IF NOT EXISTS change_log (
+    version INTEGER PRIMARY KEY AUTOINCREMENT,
+    table_name TEXT NOT NULL,
+    row_id INTEGER NOT NULL,
+    link_id INTEGER,  -- group_id for word_groups entries, NULL otherwise
+    deleted BOOLEAN NOT NULL DEFAULT 0
+);
+
+CREATE INDEX IF NOT EXISTS idx_change_log_row
+    ON change_log (table_name, row_id, link_id);
+
+-- words
+CREATE TRIGGER IF NOT EXISTS change_log_words_insert AFTER INSERT ON words
+BEGIN
+    DELETE FROM change_log WHERE table_name = 'words' AND row_id = NEW.id AND link_id IS NULL;
+    INSERT INTO change_log (table_name, row_id) VALUES ('words', NEW.id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS change_log_words_update AFTER UPDATE ON words
+BEGIN
+    DELETE FROM change_log WHERE table_name = 'words' AND row_id = NEW.id AND link_id IS NULL;
+    INSERT INTO change_log (table_name, row_id) VALUES ('words', NEW.id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS change_log_words_delete AFTER DELETE ON words
+BEGIN
+    DELETE FROM change_log WHERE table_name = 'words' AND row_id = OLD.id AND link_id IS NULL;
+    INSERT INTO change_log (table_name, row_id, deleted) VALUES ('words', OLD.id, 1);
+END;
+
+-- groups
+CREATE TRIGGER IF NOT EXISTS change_log_groups_insert AFTER INSERT ON groups
+BEGIN
+    DELETE FROM change_log WHERE table_name = 'groups' AND row_id = NEW.id AND link_id IS NULL;
+    INSERT INTO change_log (table_name, row_id) VALUES ('groups', NEW.id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS change_log_groups_update AFTER UPDATE ON groups
+BEGIN
+    DELETE FROM change_log WHERE table_name = 'groups' AND row_id = NEW.id AND link_id IS NULL;
+    INSERT INTO change_log (table_name, row_id) VALUES ('groups', NEW.id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS change_log_groups_delete AFTER DELETE ON groups
+BEGIN
+    DELETE FROM change_log WHERE table_name = 'groups' AND row_id = OLD.id AND link_id IS NULL;
+    INSERT INTO change_log (table_name, row_id, deleted) VALUES ('groups', OLD.id, 1);
+END;
+
+-- word_groups (keyed by word_id + group_id)
+CREATE TRIGGER IF NOT EXISTS change_log_word_groups_insert AFTER INSERT ON word_groups
+BEGIN
+    DELETE FROM change_log WHERE table_name = 'word_groups' AND row_id = NEW.word_id AND link_id = NEW.group_id;
+    INSERT INTO change_log (table_name, row_id, link_id) VALUES ('word_groups', NEW.word_id, NEW.group_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS change_log_word_groups_delete AFTER DELETE ON word_groups
+BEGIN
+    DELETE FROM change_log WHERE table_name = 'word_groups' AND row_id = OLD.word_id AND link_id = OLD.group_id;
+    INSERT INTO change_log (table_name, row_id, link_id, deleted) VALUES ('word_groups', OLD.word_id, OLD.group_id, 1);
+END;
+
+-- study_sessions
+CREATE TRIGGER IF NOT EXISTS change_log_study_sessions_insert AFTER INSERT ON study_sessions
+BEGIN
+    DELETE FROM change_log WHERE table_name = 'study_sessions' AND row_id = NEW.id AND link_id IS NULL;
+    INSERT INTO change_log (table_name, row_id) VALUES ('study_sessions', NEW.id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS change_log_study_sessions_update AFTER UPDATE ON study_sessions
+BEGIN
+    DELETE FROM change_log WHERE table_name = 'study_sessions' AND row_id = NEW.id AND link_id IS NULL;
+    INSERT INTO change_log (table_name, row_id) VALUES ('study_sessions', NEW.id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS change_log_study_sessions_delete AFTER DELETE ON study_sessions
+BEGIN
+    DELETE FROM change_log WHERE table_name = 'study_sessions' AND row_id = OLD.id AND link_id IS NULL;
+    INSERT INTO change_log (table_name, row_id, deleted) VALUES ('study_sessions', OLD.id, 1);
+END;
+
+-- word_review_items
+CREATE TRIGGER IF NOT EXISTS change_log_word_review_items_insert AFTER INSERT ON word_review_items
+BEGIN
+    DELETE FROM change_log WHERE table_name = 'word_review_items' AND row_id = NEW.id AND link_id IS NULL;
+    INSERT INTO change_log (table_name, row_id) VALUES ('word_review_items', NEW.id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS change_log_word_review_items_update AFTER UPDATE ON word_review_items
+BEGIN
+    DELETE FROM change_log WHERE table_name = 'word_review_items' AND row_id = NEW.id AND link_id IS NULL;
+    INSERT INTO change_log (table_name, row_id) VALUES ('word_review_items', NEW.id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS change_log_word_review_items_delete AFTER DELETE ON word_review_items
+BEGIN
+    DELETE FROM change_log WHERE table_name = 'word_review_items' AND row_id = OLD.id AND link_id IS NULL;
+    INSERT INTO change_log (table_name, row_id, deleted) VALUES ('word_review_items', OLD.id, 1);
+END;
@@ -0,0 +1,9 @@
+-- Client-generated ids make offline uploads idempotent: a retried upload
+-- hits the unique index instead of inserting the row twice.
+ALTER TABLE study_sessions ADD COLUMN client_id TEXT;
+ALTER TABLE word_review_items ADD COLUMN client_id TEXT;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_study_sessions_client_id
+    ON study_sessions (client_id);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_word_review_items_client_id
+    ON word_review_items (client_id);
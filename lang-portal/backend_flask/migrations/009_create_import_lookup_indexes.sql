@@ -0,0 +1,5 @@
+-- Lookups used by bulk imports to skip words and memberships that already exist
+CREATE INDEX IF NOT EXISTS idx_words_spanish_english
+    ON words (spanish, english);
+CREATE INDEX IF NOT EXISTS idx_word_groups_word_group
+    ON word_groups (word_id, group_id);
@@ -0,0 +1,14 @@
+-- Progress of tasks.seed_db, committed together with each batch so an
+-- interrupted load can resume where it stopped.
+CREATE TABLE IF NOT EXISTS seed_checkpoints (
+    file_name TEXT PRIMARY KEY,
+    position INTEGER NOT NULL DEFAULT 0,
+    completed BOOLEAN NOT NULL DEFAULT 0
+);
+
+-- Secondary indexes dropped for the duration of a seed load and rebuilt
+-- once it finishes (kept here so a resumed load can still rebuild them).
+CREATE TABLE IF NOT EXISTS seed_deferred_indexes (
+    name TEXT PRIMARY KEY,
+    sql TEXT NOT NULL
+);
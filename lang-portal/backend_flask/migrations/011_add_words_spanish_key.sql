@@ -0,0 +1,51 @@
+-- Accent- and case-folded key for the Spanish text. Must stay in sync with
+-- lib/normalize.py (spanish_key_sql() / normalize_key); word text is
+-- written in NFC so the replacements below see precomposed accents. A
+-- virtual generated column keeps the key out of the row; the unique index
+-- below stores it.
+ALTER TABLE words ADD COLUMN spanish_key TEXT GENERATED ALWAYS AS (
+    lower(replace(replace(replace(replace(replace(replace(replace(replace(replace(replace(replace(replace(replace(replace(trim(spanish), 'á', 'a'), 'é', 'e'), 'í', 'i'), 'ó', 'o'), 'ú', 'u'), 'ü', 'u'), 'ñ', 'n'), 'Á', 'a'), 'É', 'e'), 'Í', 'i'), 'Ó', 'o'), 'Ú', 'u'), 'Ü', 'u'), 'Ñ', 'n'))
+) VIRTUAL;
+
+-- Merge existing duplicates into the lowest id before enforcing uniqueness
+CREATE TEMP TABLE word_duplicates AS
+SELECT w.id AS duplicate_id, k.keep_id
+FROM words w
+JOIN (
+    SELECT spanish_key, english, MIN(id) AS keep_id
+    FROM words
+    GROUP BY spanish_key, english
+    HAVING COUNT(*) > 1
+) k ON k.spanish_key = w.spanish_key AND k.english = w.english
+WHERE w.id <> k.keep_id;
+
+UPDATE word_review_items
+SET word_id = (SELECT keep_id FROM word_duplicates WHERE duplicate_id = word_id)
+WHERE word_id IN (SELECT duplicate_id FROM word_duplicates);
+
+DELETE FROM word_groups
+WHERE word_id IN (SELECT duplicate_id FROM word_duplicates)
+  AND EXISTS (
+      SELECT 1 FROM word_groups keep
+      JOIN word_duplicates d ON d.keep_id = keep.word_id
+      WHERE d.duplicate_id = word_groups.word_id
+        AND keep.group_id = word_groups.group_id
+  );
+
+UPDATE word_groups
+SET word_id = (SELECT keep_id FROM word_duplicates WHERE duplicate_id = word_id)
+WHERE word_id IN (SELECT duplicate_id FROM word_duplicates);
+
+DELETE FROM words WHERE id IN (SELECT duplicate_id FROM word_duplicates);
+
+UPDATE groups
+SET words_count = (SELECT COUNT(*) FROM word_groups WHERE group_id = groups.id)
+WHERE EXISTS (SELECT 1 FROM word_duplicates);
+
+DROP TABLE word_duplicates;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_words_spanish_key_english
+    ON words (spanish_key, english);
+
+-- Superseded by the unique index above
+DROP INDEX IF EXISTS idx_words_spanish_english;
@@ -0,0 +1,38 @@
+-- Full-text index over words for GET /api/words/search. External content:
+-- the index stores only tokens and reads column values back from words.
+-- remove_diacritics folds accents (and ñ) so 'cancion' finds 'canción';
+-- the prefix indexes make 'grac*' style queries index lookups.
+CREATE VIRTUAL TABLE IF NOT EXISTS words_fts USING fts5(
+    spanish,
+    english,
+    pronunciation,
+    content='words',
+    content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2',
+    prefix='2 3 4'
+);
+
+-- Rank Spanish matches above English, pronunciation last
+INSERT INTO words_fts (words_fts, rank) VALUES ('rank', 'bm25(10.0, 5.0, 1.0)');
+
+INSERT INTO words_fts (words_fts) VALUES ('rebuild');
+
+CREATE TRIGGER IF NOT EXISTS words_fts_insert AFTER INSERT ON words
+BEGIN
+    INSERT INTO words_fts (rowid, spanish, english, pronunciation)
+    VALUES (new.id, new.spanish, new.english, new.pronunciation);
+END;
+
+CREATE TRIGGER IF NOT EXISTS words_fts_delete AFTER DELETE ON words
+BEGIN
+    INSERT INTO words_fts (words_fts, rowid, spanish, english, pronunciation)
+    VALUES ('delete', old.id, old.spanish, old.english, old.pronunciation);
+END;
+
+CREATE TRIGGER IF NOT EXISTS words_fts_update AFTER UPDATE OF spanish, english, pronunciation ON words
+BEGIN
+    INSERT INTO words_fts (words_fts, rowid, spanish, english, pronunciation)
+    VALUES ('delete', old.id, old.spanish, old.english, old.pronunciation);
+    INSERT INTO words_fts (rowid, spanish, english, pronunciation)
+    VALUES (new.id, new.spanish, new.english, new.pronunciation);
+END;
@@ -0,0 +1,74 @@
+-- Trigram inverted index for typo-tolerant search (GET /api/words/fuzzy).
+-- Forms are the folded spanish_key and lower(trim(english)), padded as
+-- '  ' || form || ' ' so the first letters and the ending get their own
+-- trigrams. Keying postings by form length lets a lookup only read words
+-- whose length is within the allowed edit distance.
+CREATE TABLE IF NOT EXISTS word_trigrams (
+    trigram TEXT NOT NULL,
+    length INTEGER NOT NULL,
+    word_id INTEGER NOT NULL,
+    PRIMARY KEY (trigram, length, word_id)
+) WITHOUT ROWID;
+
+-- Triggers cannot use recursive CTEs, so trigram positions come from a
+-- numbers table; forms longer than 255 characters are only partly indexed
+CREATE TABLE IF NOT EXISTS trigram_positions (
+    n INTEGER PRIMARY KEY
+);
+
+WITH RECURSIVE positions(n) AS (
+    SELECT 1 UNION ALL SELECT n + 1 FROM positions WHERE n < 256
+)
+INSERT OR IGNORE INTO trigram_positions (n) SELECT n FROM positions;
+
+-- Same statement as lib/fuzzy.py REBUILD_TRIGRAMS_SQL
+WITH forms (word_id, padded) AS MATERIALIZED (
+    SELECT id, '  ' || spanish_key || ' ' FROM words
+    UNION ALL
+    SELECT id, '  ' || lower(trim(english)) || ' ' FROM words
+)
+INSERT OR IGNORE INTO word_trigrams (trigram, length, word_id)
+SELECT substr(f.padded, p.n, 3), length(f.padded) - 3, f.word_id
+FROM forms f JOIN trigram_positions p ON p.n <= length(f.padded) - 2
+ORDER BY 1, 2, 3;
+
+CREATE TRIGGER IF NOT EXISTS word_trigrams_insert AFTER INSERT ON words
+BEGIN
+    INSERT OR IGNORE INTO word_trigrams (trigram, length, word_id)
+    SELECT substr('  ' || NEW.spanish_key || ' ', n, 3), length(NEW.spanish_key), NEW.id
+    FROM trigram_positions WHERE n <= length(NEW.spanish_key) + 1
+    UNION ALL
+    SELECT substr('  ' || lower(trim(NEW.english)) || ' ', n, 3), length(trim(NEW.english)), NEW.id
+    FROM trigram_positions WHERE n <= length(trim(NEW.english)) + 1;
+END;
+
+-- Deletes recompute the old trigrams so they can go through the primary key
+CREATE TRIGGER IF NOT EXISTS word_trigrams_delete AFTER DELETE ON words
+BEGIN
+    DELETE FROM word_trigrams
+    WHERE word_id = OLD.id
+      AND ((length = length(OLD.spanish_key) AND trigram IN (
+                SELECT substr('  ' || OLD.spanish_key || ' ', n, 3)
+                FROM trigram_positions WHERE n <= length(OLD.spanish_key) + 1))
+        OR (length = length(trim(OLD.english)) AND trigram IN (
+                SELECT substr('  ' || lower(trim(OLD.english)) || ' ', n, 3)
+                FROM trigram_positions WHERE n <= length(trim(OLD.english)) + 1)));
+END;
+
+CREATE TRIGGER IF NOT EXISTS word_trigrams_update AFTER UPDATE OF spanish, english ON words
+BEGIN
+    DELETE FROM word_trigrams
+    WHERE word_id = OLD.id
+      AND ((length = length(OLD.spanish_key) AND trigram IN (
+                SELECT substr('  ' || OLD.spanish_key || ' ', n, 3)
+                FROM trigram_positions WHERE n <= length(OLD.spanish_key) + 1))
+        OR (length = length(trim(OLD.english)) AND trigram IN (
+                SELECT substr('  ' || lower(trim(OLD.english)) || ' ', n, 3)
+                FROM trigram_positions WHERE n <= length(trim(OLD.english)) + 1)));
+    INSERT OR IGNORE INTO word_trigrams (trigram, length, word_id)
+    SELECT substr('  ' || NEW.spanish_key || ' ', n, 3), length(NEW.spanish_key), NEW.id
+    FROM trigram_positions WHERE n <= length(NEW.spanish_key) + 1
+    UNION ALL
+    SELECT substr('  ' || lower(trim(NEW.english)) || ' ', n, 3), length(trim(NEW.english)), NEW.id
+    FROM trigram_positions WHERE n <= length(trim(NEW.english)) + 1;
+END;
@@ -0,0 +1,11 @@
+-- Session history (GET /api/study_sessions and the per group / per activity
+-- listings) filters by group or activity and pages newest first. With the
+-- filter column ahead of created_at, each filter is one index range already
+-- in display order; the rowid at the end of every index entry breaks ties.
+CREATE INDEX IF NOT EXISTS idx_study_sessions_group_created
+    ON study_sessions (group_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_study_sessions_activity_created
+    ON study_sessions (study_activity_id, created_at);
+-- Unfiltered and date-only history
+CREATE INDEX IF NOT EXISTS idx_study_sessions_created
+    ON study_sessions (created_at);
@@ -0,0 +1,80 @@
+-- Per-word review counts for sorting and filtering GET /api/words, kept up
+-- to date by triggers on word_review_items (a counter cache like
+-- groups.words_count). studied is virtual, so only its indexes store it.
+ALTER TABLE words ADD COLUMN correct_count INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE words ADD COLUMN wrong_count INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE words ADD COLUMN studied BOOLEAN GENERATED ALWAYS AS (
+    correct_count + wrong_count > 0
+) VIRTUAL;
+
+UPDATE words
+SET correct_count = r.correct_count, wrong_count = r.wrong_count
+FROM (
+    SELECT word_id,
+           SUM(correct <> 0) AS correct_count,
+           SUM(correct = 0) AS wrong_count
+    FROM word_review_items
+    GROUP BY word_id
+) r
+WHERE r.word_id = words.id;
+
+CREATE TRIGGER IF NOT EXISTS word_review_counts_insert AFTER INSERT ON word_review_items
+BEGIN
+    UPDATE words
+    SET correct_count = correct_count + (NEW.correct <> 0),
+        wrong_count = wrong_count + (NEW.correct = 0)
+    WHERE id = NEW.word_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS word_review_counts_delete AFTER DELETE ON word_review_items
+BEGIN
+    UPDATE words
+    SET correct_count = correct_count - (OLD.correct <> 0),
+        wrong_count = wrong_count - (OLD.correct = 0)
+    WHERE id = OLD.word_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS word_review_counts_update AFTER UPDATE OF word_id, correct ON word_review_items
+BEGIN
+    UPDATE words
+    SET correct_count = correct_count - (OLD.correct <> 0),
+        wrong_count = wrong_count - (OLD.correct = 0)
+    WHERE id = OLD.word_id;
+    UPDATE words
+    SET correct_count = correct_count + (NEW.correct <> 0),
+        wrong_count = wrong_count + (NEW.correct = 0)
+    WHERE id = NEW.word_id;
+END;
+
+-- Counts are not synced, so only changes to synced columns go to the feed
+DROP TRIGGER IF EXISTS change_log_words_update;
+CREATE TRIGGER IF NOT EXISTS change_log_words_update AFTER UPDATE OF spanish, pronunciation, english ON words
+BEGIN
+    DELETE FROM change_log WHERE table_name = 'words' AND row_id = NEW.id AND link_id IS NULL;
+    INSERT INTO change_log (table_name, row_id) VALUES ('words', NEW.id);
+END;
+
+-- One index per sort order, and again behind studied for the filtered
+-- list, so every page is an index seek in order. Spanish order uses the
+-- existing unique (spanish_key, english) index; the rowid every index
+-- ends with orders ties for the others and lets a cursor seek within a tie.
+CREATE INDEX IF NOT EXISTS idx_words_english
+    ON words (english COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idx_words_correct_count
+    ON words (correct_count);
+CREATE INDEX IF NOT EXISTS idx_words_wrong_count
+    ON words (wrong_count);
+CREATE INDEX IF NOT EXISTS idx_words_studied
+    ON words (studied);
+CREATE INDEX IF NOT EXISTS idx_words_studied_spanish
+    ON words (studied, spanish_key, english);
+CREATE INDEX IF NOT EXISTS idx_words_studied_english
+    ON words (studied, english COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idx_words_studied_correct_count
+    ON words (studied, correct_count);
+CREATE INDEX IF NOT EXISTS idx_words_studied_wrong_count
+    ON words (studied, wrong_count);
+
+-- Group members, for the group filter and its size probe
+CREATE INDEX IF NOT EXISTS idx_word_groups_group_word
+    ON word_groups (group_id, word_id);
@@ -0,0 +1,42 @@
+-- Memberships keyed by (group_id, word_id) in a WITHOUT ROWID table: the
+-- surrogate id is gone, a pair can only be stored once, and a group's
+-- members are one contiguous range of the table itself.
+CREATE TABLE word_groups_new (
+    group_id INTEGER NOT NULL,
+    word_id INTEGER NOT NULL,
+    PRIMARY KEY (group_id, word_id),
+    FOREIGN KEY (word_id) REFERENCES words(id) ON DELETE CASCADE,
+    FOREIGN KEY (group_id) REFERENCES groups(id) ON DELETE CASCADE
+) WITHOUT ROWID;
+
+-- Duplicate pairs collapse into one; rows pointing at missing words or
+-- groups (left behind while foreign keys were off) are dropped
+INSERT OR IGNORE INTO word_groups_new (group_id, word_id)
+SELECT wg.group_id, wg.word_id
+FROM word_groups wg
+WHERE EXISTS (SELECT 1 FROM words w WHERE w.id = wg.word_id)
+  AND EXISTS (SELECT 1 FROM groups g WHERE g.id = wg.group_id);
+
+-- Also drops the old indexes and the change_log triggers on word_groups
+DROP TABLE word_groups;
+ALTER TABLE word_groups_new RENAME TO word_groups;
+
+-- Reverse lookup (a word's groups); the primary key completes the entry,
+-- so this is effectively (word_id, group_id)
+CREATE INDEX IF NOT EXISTS idx_word_groups_word_group
+    ON word_groups (word_id);
+
+UPDATE groups
+SET words_count = (SELECT COUNT(*) FROM word_groups WHERE group_id = groups.id);
+
+CREATE TRIGGER IF NOT EXISTS change_log_word_groups_insert AFTER INSERT ON word_groups
+BEGIN
+    DELETE FROM change_log WHERE table_name = 'word_groups' AND row_id = NEW.word_id AND link_id = NEW.group_id;
+    INSERT INTO change_log (table_name, row_id, link_id) VALUES ('word_groups', NEW.word_id, NEW.group_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS change_log_word_groups_delete AFTER DELETE ON word_groups
+BEGIN
+    DELETE FROM change_log WHERE table_name = 'word_groups' AND row_id = OLD.word_id AND link_id = OLD.group_id;
+    INSERT INTO change_log (table_name, row_id, link_id, deleted) VALUES ('word_groups', OLD.word_id, OLD.group_id, 1);
+END;
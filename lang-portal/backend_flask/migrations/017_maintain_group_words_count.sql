@@ -0,0 +1,25 @@
+-- groups.words_count is maintained here rather than by each code path that
+-- writes word_groups. Foreign key cascades (deleting a word or a group)
+-- fire these triggers too; decrementing a group that is being deleted is
+-- a no-op.
+CREATE TRIGGER IF NOT EXISTS group_words_count_insert AFTER INSERT ON word_groups
+BEGIN
+    UPDATE groups SET words_count = words_count + 1 WHERE id = NEW.group_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS group_words_count_delete AFTER DELETE ON word_groups
+BEGIN
+    UPDATE groups SET words_count = words_count - 1 WHERE id = OLD.group_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS group_words_count_update AFTER UPDATE OF group_id ON word_groups
+WHEN NEW.group_id <> OLD.group_id
+BEGIN
+    UPDATE groups SET words_count = words_count - 1 WHERE id = OLD.group_id;
+    UPDATE groups SET words_count = words_count + 1 WHERE id = NEW.group_id;
+END;
+
+-- Start from the true counts (seeded groups were left at 0)
+UPDATE groups
+SET words_count = (SELECT COUNT(*) FROM word_groups WHERE group_id = groups.id)
+WHERE words_count IS NOT (SELECT COUNT(*) FROM word_groups WHERE group_id = groups.id);
@@ -0,0 +1,83 @@
+-- Integer timestamps for the history tables. created_at stays as the text
+-- the API returns; created_ts is the same instant in epoch seconds and
+-- created_day its UTC day (created_ts / 86400), so date filters and the
+-- dashboard streak compare integers instead of parsing text. Must stay in
+-- sync with lib/timestamps.py.
+ALTER TABLE study_sessions ADD COLUMN created_ts INTEGER;
+ALTER TABLE study_sessions ADD COLUMN created_day INTEGER;
+ALTER TABLE word_review_items ADD COLUMN created_ts INTEGER;
+ALTER TABLE word_review_items ADD COLUMN created_day INTEGER;
+
+-- The application writes all three columns. These cover other writers
+-- (and created_at edits); existing rows are filled in batches by
+-- lib/timestamps.backfill_timestamps (run by `invoke migrate`) rather
+-- than one long UPDATE here.
+CREATE TRIGGER IF NOT EXISTS study_sessions_created_ts_insert AFTER INSERT ON study_sessions
+WHEN NEW.created_ts IS NULL
+BEGIN
+    UPDATE study_sessions
+    SET created_ts = CAST(strftime('%s', NEW.created_at) AS INTEGER),
+        created_day = CAST(strftime('%s', NEW.created_at) AS INTEGER) / 86400
+    WHERE id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS study_sessions_created_ts_update AFTER UPDATE OF created_at ON study_sessions
+BEGIN
+    UPDATE study_sessions
+    SET created_ts = CAST(strftime('%s', NEW.created_at) AS INTEGER),
+        created_day = CAST(strftime('%s', NEW.created_at) AS INTEGER) / 86400
+    WHERE id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS word_review_items_created_ts_insert AFTER INSERT ON word_review_items
+WHEN NEW.created_ts IS NULL
+BEGIN
+    UPDATE word_review_items
+    SET created_ts = CAST(strftime('%s', NEW.created_at) AS INTEGER),
+        created_day = CAST(strftime('%s', NEW.created_at) AS INTEGER) / 86400
+    WHERE id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS word_review_items_created_ts_update AFTER UPDATE OF created_at ON word_review_items
+BEGIN
+    UPDATE word_review_items
+    SET created_ts = CAST(strftime('%s', NEW.created_at) AS INTEGER),
+        created_day = CAST(strftime('%s', NEW.created_at) AS INTEGER) / 86400
+    WHERE id = NEW.id;
+END;
+
+-- The derived columns are not synced, so filling them must not put every
+-- row back on the change feed
+DROP TRIGGER IF EXISTS change_log_study_sessions_update;
+CREATE TRIGGER IF NOT EXISTS change_log_study_sessions_update
+AFTER UPDATE OF group_id, study_activity_id, created_at, completed_at, client_id ON study_sessions
+BEGIN
+    DELETE FROM change_log WHERE table_name = 'study_sessions' AND row_id = NEW.id AND link_id IS NULL;
+    INSERT INTO change_log (table_name, row_id) VALUES ('study_sessions', NEW.id);
+END;
+
+DROP TRIGGER IF EXISTS change_log_word_review_items_update;
+CREATE TRIGGER IF NOT EXISTS change_log_word_review_items_update
+AFTER UPDATE OF word_id, study_session_id, correct, created_at, client_id ON word_review_items
+BEGIN
+    DELETE FROM change_log WHERE table_name = 'word_review_items' AND row_id = NEW.id AND link_id IS NULL;
+    INSERT INTO change_log (table_name, row_id) VALUES ('word_review_items', NEW.id);
+END;
+
+-- Session history pages newest first within a group, an activity or a
+-- created_ts range (migration 014 did the same on created_at)
+DROP INDEX IF EXISTS idx_study_sessions_group_created;
+DROP INDEX IF EXISTS idx_study_sessions_activity_created;
+DROP INDEX IF EXISTS idx_study_sessions_created;
+CREATE INDEX IF NOT EXISTS idx_study_sessions_group_created_ts
+    ON study_sessions (group_id, created_ts);
+CREATE INDEX IF NOT EXISTS idx_study_sessions_activity_created_ts
+    ON study_sessions (study_activity_id, created_ts);
+CREATE INDEX IF NOT EXISTS idx_study_sessions_created_ts
+    ON study_sessions (created_ts);
+
+-- Days studied (dashboard streak) and reviews per day
+CREATE INDEX IF NOT EXISTS idx_study_sessions_created_day
+    ON study_sessions (created_day);
+CREATE INDEX IF NOT EXISTS idx_word_review_items_created_day
+    ON word_review_items (created_day);
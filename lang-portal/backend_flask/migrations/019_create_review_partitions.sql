@@ -0,0 +1,43 @@
+-- Monthly review partitions (lib/partitions.py). word_review_items stays
+-- the table new reviews go to; older months are moved into
+-- word_review_items_YYYY_MM tables, in this database ('main') or in the
+-- attached archive database ('archive'). Each partition covers
+-- created_ts >= start_ts AND created_ts < end_ts.
+CREATE TABLE IF NOT EXISTS review_partitions (
+    name TEXT PRIMARY KEY,
+    location TEXT NOT NULL CHECK (location IN ('main', 'archive')),
+    start_ts INTEGER NOT NULL,
+    end_ts INTEGER NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_review_partitions_end
+    ON review_partitions (end_ts);
+
+-- Holds a row only while partition_reviews deletes reviews it has just
+-- copied into a partition, so the delete triggers below skip them
+CREATE TABLE IF NOT EXISTS review_partition_moves (
+    id INTEGER PRIMARY KEY
+);
+
+DROP TRIGGER IF EXISTS word_review_counts_delete;
+CREATE TRIGGER IF NOT EXISTS word_review_counts_delete AFTER DELETE ON word_review_items
+WHEN NOT EXISTS (SELECT 1 FROM review_partition_moves)
+BEGIN
+    UPDATE words
+    SET correct_count = correct_count - (OLD.correct <> 0),
+        wrong_count = wrong_count - (OLD.correct = 0)
+    WHERE id = OLD.word_id;
+END;
+
+DROP TRIGGER IF EXISTS change_log_word_review_items_delete;
+CREATE TRIGGER IF NOT EXISTS change_log_word_review_items_delete AFTER DELETE ON word_review_items
+WHEN NOT EXISTS (SELECT 1 FROM review_partition_moves)
+BEGIN
+    DELETE FROM change_log WHERE table_name = 'word_review_items' AND row_id = OLD.id AND link_id IS NULL;
+    INSERT INTO change_log (table_name, row_id, deleted) VALUES ('word_review_items', OLD.id, 1);
+END;
+
+-- Session words and stats read one session's reviews; partitions get the
+-- same index when they are created
+CREATE INDEX IF NOT EXISTS idx_word_review_items_session
+    ON word_review_items (study_session_id);
@@ -1,17 +1,23 @@
-from flask import jsonify, request
-from lib.db import get_db
+from flask import jsonify, request, current_app
+from lib.backups import BackupInProgressError, list_backups
+from lib.db import get_db, other_learner_dbs, review_archive_path
+from lib.importer import InvalidWordError, import_vocabulary_file
+from lib.partitions import clear_history
+from lib.replication import replication_status
+from lib.storage import shard_archive_path
+import csv
 import sqlite3
+import os
+import tempfile
+
+IMPORT_EXTENSIONS = ('.apkg', '.json', '.ndjson', '.jsonl', '.csv', '.tsv', '.txt')
 
 def register_routes(app):
     @app.route('/api/reset_history', methods=['POST'])
     def reset_history():
         try:
             with get_db() as db:
-                cursor = db.cursor()
-                cursor.executescript("""
-                    DELETE FROM word_review_items;
-                    DELETE FROM study_sessions;
-                """)
+                clear_history(db, review_archive_path())
                 db.commit()
                 
                 return jsonify({
@@ -27,11 +33,16 @@ def register_routes(app):
     @app.route('/api/full_reset', methods=['POST'])
     def full_reset():
         try:
+            # The vocabulary is shared, so every other learner's history
+            # (which refers to it) is cleared too, through the shard router's
+            # connections rather than by removing files they may hold open
+            for learner, shard in other_learner_dbs():
+                clear_history(shard, shard_archive_path(current_app.config['SHARD_DIR'], learner))
+                shard.commit()
+
             with get_db() as db:
-                cursor = db.cursor()
-                cursor.executescript("""
-                    DELETE FROM word_review_items;
-                    DELETE FROM study_sessions;
+                clear_history(db, review_archive_path())
+                db.executescript("""
                     DELETE FROM word_groups;
                     DELETE FROM words;
                     DELETE FROM groups;
@@ -46,4 +57,95 @@ def register_routes(app):
             return jsonify({
                 "error": "Database error",
                 "message": str(e)
-            }), 500 
\ No newline at end of file
+            }), 500
+
+    @app.route('/api/admin/import', methods=['POST'])
+    def import_vocabulary():
+        upload = request.files.get('file')
+        if upload is None or not upload.filename:
+            return jsonify({
+                "error": "Missing file"
+            }), 400
+
+        extension = os.path.splitext(upload.filename)[1].lower()
+        if extension not in IMPORT_EXTENSIONS:
+            return jsonify({
+                "error": "Unsupported file type",
+                "message": f"Supported types: {', '.join(IMPORT_EXTENSIONS)}"
+            }), 400
+
+        columns = request.form.get('columns')
+        fields = request.form.get('fields')
+        try:
+            fields = dict(pair.split('=', 1) for pair in fields.split(',')) if fields else None
+        except ValueError:
+            return jsonify({
+                "error": "Invalid field mapping",
+                "message": "fields must look like spanish=Front,english=Back"
+            }), 400
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'upload' + extension)
+            upload.save(path)
+            try:
+                result = import_vocabulary_file(
+                    get_db(), path,
+                    request.form.get('group_id', type=int),
+                    request.form.get('group_name') or os.path.splitext(upload.filename)[0],
+                    columns=columns.split(',') if columns else None,
+                    fields=fields,
+                    batch_size=current_app.config['IMPORT_BATCH_SIZE']
+                )
+            except LookupError:
+                return jsonify({
+                    "error": "Group not found"
+                }), 404
+            except InvalidWordError as e:
+                return jsonify({
+                    "error": "Invalid word",
+                    "message": str(e)
+                }), 400
+            except (ValueError, csv.Error) as e:
+                return jsonify({
+                    "error": "Invalid import file",
+                    "message": str(e)
+                }), 400
+            except sqlite3.Error as e:
+                return jsonify({
+                    "error": "Database error",
+                    "message": str(e)
+                }), 500
+
+        return jsonify({
+            "success": True,
+            **result
+        })
+
+    @app.route('/api/admin/replication')
+    def get_replication_status():
+        return jsonify(replication_status(
+            current_app.config['REPLICATION_DIR'],
+            current_app.config.get('REPLICA_DIR')
+        ))
+
+    @app.route('/api/admin/backup', methods=['POST'])
+    def start_backup():
+        try:
+            current_app.extensions['backups'].start()
+        except BackupInProgressError:
+            return jsonify({
+                "error": "Backup in progress"
+            }), 409
+        return jsonify({
+            "success": True,
+            "message": "Backup started"
+        }), 202
+
+    @app.route('/api/admin/backup')
+    def get_backups():
+        runner = current_app.extensions['backups']
+        return jsonify({
+            "running": runner.running,
+            "last": runner.last,
+            "backups": list_backups(current_app.config['BACKUP_DIR'])
+        })
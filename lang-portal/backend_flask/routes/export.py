@@ -0,0 +1,267 @@
+from flask import jsonify, request, current_app, g, Response, send_file, send_from_directory
+from lib.db import get_db, history_db_path, open_connection, review_archive_path
+from lib.columnar import export_review_history, read_state
+from lib.vocab_pack import build_vocab_pack, get_pack
+from lib.partitions import HOT_TABLE, HISTORY_VIEW, create_history_view
+from lib.storage import history_schema
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
+import sqlite3
+import json
+import csv
+import io
+import zlib
+import os
+
+# Exportable tables: rows are streamed in id order, `since` is an id cursor
+EXPORT_TABLES = {
+    'words': ('id', 'spanish', 'pronunciation', 'english'),
+    'groups': ('id', 'name', 'words_count'),
+    'word_groups': ('group_id', 'word_id'),
+    'study_sessions': ('id', 'group_id', 'study_activity_id', 'created_at', 'completed_at'),
+    'word_review_items': ('id', 'word_id', 'study_session_id', 'correct', 'created_at'),
+}
+
+# Tables without an id stream in primary key order; `since` is a cursor on
+# the first key column (a group id for word_groups)
+EXPORT_KEYS = {
+    'word_groups': ('group_id', 'word_id'),
+}
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+# Times a pack download re-maps a pack that was rebuilt while opening it
+PACK_OPEN_ATTEMPTS = 3
+
+def review_export_dir():
+    """Columnar export directory of the current request's reviews; each
+    learner gets their own in the sharded layout"""
+    directory = current_app.config['REVIEW_EXPORT_DIR']
+    if current_app.config.get('STORAGE_LAYOUT') == 'sharded':
+        return os.path.join(directory, g.learner)
+    return directory
+
+def open_snapshot(db_path, journal_mode, archive_path=None, history_path=None):
+    """Open a connection holding a read transaction for the whole export.
+
+    In WAL mode the snapshot does not block writers; rows committed after
+    the first read are simply not part of the export. With an archive
+    path, the word_review_history view over every review partition is
+    created first. In the split storage layout the snapshot of the history
+    file starts with the first read of a history table.
+    """
+    conn = open_connection(db_path, journal_mode, history_path,
+                           isolation_level=None, check_same_thread=False)
+    if archive_path:
+        create_history_view(conn, archive_path)
+    conn.execute("BEGIN")
+    return conn
+
+def stream_rows(conn, table, columns, since, until, batch_size):
+    """Yield batches of rows with fetchmany so memory stays flat"""
+    keys = EXPORT_KEYS.get(table, ('id',))
+    cursor = conn.execute(f"""
+        SELECT {', '.join(columns)}
+        FROM {table}
+        WHERE {keys[0]} > ? AND {keys[0]} <= ?
+        ORDER BY {', '.join(keys)}
+    """, (since, until))
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        yield rows
+
+def encode_ndjson(columns, batches):
+    for rows in batches:
+        yield ''.join(
+            json.dumps(dict(zip(columns, row)), ensure_ascii=False) + '\n'
+            for row in rows
+        ).encode('utf-8')
+
+def encode_csv(columns, batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for rows in batches:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # 31 = gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def register_routes(app):
+    @app.route('/api/export/<table>')
+    def export_table(table):
+        if table not in EXPORT_TABLES:
+            return jsonify({
+                "error": "Unknown table",
+                "message": f"Exportable tables: {', '.join(EXPORT_TABLES)}"
+            }), 404
+
+        export_format = request.args.get('format', 'ndjson')
+        if export_format not in EXPORT_FORMATS:
+            return jsonify({
+                "error": "Invalid format",
+                "message": "format must be ndjson or csv"
+            }), 400
+
+        since = request.args.get('since', 0, type=int)
+        columns = EXPORT_TABLES[table]
+
+        # Reviews are read across every partition
+        partitioned = table == HOT_TABLE
+
+        try:
+            conn = open_snapshot(current_app.config['SQLITE_DB_PATH'],
+                                 current_app.config.get('SQLITE_JOURNAL_MODE'),
+                                 review_archive_path() if partitioned else None,
+                                 history_db_path(current_app.config, g.get('learner')))
+            try:
+                # Pin the upper bound inside the snapshot so the response
+                # header and the streamed rows agree. Review ids come from
+                # the hot table's AUTOINCREMENT, so its sequence is the
+                # highest id in any partition.
+                key = EXPORT_KEYS.get(table, ('id',))[0]
+                if partitioned:
+                    until = conn.execute(f"""
+                        SELECT COALESCE(MAX(seq), 0) FROM {history_schema(conn)}.sqlite_sequence
+                        WHERE name = ?
+                    """, (table,)).fetchone()[0]
+                else:
+                    until = conn.execute(f"SELECT COALESCE(MAX({key}), 0) FROM {table}").fetchone()[0]
+            except sqlite3.Error:
+                conn.close()
+                raise
+        except sqlite3.Error as e:
+            return jsonify({
+                "error": "Database error",
+                "message": str(e)
+            }), 500
+
+        batches = stream_rows(conn, HISTORY_VIEW if partitioned else table, columns, since, until,
+                              current_app.config['EXPORT_BATCH_SIZE'])
+        encode = encode_ndjson if export_format == 'ndjson' else encode_csv
+        body = encode(columns, batches)
+
+        headers = {
+            "Content-Disposition": f"attachment; filename={table}.{export_format}",
+            "X-Export-Since": str(since),
+            "X-Export-Until": str(until),
+        }
+        if 'gzip' in request.accept_encodings:
+            body = gzip_chunks(body)
+            headers["Content-Encoding"] = "gzip"
+            headers["Vary"] = "Accept-Encoding"
+
+        response = Response(body, mimetype=EXPORT_FORMATS[export_format], headers=headers)
+        # Ends the snapshot when the server is done with the body, even if
+        # the client disconnects before the last row
+        response.call_on_close(conn.close)
+        return response
+
+    @app.route('/api/export/columnar', methods=['POST'])
+    def export_columnar_reviews():
+        try:
+            result = export_review_history(
+                get_db(),
+                review_export_dir(),
+                request.args.get('format', 'auto'),
+                archive_path=review_archive_path()
+            )
+            return jsonify({
+                "success": True,
+                **result
+            })
+        except ValueError as e:
+            return jsonify({
+                "error": "Invalid format",
+                "message": str(e)
+            }), 400
+        except sqlite3.Error as e:
+            return jsonify({
+                "error": "Database error",
+                "message": str(e)
+            }), 500
+
+    @app.route('/api/export/columnar')
+    def list_columnar_reviews():
+        return jsonify(read_state(review_export_dir()))
+
+    @app.route('/api/export/columnar/<month>/<filename>')
+    def download_columnar_reviews(month, filename):
+        # send_from_directory rejects paths escaping the export directory
+        return send_from_directory(
+            os.path.join(review_export_dir(), month),
+            filename,
+            as_attachment=True
+        )
+
+    @app.route('/api/export/pack', methods=['POST'])
+    def build_pack():
+        try:
+            result = build_vocab_pack(get_db(), current_app.config['VOCAB_PACK_PATH'])
+            return jsonify({
+                "success": True,
+                **result
+            })
+        except sqlite3.Error as e:
+            return jsonify({
+                "error": "Database error",
+                "message": str(e)
+            }), 500
+
+    @app.route('/api/export/pack')
+    def download_pack():
+        # A rebuild can replace the file between mapping and opening it;
+        # the body must match the ETag, so map the new pack and try again
+        for _ in range(PACK_OPEN_ATTEMPTS):
+            pack = get_pack()
+            if pack is None:
+                return jsonify({
+                    "error": "Pack not built",
+                    "message": "Build it with POST /api/export/pack or invoke build-pack"
+                }), 404
+
+            try:
+                pack_file = open(pack.path, 'rb')
+            except FileNotFoundError:
+                continue
+            stat = os.fstat(pack_file.fileno())
+            if (stat.st_ino, stat.st_mtime_ns) == (pack.stat.st_ino, pack.stat.st_mtime_ns):
+                break
+            pack_file.close()
+        else:
+            return jsonify({
+                "error": "Pack unavailable",
+                "message": "The pack is being rebuilt, try again"
+            }), 503
+
+        response = send_file(
+            pack_file,
+            mimetype='application/octet-stream',
+            download_name='vocab.pack',
+            etag=pack.etag,
+            last_modified=pack.stat.st_mtime,
+            max_age=0
+        )
+        # send_file only knows the size of paths, so answer If-None-Match
+        # and Range requests here
+        response.content_length = stat.st_size
+        try:
+            return response.make_conditional(request, accept_ranges=True,
+                                             complete_length=stat.st_size)
+        except RequestedRangeNotSatisfiable:
+            pack_file.close()
+            raise
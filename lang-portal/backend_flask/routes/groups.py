@@ -1,7 +1,32 @@
 from flask import jsonify, request, current_app
-from lib.db import get_db
+from lib.db import get_db, other_learner_dbs
+from lib.vocab_pack import current_pack
+from lib.repository import execute, fetch_all, scalar
+from lib.group_ops import (
+    GroupInUseError, add_words_to_group, remove_words_from_group, clone_group,
+    merge_groups, delete_group
+)
 import sqlite3
 
+def parse_id_list(data, key):
+    """Return data[key] if it is a non-empty list of integer ids, else None"""
+    ids = data.get(key) if isinstance(data, dict) else None
+    if not isinstance(ids, list) or not ids:
+        return None
+    if not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+        return None
+    return ids
+
+def invalid_id_list(key):
+    return jsonify({
+        "error": f"Invalid {key}",
+        "message": f"{key} must be a non-empty list of integer ids"
+    }), 400
+
+def other_histories():
+    """Connections to the other learners' shards (none without shards)"""
+    return (conn for _, conn in other_learner_dbs())
+
 def register_routes(app):
     @app.route('/api/groups')
     def get_groups():
@@ -21,11 +46,9 @@ def register_routes(app):
             per_page = current_app.config['ITEMS_PER_PAGE']
             
             db = get_db()
-            cursor = db.cursor()
             
             # Get total count
-            cursor.execute("SELECT COUNT(*) as count FROM groups")
-            total = cursor.fetchone()['count']
+            total = scalar(db, 'group_count')
             total_pages = max(1, (total + per_page - 1) // per_page)  # At least 1 page
             
             # Validate page number
@@ -36,16 +59,8 @@ def register_routes(app):
                 }), 400
             
             offset = (page - 1) * per_page
-            cursor.execute("""
-                SELECT id, name, words_count
-                FROM groups 
-                ORDER BY id  -- Ensure consistent ordering
-                LIMIT ? OFFSET ?
-            """, (per_page, offset))
-            groups = cursor.fetchall()
-            
             return jsonify({
-                "items": [dict(group) for group in groups],
+                "items": fetch_all(db, 'group_page', (per_page, offset)),
                 "total_pages": total_pages,
                 "current_page": page,
                 "total_groups": total
@@ -68,45 +83,29 @@ def register_routes(app):
             word_id = data['word_id']
             
             db = get_db()
-            cursor = db.cursor()
-            
-            # Check if group exists
-            cursor.execute("SELECT 1 FROM groups WHERE id = ?", (group_id,))
-            if not cursor.fetchone():
-                return jsonify({
-                    "error": "Group not found"
-                }), 404
-                
-            # Check if word exists
-            cursor.execute("SELECT 1 FROM words WHERE id = ?", (word_id,))
-            if not cursor.fetchone():
+
+            # One statement: the primary key rejects duplicates and the
+            # foreign keys reject missing words and groups
+            try:
+                cursor = execute(db, 'add_group_word', (group_id, word_id))
+            except sqlite3.IntegrityError:
+                db.rollback()
+                # Only failed inserts pay for finding out which side is missing
+                if not scalar(db, 'group_exists', (group_id,)):
+                    return jsonify({
+                        "error": "Group not found"
+                    }), 404
                 return jsonify({
                     "error": "Word not found"
                 }), 404
-                
-            # Check if word already in group
-            cursor.execute("""
-                SELECT 1 FROM word_groups 
-                WHERE word_id = ? AND group_id = ?
-            """, (word_id, group_id))
-            if cursor.fetchone():
+
+            if cursor.rowcount == 0:
+                db.rollback()
                 return jsonify({
                     "error": "Word already in group"
                 }), 400
-                
-            # Add word to group
-            cursor.execute("""
-                INSERT INTO word_groups (word_id, group_id)
-                VALUES (?, ?)
-            """, (word_id, group_id))
-            
-            # Update group word count
-            cursor.execute("""
-                UPDATE groups 
-                SET words_count = words_count + 1
-                WHERE id = ?
-            """, (group_id,))
-            
+
+            # words_count is bumped by the word_groups insert trigger
             db.commit()
             
             return jsonify({
@@ -124,32 +123,24 @@ def register_routes(app):
     def get_group_words(group_id):
         try:
             db = get_db()
-            cursor = db.cursor()
+            if current_app.config['SERVE_FROM_VOCAB_PACK']:
+                pack = current_pack(db)
+                words = pack.get_group_words(group_id) if pack else None
+                if words is not None:
+                    return jsonify({
+                        "words": words
+                    })
+
             
             # Check if group exists
-            cursor.execute("SELECT 1 FROM groups WHERE id = ?", (group_id,))
-            if not cursor.fetchone():
+            if not scalar(db, 'group_exists', (group_id,)):
                 return jsonify({
                     "error": "Group not found"
                 }), 404
             
             # Get all words in the group
-            cursor.execute("""
-                SELECT 
-                    w.id,
-                    w.spanish,
-                    w.english,
-                    w.pronunciation
-                FROM words w
-                JOIN word_groups wg ON w.id = wg.word_id
-                WHERE wg.group_id = ?
-                ORDER BY w.id
-            """, (group_id,))
-            
-            words = cursor.fetchall()
-            
             return jsonify({
-                "words": [dict(word) for word in words]
+                "words": fetch_all(db, 'group_words', (group_id,))
             })
             
         except sqlite3.Error as e:
@@ -158,9 +149,146 @@ def register_routes(app):
                 "message": str(e)
             }), 500
 
-# Functionality to add later:
-# - Remove word from group
-# - Update group name
-# - Delete group
-# - Get all groups for a word
-# - Get all words for a group
\ No newline at end of file
+    @app.route('/api/groups/<int:group_id>/words/<int:word_id>', methods=['DELETE'])
+    def remove_word_from_group(group_id, word_id):
+        try:
+            db = get_db()
+            cursor = execute(db, 'remove_group_word', (group_id, word_id))
+
+            if cursor.rowcount == 0:
+                db.rollback()
+                return jsonify({
+                    "error": "Word not in group"
+                }), 404
+
+            # words_count is lowered by the word_groups delete trigger
+            db.commit()
+
+            return jsonify({
+                "success": True,
+                "message": "Word removed from group"
+            })
+
+        except sqlite3.Error as e:
+            return jsonify({
+                "error": "Database error",
+                "message": str(e)
+            }), 500
+
+    @app.route('/api/groups/<int:group_id>/words/bulk', methods=['POST'])
+    def add_words_to_group_bulk(group_id):
+        word_ids = parse_id_list(request.get_json(silent=True), 'word_ids')
+        if word_ids is None:
+            return invalid_id_list('word_ids')
+
+        try:
+            return jsonify(add_words_to_group(
+                get_db(), group_id, word_ids, current_app.config['GROUP_BATCH_SIZE']
+            ))
+        except LookupError:
+            return jsonify({
+                "error": "Group not found"
+            }), 404
+        except sqlite3.Error as e:
+            get_db().rollback()
+            return jsonify({
+                "error": "Database error",
+                "message": str(e)
+            }), 500
+
+    @app.route('/api/groups/<int:group_id>/words/remove', methods=['POST'])
+    def remove_words_from_group_bulk(group_id):
+        word_ids = parse_id_list(request.get_json(silent=True), 'word_ids')
+        if word_ids is None:
+            return invalid_id_list('word_ids')
+
+        try:
+            return jsonify(remove_words_from_group(
+                get_db(), group_id, word_ids, current_app.config['GROUP_BATCH_SIZE']
+            ))
+        except LookupError:
+            return jsonify({
+                "error": "Group not found"
+            }), 404
+        except sqlite3.Error as e:
+            get_db().rollback()
+            return jsonify({
+                "error": "Database error",
+                "message": str(e)
+            }), 500
+
+    @app.route('/api/groups/<int:group_id>/clone', methods=['POST'])
+    def clone_group_route(group_id):
+        data = request.get_json(silent=True) or {}
+        name = data.get('name') if isinstance(data, dict) else None
+        if name is not None and (not isinstance(name, str) or not name.strip()):
+            return jsonify({
+                "error": "Invalid name",
+                "message": "name must be a non-empty string"
+            }), 400
+
+        try:
+            group = clone_group(
+                get_db(), group_id, name.strip() if name else None,
+                current_app.config['GROUP_BATCH_SIZE']
+            )
+            return jsonify(group), 201
+        except LookupError:
+            return jsonify({
+                "error": "Group not found"
+            }), 404
+        except sqlite3.Error as e:
+            get_db().rollback()
+            return jsonify({
+                "error": "Database error",
+                "message": str(e)
+            }), 500
+
+    @app.route('/api/groups/<int:group_id>/merge', methods=['POST'])
+    def merge_groups_route(group_id):
+        source_ids = parse_id_list(request.get_json(silent=True), 'group_ids')
+        if source_ids is None:
+            return invalid_id_list('group_ids')
+
+        try:
+            return jsonify(merge_groups(
+                get_db(), group_id, source_ids, current_app.config['GROUP_BATCH_SIZE'],
+                other_histories
+            ))
+        except LookupError:
+            return jsonify({
+                "error": "Group not found"
+            }), 404
+        except sqlite3.Error as e:
+            get_db().rollback()
+            return jsonify({
+                "error": "Database error",
+                "message": str(e)
+            }), 500
+
+    @app.route('/api/groups/<int:group_id>', methods=['DELETE'])
+    def delete_group_route(group_id):
+        try:
+            removed = delete_group(get_db(), group_id, current_app.config['GROUP_BATCH_SIZE'],
+                                   other_histories)
+            return jsonify({
+                "success": True,
+                "message": "Group deleted",
+                "words_removed": removed
+            })
+        except LookupError:
+            return jsonify({
+                "error": "Group not found"
+            }), 404
+        except (GroupInUseError, sqlite3.IntegrityError):
+            get_db().rollback()
+            return jsonify({
+                "error": "Group in use",
+                "message": "Group has study sessions; merge it into another group instead"
+            }), 409
+        except sqlite3.Error as e:
+            get_db().rollback()
+            return jsonify({
+                "error": "Database error",
+                "message": str(e)
+            }), 500
@@ -1,24 +1,30 @@
 from flask import jsonify, request, current_app
-from lib.db import get_db, validate_page
+from lib.db import get_db, review_archive_path
+from lib.history import (
+    parse_history_filters, count_study_sessions, list_study_sessions, InvalidFilterError
+)
+from lib.search import InvalidCursorError
+from lib.timestamps import timestamp_columns
+from lib.partitions import review_source
+from lib.repository import execute, fetch_all, fetch_one, scalar
 import sqlite3
 from datetime import datetime
 
+def session_reviews(db, created_ts):
+    """Review table term for the reviews of a session created at `created_ts`.
+
+    Reviews are never older than their session (uploaded ones are clamped
+    to its start), so partitions that end before the session started are
+    skipped; a current session reads only the hot table.
+    """
+    return review_source(db, review_archive_path(), created_ts)
+
 def register_routes(app):
     @app.route('/api/study_activities')
     def get_study_activities():
         try:
-            db = get_db()
-            cursor = db.cursor()
-            
-            cursor.execute("""
-                SELECT id, name, url, preview_url 
-                FROM study_activities
-                ORDER BY id
-            """)
-            activities = cursor.fetchall()
-            
             return jsonify({
-                "activities": [dict(activity) for activity in activities]
+                "activities": fetch_all(get_db(), 'activities')
             })
         except sqlite3.Error as e:
             return jsonify({
@@ -26,51 +32,92 @@ def register_routes(app):
                 "message": str(e)
             }), 500
 
-    @app.route('/api/study_sessions')
-    def get_study_sessions():
+    def session_history(**fixed):
+        """List sessions matching the query filters plus the `fixed` ones"""
+        try:
+            filters = parse_history_filters(request.args)
+        except InvalidFilterError as e:
+            return jsonify({
+                "error": str(e)
+            }), 400
+        filters.update(fixed)
+
+        per_page = current_app.config['ITEMS_PER_PAGE']
+        limit = min(max(request.args.get('limit', per_page, type=int), 1), per_page)
+        cursor = request.args.get('cursor')
+
         try:
-            page = request.args.get('page', 1, type=int)
-            per_page = current_app.config['ITEMS_PER_PAGE']
-            
             db = get_db()
-            cursor = db.cursor()
-            
-            # Get total count
-            cursor.execute("SELECT COUNT(*) as count FROM study_sessions")
-            total = cursor.fetchone()['count']
-            total_pages = max(1, (total + per_page - 1) // per_page)  # At least 1 page
-            
+
+            if cursor is not None:
+                # Later pages seek past the cursor and skip the count
+                sessions, next_cursor = list_study_sessions(db, filters, limit, cursor)
+                return jsonify({
+                    "items": sessions,
+                    "next_cursor": next_cursor
+                })
+
+            page = request.args.get('page', 1, type=int)
+            total = count_study_sessions(db, filters)
+            total_pages = max(1, (total + limit - 1) // limit)  # At least 1 page
+
             # Validate page number
             if page < 1 or page > total_pages:
                 return jsonify({
                     "error": "Invalid page number",
                     "message": f"Page number must be between 1 and {total_pages}"
                 }), 400
-            
-            offset = (page - 1) * per_page
-            cursor.execute("""
-                SELECT s.id, s.created_at, s.completed_at,
-                       g.name as group_name, 
-                       a.name as activity_name
-                FROM study_sessions s
-                JOIN groups g ON s.group_id = g.id
-                JOIN study_activities a ON s.study_activity_id = a.id
-                ORDER BY s.created_at DESC
-                LIMIT ? OFFSET ?
-            """, (per_page, offset))
-            sessions = cursor.fetchall()
-            
+
+            sessions, next_cursor = list_study_sessions(db, filters, limit,
+                                                        offset=(page - 1) * limit)
             return jsonify({
-                "items": [dict(session) for session in sessions],
+                "items": sessions,
                 "total_pages": total_pages,
                 "current_page": page,
-                "total_sessions": total
+                "total_sessions": total,
+                "next_cursor": next_cursor
             })
+        except InvalidCursorError:
+            return jsonify({
+                "error": "Invalid cursor"
+            }), 400
+        except sqlite3.Error as e:
+            return jsonify({
+                "error": "Database error",
+                "message": str(e)
+            }), 500
+
+    @app.route('/api/study_sessions')
+    def get_study_sessions():
+        return session_history()
+
+    @app.route('/api/groups/<int:group_id>/study_sessions')
+    def get_group_study_sessions(group_id):
+        try:
+            if not scalar(get_db(), 'group_exists', (group_id,)):
+                return jsonify({
+                    "error": "Group not found"
+                }), 404
+        except sqlite3.Error as e:
+            return jsonify({
+                "error": "Database error",
+                "message": str(e)
+            }), 500
+        return session_history(group_id=group_id)
+
+    @app.route('/api/study_activities/<int:activity_id>/study_sessions')
+    def get_activity_study_sessions(activity_id):
+        try:
+            if not scalar(get_db(), 'activity_exists', (activity_id,)):
+                return jsonify({
+                    "error": "Activity not found"
+                }), 404
         except sqlite3.Error as e:
             return jsonify({
                 "error": "Database error",
                 "message": str(e)
             }), 500
+        return session_history(activity_id=activity_id)
     
     @app.route('/api/study_sessions', methods=['POST'])
     def create_study_session():
@@ -84,36 +131,23 @@ def register_routes(app):
                 }), 400
             
             with get_db() as db:
-                cursor = db.cursor()
-                
                 # Verify group and activity exist
-                cursor.execute("""
-                    SELECT EXISTS(SELECT 1 FROM groups WHERE id = ?) as group_exists,
-                           EXISTS(SELECT 1 FROM study_activities WHERE id = ?) as activity_exists
-                """, (data['group_id'], data['activity_id']))
-                result = cursor.fetchone()
+                group_exists, activity_exists = fetch_one(
+                    db, 'session_targets_exist', (data['group_id'], data['activity_id'])
+                )
                 
-                if not result['group_exists']:
+                if not group_exists:
                     return jsonify({"error": "Invalid group ID"}), 400
-                if not result['activity_exists']:
+                if not activity_exists:
                     return jsonify({"error": "Invalid activity ID"}), 400
                 
                 # Create session
-                cursor.execute("""
-                    INSERT INTO study_sessions (group_id, study_activity_id, created_at)
-                    VALUES (?, ?, datetime('now'))
-                """, (data['group_id'], data['activity_id']))
-                
-                session_id = cursor.lastrowid
+                session_id = execute(
+                    db, 'create_session', (data['group_id'], data['activity_id'], *timestamp_columns())
+                ).lastrowid
                 
                 # Get the created session details
-                cursor.execute("""
-                    SELECT id, group_id, study_activity_id, created_at, completed_at
-                    FROM study_sessions 
-                    WHERE id = ?
-                """, (session_id,))
-                
-                session = dict(cursor.fetchone())
+                session = fetch_one(db, 'session', (session_id,))
                 db.commit()
                 
                 return jsonify({
@@ -152,13 +186,7 @@ def register_routes(app):
                 }), 400     
             
             with get_db() as db:
-                cursor = db.cursor()
-                cursor.execute("""
-                    INSERT INTO word_review_items
-                    (word_id, study_session_id, correct, created_at)
-                    VALUES (?, ?, ?, datetime('now'))
-                """, (word_id, session_id, correct))    
-            
+                execute(db, 'create_review', (word_id, session_id, correct, *timestamp_columns()))
                 db.commit()
             
             return jsonify({
@@ -182,43 +210,29 @@ def register_routes(app):
     def complete_study_session(session_id):
         try:
             db = get_db()
-            cursor = db.cursor()
             
             # Check if session exists and isn't already completed
-            cursor.execute("""
-                SELECT id, completed_at 
-                FROM study_sessions 
-                WHERE id = ?
-            """, (session_id,))
-            
-            session = cursor.fetchone()
+            session = fetch_one(db, 'session_state', (session_id,))
             if not session:
                 return jsonify({
                     "error": "Session not found"
                 }), 404
                 
-            if session['completed_at']:
+            completed_at, created_ts = session
+            if completed_at:
                 return jsonify({
                     "error": "Session already completed"
                 }), 400
             
+            # Resolved before the UPDATE: attaching the archive has to
+            # happen outside a transaction
+            reviews = session_reviews(db, created_ts)
+
             # Update completion time
-            cursor.execute("""
-                UPDATE study_sessions 
-                SET completed_at = datetime('now')
-                WHERE id = ?
-            """, (session_id,))
+            execute(db, 'complete_session', (session_id,))
             
             # Get updated session with review count
-            cursor.execute("""
-                SELECT s.*, COUNT(r.id) as review_items_count
-                FROM study_sessions s
-                LEFT JOIN word_review_items r ON r.study_session_id = s.id
-                WHERE s.id = ?
-                GROUP BY s.id
-            """, (session_id,))
-            
-            session = dict(cursor.fetchone())
+            session = fetch_one(db, 'completed_session', (session_id,), reviews=reviews)
             db.commit()
             
             return jsonify({
@@ -236,34 +250,18 @@ def register_routes(app):
     def get_session_words(session_id):
         try:
             db = get_db()
-            cursor = db.cursor()
             
             # Check if session exists
-            cursor.execute("SELECT 1 FROM study_sessions WHERE id = ?", (session_id,))
-            if not cursor.fetchone():
+            session = fetch_one(db, 'session_created_ts', (session_id,))
+            if not session:
                 return jsonify({
                     "error": "Session not found"
                 }), 404
+            reviews = session_reviews(db, session[0])
             
             # Get only reviewed words for this session
-            cursor.execute("""
-                SELECT 
-                    w.id,
-                    w.spanish,
-                    w.english,
-                    w.pronunciation,
-                    1 as reviewed,  -- If we have the word, it was reviewed
-                    r.correct
-                FROM words w
-                JOIN word_review_items r ON r.word_id = w.id 
-                WHERE r.study_session_id = ?
-                ORDER BY w.id
-            """, (session_id,))
-            
-            words = cursor.fetchall()
-            
             return jsonify({
-                "words": [dict(word) for word in words]
+                "words": fetch_all(db, 'session_words', (session_id,), reviews=reviews)
             })
             
         except sqlite3.Error as e:
@@ -276,31 +274,22 @@ def register_routes(app):
     def get_session_stats(session_id):
         try:
             db = get_db()
-            cursor = db.cursor()
             
             # Check if session exists
-            cursor.execute("SELECT 1 FROM study_sessions WHERE id = ?", (session_id,))
-            if not cursor.fetchone():
+            session = fetch_one(db, 'session_created_ts', (session_id,))
+            if not session:
                 return jsonify({
                     "error": "Session not found"
                 }), 404
+            reviews = session_reviews(db, session[0])
             
             # Get review statistics
-            cursor.execute("""
-                SELECT 
-                    COUNT(*) as total_words,
-                    SUM(CASE WHEN correct = 1 THEN 1 ELSE 0 END) as correct_count,
-                    ROUND(AVG(CASE WHEN correct = 1 THEN 100.0 ELSE 0 END), 2) as accuracy
-                FROM word_review_items
-                WHERE study_session_id = ?
-            """, (session_id,))
-            
-            stats = dict(cursor.fetchone())
+            stats = fetch_one(db, 'session_stats', (session_id,), reviews=reviews)
             
             # Handle case where there are no reviews
-            if stats['total_words'] == 0:
-                stats['accuracy'] = 0
-                stats['correct_count'] = 0
+            if stats.total_words == 0:
+                stats.accuracy = 0
+                stats.correct_count = 0
             
             return jsonify(stats)
             
@@ -308,12 +297,4 @@ def register_routes(app):
             return jsonify({
                 "error": "Database error",
                 "message": str(e)
-            }), 500                                     
-
-# Functionality to add later:
-# - Get session history by date
-# - Get session history by group
-# - Get session history by activity
-# - Get session history combined filters
-# - Get session history by date range
-# - Get session history by date range and group
\ No newline at end of file
+            }), 500
@@ -0,0 +1,271 @@
+from flask import jsonify, request
+from lib.db import get_db, review_archive_path
+from lib.partitions import HOT_TABLE, review_source, partitioned_client_ids
+from lib.storage import HISTORY_SCHEMA, attached_schemas
+from lib.timestamps import day_bucket, epoch_of, timestamp_columns
+import sqlite3
+from datetime import datetime, timezone
+
+# Tables published through the change feed and the columns sent for upserts
+SYNC_TABLES = {
+    'words': 'id, spanish, pronunciation, english',
+    'groups': 'id, name, words_count',
+    'study_sessions': 'id, group_id, study_activity_id, created_at, completed_at, client_id',
+    'word_review_items': 'id, word_id, study_session_id, correct, created_at, client_id',
+}
+
+MAX_CHANGES_PER_PAGE = 1000
+
+def parse_client_timestamp(value):
+    """Normalize a client ISO-8601 timestamp to SQLite's datetime() format.
+
+    Timestamps with an offset are converted to UTC; ones without are
+    taken to be UTC already, like every created_at the server writes.
+    """
+    if value is None:
+        return None
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc)
+    return parsed.strftime('%Y-%m-%d %H:%M:%S')
+
+def client_id_of(row):
+    """A row's client_id, which must be a non-empty string: uploads are
+    deduplicated on it, and a unique index lets any number of NULLs in"""
+    client_id = row['client_id']
+    if not isinstance(client_id, str) or not client_id:
+        raise ValueError('client_id must be a non-empty string')
+    return client_id
+
+def timestamp_fields(created_at):
+    """(created_at, created_ts, created_day) for a normalized client timestamp"""
+    epoch = epoch_of(created_at)
+    return created_at, epoch, day_bucket(epoch)
+
+def register_routes(app):
+    @app.route('/api/changes')
+    def get_changes():
+        try:
+            since = request.args.get('since', 0, type=int)
+            history_since = request.args.get('history_since', 0, type=int)
+            limit = request.args.get('limit', MAX_CHANGES_PER_PAGE, type=int)
+            if since < 0 or history_since < 0:
+                return jsonify({
+                    "error": "Invalid version",
+                    "message": "since and history_since must be non-negative integers"
+                }), 400
+            limit = max(1, min(limit, MAX_CHANGES_PER_PAGE))
+
+            db = get_db()
+            cursor = db.cursor()
+
+            # A history file logs its own rows, with its own versions
+            logs = [('change_log', since)]
+            if HISTORY_SCHEMA in attached_schemas(db):
+                logs.append((f'{HISTORY_SCHEMA}.change_log', history_since))
+
+            entries = []
+            has_more = False
+            versions = []
+            for log, log_since in logs:
+                # Fetch one extra entry to know whether another page follows
+                cursor.execute(f"""
+                    SELECT version, table_name, row_id, link_id, deleted
+                    FROM {log}
+                    WHERE version > ?
+                    ORDER BY version
+                    LIMIT ?
+                """, (log_since, limit + 1))
+                log_entries = cursor.fetchall()
+                has_more = has_more or len(log_entries) > limit
+                log_entries = log_entries[:limit]
+                entries += log_entries
+
+                if log_entries:
+                    versions.append(log_entries[-1]['version'])
+                else:
+                    cursor.execute(f"SELECT COALESCE(MAX(version), 0) as version FROM {log}")
+                    versions.append(max(log_since, cursor.fetchone()['version']))
+
+            upserts = {}
+            deletes = {}
+            upsert_ids = {}
+            for entry in entries:
+                table = entry['table_name']
+                if table == 'word_groups':
+                    target = deletes if entry['deleted'] else upserts
+                    target.setdefault(table, []).append([entry['row_id'], entry['link_id']])
+                elif entry['deleted']:
+                    deletes.setdefault(table, []).append(entry['row_id'])
+                else:
+                    upsert_ids.setdefault(table, []).append(entry['row_id'])
+
+            # One query per table instead of one per changed row; reviews
+            # may have moved into a partition since they were logged
+            for table, ids in upsert_ids.items():
+                placeholders = ', '.join('?' * len(ids))
+                source = table
+                if table == HOT_TABLE:
+                    source = review_source(db, review_archive_path())
+                cursor.execute(f"""
+                    SELECT {SYNC_TABLES[table]}
+                    FROM {source}
+                    WHERE id IN ({placeholders})
+                    ORDER BY id
+                """, ids)
+                upserts[table] = [dict(row) for row in cursor.fetchall()]
+
+            response = {
+                "since": since,
+                "version": versions[0],
+                "has_more": has_more,
+                "upserts": upserts,
+                "deletes": deletes
+            }
+            if len(versions) > 1:
+                response["history_since"] = history_since
+                response["history_version"] = versions[1]
+            return jsonify(response)
+        except sqlite3.Error as e:
+            return jsonify({
+                "error": "Database error",
+                "message": str(e)
+            }), 500
+
+    @app.route('/api/sync/upload', methods=['POST'])
+    def sync_upload():
+        try:
+            data = request.get_json(silent=True)
+            if not isinstance(data, dict):
+                return jsonify({
+                    "error": "Invalid JSON",
+                    "message": "Request must be a JSON object"
+                }), 400
+
+            sessions = data.get('sessions', [])
+            reviews = data.get('reviews', [])
+
+            try:
+                session_rows = [(
+                    client_id_of(s),
+                    s['group_id'],
+                    s['activity_id'],
+                    *timestamp_fields(parse_client_timestamp(s['created_at'])),
+                    parse_client_timestamp(s.get('completed_at'))
+                ) for s in sessions]
+                review_fields = [(
+                    client_id_of(r),
+                    r['word_id'],
+                    r['correct'],
+                    timestamp_fields(parse_client_timestamp(r['created_at']))
+                ) for r in reviews]
+                for r in reviews:
+                    if not isinstance(r['correct'], bool):
+                        raise ValueError('correct must be a boolean')
+                    if 'session_client_id' not in r and 'session_id' not in r:
+                        raise KeyError('session_client_id')
+            except (KeyError, TypeError, ValueError) as e:
+                return jsonify({
+                    "error": "Invalid upload",
+                    "message": str(e)
+                }), 400
+
+            db = get_db()
+            cursor = db.cursor()
+
+            # Retried uploads of reviews that have since moved into a
+            # partition are not caught by the hot table's unique index
+            moved_client_ids = set()
+            if review_fields:
+                moved_client_ids = partitioned_client_ids(
+                    db, review_archive_path(),
+                    [fields[0] for fields in review_fields],
+                    min(fields[3][1] for fields in review_fields)
+                )
+
+            try:
+                cursor.executemany("""
+                    INSERT INTO study_sessions
+                    (client_id, group_id, study_activity_id, created_at, created_ts,
+                     created_day, completed_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (client_id) DO NOTHING
+                """, session_rows)
+                sessions_inserted = max(cursor.rowcount, 0)
+
+                # Resolve client session ids, including ones uploaded earlier
+                session_ids = {}
+                client_ids = list({r['session_client_id'] for r in reviews if 'session_client_id' in r}
+                                  | {s['client_id'] for s in sessions})
+                for start in range(0, len(client_ids), 500):
+                    chunk = client_ids[start:start + 500]
+                    cursor.execute(f"""
+                        SELECT id, client_id FROM study_sessions
+                        WHERE client_id IN ({', '.join('?' * len(chunk))})
+                    """, chunk)
+                    session_ids.update({row['client_id']: row['id'] for row in cursor.fetchall()})
+
+                review_sessions = [r.get('session_id') or session_ids.get(r.get('session_client_id'))
+                                   for r in reviews]
+                session_starts = {}
+                known_ids = list({session_id for session_id in review_sessions if session_id})
+                for start in range(0, len(known_ids), 500):
+                    chunk = known_ids[start:start + 500]
+                    cursor.execute(f"""
+                        SELECT id, created_ts FROM study_sessions
+                        WHERE id IN ({', '.join('?' * len(chunk))})
+                    """, chunk)
+                    session_starts.update({row['id']: row['created_ts'] for row in cursor.fetchall()})
+
+                review_rows = []
+                for r, session_id, (client_id, word_id, correct, created) in zip(
+                        reviews, review_sessions, review_fields):
+                    if session_id is None:
+                        db.rollback()
+                        return jsonify({
+                            "error": "Unknown session",
+                            "message": f"No session with client_id {r.get('session_client_id')}"
+                        }), 400
+                    # Reviews are never older than their session (session
+                    # reads skip partitions that end before it started), so
+                    # a client clock running behind is clamped
+                    session_start = session_starts.get(session_id)
+                    if session_start is not None and created[1] < session_start:
+                        created = timestamp_columns(session_start)
+                    if client_id not in moved_client_ids:
+                        review_rows.append((client_id, word_id, session_id, correct, *created))
+
+                cursor.executemany("""
+                    INSERT INTO word_review_items
+                    (client_id, word_id, study_session_id, correct, created_at,
+                     created_ts, created_day)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (client_id) DO NOTHING
+                """, review_rows)
+                reviews_inserted = max(cursor.rowcount, 0)
+
+                db.commit()
+            except sqlite3.IntegrityError as e:
+                db.rollback()
+                return jsonify({
+                    "error": "Invalid upload",
+                    "message": str(e)
+                }), 400
+
+            return jsonify({
+                "success": True,
+                "sessions": {cid: session_ids[cid] for cid in (s['client_id'] for s in sessions)},
+                "inserted": {
+                    "sessions": sessions_inserted,
+                    "reviews": reviews_inserted
+                },
+                "duplicates": {
+                    "sessions": len(session_rows) - sessions_inserted,
+                    "reviews": len(reviews) - reviews_inserted
+                }
+            })
+        except sqlite3.Error as e:
+            return jsonify({
+                "error": "Database error",
+                "message": str(e)
+            }), 500
@@ -1,21 +1,85 @@
 from flask import jsonify, request, current_app
 from lib.db import get_db
+from lib.importer import InvalidWordError, word_fields, resolve_group, import_words
+from lib.normalize import normalize_key
+from lib.repository import fetch_all, fetch_one
+from lib.vocab_pack import current_pack
+from lib.autocomplete import get_prefix_index, DEFAULT_AUTOCOMPLETE_LIMIT, MAX_AUTOCOMPLETE_LIMIT
+from lib.embeddings import EmbeddingError
+from lib.fuzzy import fuzzy_search, DEFAULT_FUZZY_LIMIT, MAX_FUZZY_LIMIT, MAX_EDIT_DISTANCE
+from lib.search import (
+    search_words, InvalidCursorError, MAX_QUERY_LENGTH, DEFAULT_SEARCH_LIMIT, MAX_SEARCH_LIMIT
+)
+from lib.word_list import SORT_KEYS, SORT_ORDERS, count_words, list_words
+from lib.vectors import (
+    find_similar_words, get_vector_index, DEFAULT_SIMILAR_LIMIT, MAX_SIMILAR_LIMIT
+)
 import sqlite3
+import json
+import io
+
+def read_ndjson_words(stream):
+    """Yield word tuples from an NDJSON body one line at a time"""
+    for position, line in enumerate(stream, start=1):
+        if line.strip():
+            try:
+                item = json.loads(line)
+            except ValueError as e:  # JSONDecodeError or UnicodeDecodeError
+                raise InvalidWordError(f"Item {position} is not valid JSON: {e}")
+            yield word_fields(item, position)
 
 def register_routes(app):
     @app.route('/api/words')
     def get_words():
+        sort = request.args.get('sort', 'id')
+        if sort not in SORT_KEYS:
+            return jsonify({
+                "error": "Invalid sort field",
+                "message": f"sort must be one of: {', '.join(SORT_KEYS)}"
+            }), 400
+        order = request.args.get('order', 'asc')
+        if order not in SORT_ORDERS:
+            return jsonify({
+                "error": "Invalid sort order",
+                "message": "order must be asc or desc"
+            }), 400
+
+        group_id = request.args.get('group_id')
+        if group_id is not None:
+            try:
+                group_id = int(group_id)
+            except ValueError:
+                return jsonify({
+                    "error": "Invalid group ID"
+                }), 400
+
+        studied = request.args.get('studied')
+        if studied is not None:
+            if studied not in ('true', 'false'):
+                return jsonify({
+                    "error": "Invalid studied filter",
+                    "message": "studied must be true or false"
+                }), 400
+            studied = studied == 'true'
+
+        per_page = current_app.config['ITEMS_PER_PAGE']
+        limit = min(max(request.args.get('limit', per_page, type=int), 1), per_page)
+        cursor = request.args.get('cursor')
+
         try:
-            page = request.args.get('page', 1, type=int)
-            per_page = current_app.config['ITEMS_PER_PAGE']
-            
             db = get_db()
-            cursor = db.cursor()
-            
-            # Get total count
-            cursor.execute("SELECT COUNT(*) as count FROM words")
-            total = cursor.fetchone()['count']
-            total_pages = max(1, (total + per_page - 1) // per_page)  # At least 1 page
+
+            if cursor is not None:
+                # Later pages seek past the cursor and skip the count
+                words, next_cursor = list_words(db, limit, sort, order, group_id, studied, cursor)
+                return jsonify({
+                    "items": words,
+                    "next_cursor": next_cursor
+                })
+
+            page = request.args.get('page', 1, type=int)
+            total = count_words(db, group_id, studied)
+            total_pages = max(1, (total + limit - 1) // limit)  # At least 1 page
             
             # Validate page number
             if page < 1 or page > total_pages:
@@ -24,22 +88,21 @@ def register_routes(app):
                     "message": f"Page number must be between 1 and {total_pages}"
                 }), 400
             
-            offset = (page - 1) * per_page
-            cursor.execute("""
-                SELECT id, spanish, pronunciation, english
-                FROM words
-                LIMIT ? OFFSET ?
-            """, (per_page, offset))
-            
-            words = cursor.fetchall()
+            words, next_cursor = list_words(db, limit, sort, order, group_id, studied,
+                                            offset=(page - 1) * limit)
             
             return jsonify({
-                "items": [dict(word) for word in words],
+                "items": words,
                 "total_pages": total_pages,
                 "current_page": page,
-                "total_words": total
+                "total_words": total,
+                "next_cursor": next_cursor
             })
             
+        except InvalidCursorError:
+            return jsonify({
+                "error": "Invalid cursor"
+            }), 400
         except sqlite3.Error as e:
             return jsonify({
                 "error": "Database error",
@@ -50,48 +113,34 @@ def register_routes(app):
     def get_word(word_id):
         try:
             db = get_db()
-            cursor = db.cursor()
-            
+            if current_app.config['SERVE_FROM_VOCAB_PACK']:
+                pack = current_pack(db)
+                word = pack.get_word(word_id) if pack else None
+                if word:
+                    return jsonify(word)
+
             # Get word details
-            cursor.execute("""
-                SELECT 
-                    w.id,
-                    w.spanish,
-                    w.english,
-                    w.pronunciation,
-                    GROUP_CONCAT(g.id) as group_ids,
-                    GROUP_CONCAT(g.name) as group_names
-                FROM words w
-                LEFT JOIN word_groups wg ON w.id = wg.word_id
-                LEFT JOIN groups g ON wg.group_id = g.id
-                WHERE w.id = ?
-                GROUP BY w.id
-            """, (word_id,))
-            
-            word = cursor.fetchone()
+            word = fetch_one(db, 'word_detail', (word_id,))
             if not word:
                 return jsonify({
                     "error": "Word not found"
                 }), 404
             
-            # Convert to dict and process group data
-            result = dict(word)
+            _, spanish, english, pronunciation, group_ids, group_names = word
+            result = {
+                'id': word_id,
+                'spanish': spanish,
+                'english': english,
+                'pronunciation': pronunciation,
+                'groups': []
+            }
             
             # Handle groups data
-            if result['group_ids']:
+            if group_ids:
                 result['groups'] = [
                     {'id': int(gid), 'name': name}
-                    for gid, name in zip(
-                        result['group_ids'].split(','),
-                        result['group_names'].split(',')
-                    )
+                    for gid, name in zip(group_ids.split(','), group_names.split(','))
                 ]
-            else:
-                result['groups'] = []
-                
-            # Remove concatenated fields
-            del result['group_ids']
-            del result['group_names']
             
             return jsonify(result)
             
@@ -101,10 +150,199 @@ def register_routes(app):
                 "message": str(e)
             }), 500
         
-# Functionality to add later:
-# - Search words by group
-# - Search words by group and word
-# - Search words by word
-# - Search words by word and group
-# - Search words by word and group and group
-# - Search words by word and group and group and group  
\ No newline at end of file
+    @app.route('/api/words/lookup')
+    def lookup_word():
+        try:
+            spanish = request.args.get('spanish', '')
+            if not spanish.strip():
+                return jsonify({
+                    "error": "Missing spanish parameter"
+                }), 400
+
+            return jsonify({
+                "items": fetch_all(get_db(), 'words_by_key', (normalize_key(spanish),))
+            })
+
+        except sqlite3.Error as e:
+            return jsonify({
+                "error": "Database error",
+                "message": str(e)
+            }), 500
+
+    @app.route('/api/words/search')
+    def search():
+        query = request.args.get('q', '').strip()
+        if not query:
+            return jsonify({
+                "error": "Search query required"
+            }), 400
+        if len(query) > MAX_QUERY_LENGTH:
+            return jsonify({
+                "error": "Search query too long",
+                "message": f"Queries are limited to {MAX_QUERY_LENGTH} characters"
+            }), 400
+
+        group_id = request.args.get('group_id')
+        if group_id is not None:
+            try:
+                group_id = int(group_id)
+            except ValueError:
+                return jsonify({
+                    "error": "Invalid group ID"
+                }), 400
+
+        limit = min(max(request.args.get('limit', DEFAULT_SEARCH_LIMIT, type=int), 1), MAX_SEARCH_LIMIT)
+
+        try:
+            return jsonify(search_words(get_db(), query, group_id,
+                                        request.args.get('cursor'), limit))
+        except InvalidCursorError:
+            return jsonify({
+                "error": "Invalid cursor"
+            }), 400
+        except sqlite3.Error as e:
+            return jsonify({
+                "error": "Database error",
+                "message": str(e)
+            }), 500
+
+    @app.route('/api/words/fuzzy')
+    def fuzzy():
+        query = request.args.get('q', '').strip()
+        if not query:
+            return jsonify({
+                "error": "Search query required"
+            }), 400
+        if len(query) > MAX_QUERY_LENGTH:
+            return jsonify({
+                "error": "Search query too long",
+                "message": f"Queries are limited to {MAX_QUERY_LENGTH} characters"
+            }), 400
+
+        max_distance = request.args.get('max_distance', type=int)
+        if max_distance is not None and not 0 <= max_distance <= MAX_EDIT_DISTANCE:
+            return jsonify({
+                "error": "Invalid max_distance",
+                "message": f"max_distance must be between 0 and {MAX_EDIT_DISTANCE}"
+            }), 400
+
+        limit = min(max(request.args.get('limit', DEFAULT_FUZZY_LIMIT, type=int), 1), MAX_FUZZY_LIMIT)
+
+        try:
+            return jsonify({
+                "items": fuzzy_search(get_db(), query, limit, max_distance)
+            })
+        except sqlite3.Error as e:
+            return jsonify({
+                "error": "Database error",
+                "message": str(e)
+            }), 500
+
+    @app.route('/api/words/similar')
+    def similar():
+        query = request.args.get('q', '').strip()
+        if not query:
+            return jsonify({
+                "error": "Search query required"
+            }), 400
+        if len(query) > MAX_QUERY_LENGTH:
+            return jsonify({
+                "error": "Search query too long",
+                "message": f"Queries are limited to {MAX_QUERY_LENGTH} characters"
+            }), 400
+
+        limit = min(max(request.args.get('limit', DEFAULT_SIMILAR_LIMIT, type=int), 1),
+                    MAX_SIMILAR_LIMIT)
+
+        try:
+            index = get_vector_index(current_app)
+            index.refresh(get_db, current_app.config['VECTOR_REFRESH_SECONDS'])
+            return jsonify({
+                "items": find_similar_words(get_db(), index, query, limit)
+            })
+        except EmbeddingError as e:
+            return jsonify({
+                "error": "Embedding service unavailable",
+                "message": str(e)
+            }), 503
+        except sqlite3.Error as e:
+            return jsonify({
+                "error": "Database error",
+                "message": str(e)
+            }), 500
+
+    @app.route('/api/words/autocomplete')
+    def autocomplete():
+        prefix = request.args.get('prefix', '')
+        if not prefix.strip():
+            return jsonify({
+                "error": "Missing prefix parameter"
+            }), 400
+
+        limit = min(max(request.args.get('limit', DEFAULT_AUTOCOMPLETE_LIMIT, type=int), 1),
+                    MAX_AUTOCOMPLETE_LIMIT)
+
+        try:
+            index = get_prefix_index(current_app)
+            index.refresh(get_db, current_app.config['AUTOCOMPLETE_REFRESH_SECONDS'])
+            return jsonify({
+                "items": index.complete(prefix, limit)
+            })
+        except sqlite3.Error as e:
+            return jsonify({
+                "error": "Database error",
+                "message": str(e)
+            }), 500
+
+    @app.route('/api/words/bulk', methods=['POST'])
+    def bulk_import_words():
+        try:
+            group_id = request.args.get('group_id', type=int)
+            group_name = request.args.get('group_name')
+
+            if request.mimetype == 'application/x-ndjson':
+                # Stream the body so large imports never sit in memory whole;
+                # the buffer avoids byte-at-a-time readline on the raw stream
+                words = read_ndjson_words(io.BufferedReader(request.stream, 1 << 16))
+            else:
+                data = request.get_json(silent=True)
+                if not isinstance(data, list):
+                    return jsonify({
+                        "error": "Invalid JSON",
+                        "message": "Request must be a JSON array of words"
+                    }), 400
+                words = (word_fields(item, position)
+                         for position, item in enumerate(data, start=1))
+
+            db = get_db()
+            cursor = db.cursor()
+            try:
+                target_group = resolve_group(cursor, group_id, group_name)
+                result = import_words(
+                    db, words, target_group,
+                    batch_size=current_app.config['IMPORT_BATCH_SIZE']
+                )
+                db.commit()
+            except LookupError:
+                db.rollback()
+                return jsonify({
+                    "error": "Group not found"
+                }), 404
+            except InvalidWordError as e:
+                db.rollback()
+                return jsonify({
+                    "error": "Invalid word",
+                    "message": str(e)
+                }), 400
+
+            return jsonify({
+                "success": True,
+                "group_id": target_group,
+                **result
+            })
+
+        except sqlite3.Error as e:
+            return jsonify({
+                "error": "Database error",
+                "message": str(e)
+            }), 500
@@ -1,12 +1,48 @@
 from invoke import task
+import csv
 import sqlite3
 import os
 import json
+import shutil
+import random
+import tempfile
+import threading
+import time
+import tracemalloc
+from itertools import islice
+from app import create_app
 from config import Config
+from lib.backups import BackupInProgressError, backup_files, run_backup
+from lib.db import LEARNER_HEADER, run_migrations
+from lib.embeddings import make_embedder
+from lib.columnar import export_review_history
+from lib.counters import (
+    RECONCILE_WORDS_COUNT_SQL, find_words_count_drift, reconcile_words_count
+)
+from lib.fuzzy import REBUILD_TRIGRAMS_SQL
+from lib.partitions import (
+    delete_reviews, delete_study_sessions, partition_reviews as move_review_partitions, review_tables
+)
+from lib.replication import Shipper, apply_segments, replicated_files, replication_status
+from lib.storage import (
+    DEFAULT_LEARNER, SHARD_TEMPLATE, attach_history, history_is_split, list_learners, localize_history,
+    shard_archive_path, shard_history, shard_path, split_history
+)
+from lib.timestamps import backfill_timestamps
+from lib.vectors import VectorIndex
+from lib.vocab_pack import build_vocab_pack
+from lib.importer import (
+    read_word_file, resolve_group, create_staging_table, stage_words, merge_staged_words,
+    import_vocabulary_file
+)
 
 # Use the same database path as defined in config
 DB_PATH = Config.SQLITE_DB_PATH
 DB_DIR = os.path.dirname(DB_PATH)
+# Attached history file in the split storage layout
+HISTORY_PATH = Config.HISTORY_DB_PATH if Config.STORAGE_LAYOUT == 'split' else None
+SHARDED = Config.STORAGE_LAYOUT == 'sharded'
+SHARD_TEMPLATE_PATH = os.path.join(Config.SHARD_DIR, SHARD_TEMPLATE)
 MIGRATIONS_PATH = os.path.join(os.path.dirname(__file__), 'migrations')
 SEEDS_PATH = os.path.join(os.path.dirname(__file__), 'seeds')
 
@@ -25,114 +61,742 @@ def init_db(ctx):
     open(DB_PATH, 'a').close()
     print(f"Created new database at: {DB_PATH}")
 
+def history_databases():
+    """(learner, history file, review archive) of every history database.
+
+    The history file is None in the single-file layout, the learner is
+    None unless the layout is sharded.
+    """
+    if SHARDED:
+        return [
+            (learner, shard_path(Config.SHARD_DIR, learner),
+             shard_archive_path(Config.SHARD_DIR, learner))
+            for learner in list_learners(Config.SHARD_DIR)
+        ]
+    return [(None, HISTORY_PATH, Config.REVIEW_ARCHIVE_PATH)]
+
+def connect_history(history_path, **kwargs):
+    """Connection to the vocabulary with a history file attached, if any"""
+    conn = sqlite3.connect(DB_PATH, **kwargs)
+    conn.execute("PRAGMA foreign_keys = ON")
+    if history_path:
+        attach_history(conn, history_path)
+    return conn
+
 @task
 def migrate(ctx):
     """Run all pending migrations"""
-    # Connect with foreign keys enabled
-    conn = sqlite3.connect(DB_PATH + '?foreign_keys=ON')
-    cursor = conn.cursor()
-    
-    # Get list of migration files
-    migration_files = sorted([
-        f for f in os.listdir(MIGRATIONS_PATH)
-        if f.endswith('.sql')
-    ])
-    
-    # Run each migration
-    for file_name in migration_files:
-        print(f"Running migration: {file_name}")
-        file_path = os.path.join(MIGRATIONS_PATH, file_name)
-        
-        with open(file_path, 'r') as f:
-            sql = f.read()
-            cursor.executescript(sql)
-    
-    conn.commit()
-    conn.close()
+    conn = sqlite3.connect(DB_PATH)
+    conn.execute("PRAGMA foreign_keys = ON")
+
+    try:
+        # Until the history tables have been moved, every migration runs
+        # on the single file; the split then moves them with their rows
+        target = SHARD_TEMPLATE_PATH if SHARDED else HISTORY_PATH
+        split = target and history_is_split(conn, target)
+        history_paths = []
+        if split:
+            history_paths = [target] + [path for _, path, _ in history_databases() if path != target]
+        for file_name in run_migrations(conn, MIGRATIONS_PATH, history_paths=history_paths):
+            print(f"Applied migration: {file_name}")
+        if target and not split:
+            moved = shard_history(conn, Config.SHARD_DIR) if SHARDED else split_history(conn, target)
+            for table, count in moved.items():
+                print(f"Moved {count} {table} rows to {os.path.dirname(target) if SHARDED else target}")
+    finally:
+        conn.close()
+
+    # History files split off before they kept their own change_log and
+    # review counts get them now (the template has no reviews to count)
+    histories = history_databases()
+    if SHARDED:
+        histories = [(None, SHARD_TEMPLATE_PATH, None)] + histories
+    for learner, history_path, archive_path in histories:
+        conn = connect_history(history_path)
+        try:
+            if history_path and localize_history(conn, review_tables(conn, archive_path)):
+                print(f"Moved the change log and review counts into {history_path}")
+            if history_path != SHARD_TEMPLATE_PATH:
+                report_backfill(backfill_timestamps(conn), learner)
+        finally:
+            conn.close()
     print("Migrations complete!")
 
-@task
-def seed_db(ctx):
-    """Import seed data from JSON files"""
-    conn = sqlite3.connect(DB_PATH + '?foreign_keys=ON')
+def report_backfill(filled, learner=None):
+    for table, count in filled.items():
+        if count:
+            print(f"Backfilled created_ts for {count} {table} rows"
+                  + (f" of {learner}" if learner else ""))
+
+@task(name='backfill-timestamps', help={
+    'batch_size': "Rows updated per transaction",
+})
+def backfill_timestamps_task(ctx, batch_size=5000):
+    """Fill created_ts/created_day on rows older than migration 018; safe on a live database"""
+    started = time.monotonic()
+    for learner, history_path, _ in history_databases():
+        # Waits out the app's write transactions instead of failing on them
+        conn = connect_history(history_path, timeout=30)
+        try:
+            filled = backfill_timestamps(
+                conn, int(batch_size),
+                progress=lambda table, last_id, count: print(
+                    f"\r{table}: {count} rows up to id {last_id}", end='', flush=True
+                )
+            )
+            print()
+            report_backfill(filled, learner)
+        finally:
+            conn.close()
+    print(f"Backfill complete in {time.monotonic() - started:.1f}s")
+
+def load_pragmas(conn):
+    """Trade durability for speed while bulk loading seed data"""
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute("PRAGMA cache_size = -262144")  # 256MB
+
+# Per-row search index and counter triggers, with the statement that
+# rebuilds what they maintain in one pass; the rebuild is several times
+# faster than the trigger
+DEFERRED_TRIGGERS = {
+    'words_fts_insert': "INSERT INTO words_fts (words_fts) VALUES ('rebuild')",
+    'word_trigrams_insert': REBUILD_TRIGRAMS_SQL,
+    'group_words_count_insert': RECONCILE_WORDS_COUNT_SQL,
+}
+
+def defer_indexes(conn):
+    """Drop secondary indexes on words/word_groups and the search index and
+    words_count insert triggers, remembering how to rebuild them"""
+    objects = conn.execute(f"""
+        SELECT type, name, sql FROM sqlite_master
+        WHERE (type = 'index'
+               AND tbl_name IN ('words', 'word_groups')
+               AND sql IS NOT NULL
+               AND sql NOT LIKE 'CREATE UNIQUE%')
+           OR (type = 'trigger' AND name IN ({', '.join('?' * len(DEFERRED_TRIGGERS))}))
+    """, list(DEFERRED_TRIGGERS)).fetchall()
+    for object_type, name, sql in objects:
+        conn.execute(
+            "INSERT OR REPLACE INTO seed_deferred_indexes (name, sql) VALUES (?, ?)",
+            (name, sql)
+        )
+        conn.execute(f'DROP {object_type.upper()} "{name}"')
+    conn.commit()
+
+def rebuild_deferred_indexes(conn):
+    """Recreate the indexes and triggers dropped by defer_indexes"""
+    for name, sql in conn.execute("SELECT name, sql FROM seed_deferred_indexes").fetchall():
+        print(f"Rebuilding: {name}")
+        conn.execute(sql)
+        if name in DEFERRED_TRIGGERS:
+            conn.executescript(DEFERRED_TRIGGERS[name])
+        conn.execute("DELETE FROM seed_deferred_indexes WHERE name = ?", (name,))
+        conn.commit()
+
+def load_word_file(conn, file_name, group_name, batch_size):
+    """Stream one vocabulary file into words/word_groups in committed batches"""
     cursor = conn.cursor()
+    cursor.execute(
+        "SELECT position, completed FROM seed_checkpoints WHERE file_name = ?",
+        (file_name,)
+    )
+    checkpoint = cursor.fetchone()
+    if checkpoint and checkpoint[1]:
+        print(f"Skipping completed seed file: {file_name}")
+        return
+    position = checkpoint[0] if checkpoint else 0
+
+    group_id = resolve_group(cursor, group_name=group_name)
+    words = islice(read_word_file(os.path.join(SEEDS_PATH, file_name)), position, None)
+    if position:
+        print(f"Resuming {file_name} after {position} words")
+
+    create_staging_table(cursor)
+    started = time.monotonic()
+    loaded = 0
+    while True:
+        batch = list(islice(words, batch_size))
+        if not batch:
+            break
+
+        # Upsert through the staging table so re-seeding never duplicates words
+        cursor.execute("DELETE FROM staged_words")
+        stage_words(cursor, batch)
+        merge_staged_words(cursor, group_id)
+
+        position += len(batch)
+        loaded += len(batch)
+        cursor.execute("""
+            INSERT OR REPLACE INTO seed_checkpoints (file_name, position, completed)
+            VALUES (?, ?, 0)
+        """, (file_name, position))
+        conn.commit()
+
+        rate = loaded / max(time.monotonic() - started, 1e-9)
+        print(f"\r{file_name}: {position} words ({rate:,.0f} words/s)", end='', flush=True)
+
+    cursor.execute("""
+        INSERT OR REPLACE INTO seed_checkpoints (file_name, position, completed)
+        VALUES (?, ?, 1)
+    """, (file_name, position))
+    conn.commit()
+    print(f"\r{file_name}: {position} words loaded into '{group_name}'")
+
+@task(help={
+    'manifest': "Seed manifest inside the seeds folder (default: manifest.json)",
+    'batch_size': "Words inserted per executemany batch and commit",
+    'resume': "Continue an interrupted seed from its checkpoints",
+})
+def seed_db(ctx, manifest='manifest.json', batch_size=10000, resume=False):
+    """Import seed data listed in the seed manifest"""
+    conn = sqlite3.connect(DB_PATH)
+    conn.execute("PRAGMA foreign_keys = ON")
+    load_pragmas(conn)
 
     try:
+        with open(os.path.join(SEEDS_PATH, manifest), 'r') as f:
+            seeds = json.load(f)
+
+        if not resume:
+            conn.execute("DELETE FROM seed_checkpoints")
+            conn.commit()
+
         # First seed study activities
-        activities_file = os.path.join(SEEDS_PATH, 'study_activities.json')
-        if os.path.exists(activities_file):
+        activities_file = seeds.get('study_activities')
+        done = conn.execute(
+            "SELECT completed FROM seed_checkpoints WHERE file_name = ?",
+            (activities_file,)
+        ).fetchone()
+        if activities_file and not (done and done[0]):
             print("Processing study activities")
-            with open(activities_file, 'r') as f:
-                data = json.load(f)
-                activities = data['study_activities']  # Get the nested array
-                for activity in activities:
-                    
-                    cursor.execute("""
-                        INSERT INTO study_activities (name, url, preview_url)
-                        VALUES (?, ?, ?)
-                    """, (activity['name'], activity['url'], activity['preview_url']))
-        
-        # Dictionary mapping seed files to their group names
-        seed_groups = {
-            'core_verbs.json': 'Core Verbs',
-            'core_nouns.json': 'Core Nouns',
-            'basic_phrases.json': 'Basic Phrases'
-        }
+            with open(os.path.join(SEEDS_PATH, activities_file), 'r') as f:
+                activities = json.load(f)['study_activities']
+            conn.executemany("""
+                INSERT INTO study_activities (name, url, preview_url)
+                VALUES (:name, :url, :preview_url)
+            """, activities)
+            conn.execute("""
+                INSERT OR REPLACE INTO seed_checkpoints (file_name, position, completed)
+                VALUES (?, ?, 1)
+            """, (activities_file, len(activities)))
+            conn.commit()
+
+        defer_indexes(conn)
 
         # Process word groups
-        for seed_file, group_name in seed_groups.items():
-            file_path = os.path.join(SEEDS_PATH, seed_file)
-            if not os.path.exists(file_path):
-                print(f"Warning: Seed file not found: {file_path}")
+        for entry in seeds.get('word_groups', []):
+            if not os.path.exists(os.path.join(SEEDS_PATH, entry['file'])):
+                print(f"Warning: Seed file not found: {entry['file']}")
                 continue
+            load_word_file(conn, entry['file'], entry['group'], batch_size)
 
-            print(f"Processing seed file: {seed_file}")
+        rebuild_deferred_indexes(conn)
+        print("Seed data import complete!")
 
-            # Create group if it doesn't exist
-            cursor.execute(
-                "INSERT OR IGNORE INTO groups (name) VALUES (?)",
-                (group_name,)
+    except (sqlite3.Error, ValueError, KeyError) as e:
+        conn.rollback()
+        print(f"\nError seeding database: {str(e)}")
+        print("Run 'invoke seed-db --resume' to continue from the last checkpoint")
+        raise
+
+    finally:
+        conn.close()
+
+@task(help={
+    'path': "Anki .apkg deck or JSON/NDJSON/CSV/TSV word file",
+    'group_name': "Group to add the words to (created if missing)",
+    'group_id': "Existing group to add the words to",
+    'columns': "Column names for headerless CSV/TSV files, e.g. spanish,english",
+    'fields': "Anki note field mapping, e.g. spanish=Front,english=Back",
+    'batch_size': "Words staged per executemany batch",
+})
+def import_vocab(ctx, path, group_name=None, group_id=None, columns=None, fields=None,
+                 batch_size=10000):
+    """Import an Anki deck or vocabulary file into words and word_groups"""
+    conn = sqlite3.connect(DB_PATH)
+    conn.execute("PRAGMA foreign_keys = ON")
+
+    try:
+        started = time.monotonic()
+        result = import_vocabulary_file(
+            conn, path,
+            int(group_id) if group_id else None,
+            group_name,
+            columns=columns.split(',') if columns else None,
+            fields=dict(pair.split('=', 1) for pair in fields.split(',')) if fields else None,
+            batch_size=batch_size
+        )
+        elapsed = time.monotonic() - started
+        print(f"Imported {path} in {elapsed:.1f}s: " + ", ".join(
+            f"{count} {name}" for name, count in result.items() if name != 'group_id'
+        ))
+
+    except (sqlite3.Error, ValueError, LookupError, csv.Error) as e:
+        conn.rollback()
+        print(f"Error importing vocabulary: {str(e)}")
+        raise
+
+    finally:
+        conn.close()
+
+@task(help={
+    'format': "npz, parquet (needs pyarrow) or auto",
+    'directory': "Export directory (default: Config.REVIEW_EXPORT_DIR)",
+})
+def export_reviews(ctx, format='auto', directory=None):
+    """Append new review history to the monthly columnar export"""
+    directory = directory or Config.REVIEW_EXPORT_DIR
+    for learner, history_path, archive_path in history_databases():
+        conn = connect_history(history_path)
+        try:
+            started = time.monotonic()
+            # Each learner gets their own export directory, as in the API
+            result = export_review_history(
+                conn, os.path.join(directory, learner) if learner else directory, format,
+                archive_path=archive_path
             )
-            cursor.execute(
-                "SELECT id FROM groups WHERE name = ?",
-                (group_name,)
+            print(f"Exported {result['rows']} reviews up to id {result['last_id']} "
+                  + (f"of {learner} " if learner else "")
+                  + f"as {result['format']} in {time.monotonic() - started:.1f}s")
+            for part in result['parts']:
+                print(f"  {part['month']}/{part['file']}: {part['rows']} rows")
+        finally:
+            conn.close()
+
+@task(help={
+    'output': "Pack file (default: Config.VOCAB_PACK_PATH)",
+})
+def build_pack(ctx, output=None):
+    """Compile words and groups into the binary vocabulary pack"""
+    conn = sqlite3.connect(DB_PATH)
+
+    try:
+        started = time.monotonic()
+        result = build_vocab_pack(conn, output or Config.VOCAB_PACK_PATH)
+        print(f"Packed {result['words']} words, {result['groups']} groups and "
+              f"{result['memberships']} memberships at version {result['data_version']} "
+              f"into {result['path']} ({result['size']} bytes) in {time.monotonic() - started:.1f}s")
+    finally:
+        conn.close()
+
+@task(help={
+    'embedder': "hashing or openai (default: Config.EMBEDDER)",
+})
+def build_vectors(ctx, embedder=None):
+    """Re-embed every word into the semantic search index"""
+    config = {key: getattr(Config, key) for key in ('EMBEDDER', 'EMBEDDING_URL', 'EMBEDDING_MODEL')}
+    if embedder:
+        config['EMBEDDER'] = embedder
+    index = VectorIndex(Config.VECTOR_INDEX_DIR, make_embedder(config))
+    conn = sqlite3.connect(DB_PATH)
+
+    try:
+        started = time.monotonic()
+        with index.file_lock():
+            index.rebuild(conn)
+            index.load()
+        print(f"Embedded {index.meta['count']} words with {index.embedder.name} "
+              f"into {index.directory} in {time.monotonic() - started:.1f}s")
+    finally:
+        conn.close()
+
+@task(help={
+    'hot_months': "Months kept in word_review_items, counting the current one",
+    'archive_after_months': "Months after which a partition moves to the archive database",
+    'batch_size': "Reviews moved per transaction",
+})
+def partition_reviews(ctx, hot_months=Config.REVIEW_HOT_MONTHS,
+                      archive_after_months=Config.REVIEW_ARCHIVE_AFTER_MONTHS, batch_size=5000):
+    """Move old reviews into monthly partitions and old partitions into the archive"""
+    started = time.monotonic()
+    for learner, history_path, archive_path in history_databases():
+        # Waits out the app's write transactions instead of failing on them
+        conn = connect_history(history_path, timeout=30)
+        try:
+            result = move_review_partitions(
+                conn, archive_path, int(hot_months),
+                int(archive_after_months), int(batch_size)
             )
-            group_id = cursor.fetchone()[0]
-
-            # Read and process words
-            with open(file_path, 'r') as f:
-                words = json.load(f)
-                for word in words:
-                    # Insert word
-                    cursor.execute("""
-                        INSERT INTO words (spanish, pronunciation, english)
-                        VALUES (?, ?, ?)
-                    """, (word['spanish'], word['pronunciation'], word['english']))
-                    word_id = cursor.lastrowid
-
-                    # Link word to group
-                    cursor.execute("""
-                        INSERT INTO word_groups (word_id, group_id)
-                        VALUES (?, ?)
-                    """, (word_id, group_id))
+            for name, count in result['moved'].items():
+                print(f"Moved {count} reviews into {name}" + (f" of {learner}" if learner else ""))
+            for name in result['archived']:
+                print(f"Archived {name} to {archive_path}")
+        finally:
+            conn.close()
+    print(f"Partitioning complete in {time.monotonic() - started:.1f}s")
+
+def parse_ids(ids):
+    return [int(value) for value in str(ids).split(',') if value.strip()]
+
+@task(help={
+    'ids': "Comma-separated word ids",
+})
+def delete_words(ctx, ids):
+    """Delete words with their reviews in every history database, partitions included"""
+    word_ids = parse_ids(ids)
+    for learner, history_path, archive_path in history_databases():
+        conn = connect_history(history_path, timeout=30)
+        try:
+            deleted = delete_reviews(conn, archive_path, 'word_id', word_ids)
+            conn.commit()
+            print(f"Deleted {deleted} reviews" + (f" of {learner}" if learner else ""))
+        finally:
+            conn.close()
 
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    conn.execute("PRAGMA foreign_keys = ON")
+    try:
+        deleted = conn.execute("""
+            DELETE FROM words WHERE id IN (SELECT value FROM json_each(?))
+        """, (json.dumps(word_ids),)).rowcount
         conn.commit()
-        print("Seed data import complete!")
+        print(f"Deleted {deleted} words")
+    finally:
+        conn.close()
 
-    except (sqlite3.Error, json.JSONDecodeError, KeyError) as e:
-        conn.rollback()
-        print(f"Error seeding database: {str(e)}")
-        raise
+@task(help={
+    'ids': "Comma-separated session ids",
+    'learner': f"Learner whose sessions these are (sharded layout, default: {DEFAULT_LEARNER})",
+})
+def delete_sessions(ctx, ids, learner=DEFAULT_LEARNER):
+    """Delete study sessions with their reviews, partitions included"""
+    history_path, archive_path = HISTORY_PATH, Config.REVIEW_ARCHIVE_PATH
+    if SHARDED:
+        history_path = shard_path(Config.SHARD_DIR, learner)
+        archive_path = shard_archive_path(Config.SHARD_DIR, learner)
+    conn = connect_history(history_path, timeout=30)
+    try:
+        result = delete_study_sessions(conn, archive_path, parse_ids(ids))
+        conn.commit()
+        print(f"Deleted {result['sessions']} sessions and {result['reviews']} reviews")
+    finally:
+        conn.close()
 
+@task(help={
+    'fix': "Rewrite drifted counts instead of only reporting them",
+})
+def check_counts(ctx, fix=False):
+    """Compare groups.words_count with the actual group memberships"""
+    conn = sqlite3.connect(DB_PATH)
+
+    try:
+        drift = find_words_count_drift(conn)
+        for group_id, name, stored, actual in drift:
+            print(f"Group {group_id} ({name}): words_count {stored}, actual {actual}")
+        if not drift:
+            print("All group word counts are correct")
+        elif fix:
+            fixed = reconcile_words_count(conn)
+            conn.commit()
+            print(f"Reconciled {fixed} group word counts")
+        else:
+            print("Run 'invoke check-counts --fix' to reconcile them")
     finally:
         conn.close()
 
+def app_config(**overrides):
+    """Config's settings as a dict, like app.config"""
+    config = {key: getattr(Config, key) for key in dir(Config) if key.isupper()}
+    config.update(overrides)
+    return config
+
+# Read endpoints served from lib/repository's registered queries
+PROFILED_ENDPOINTS = (
+    '/api/dashboard/last_study_session',
+    '/api/dashboard/study_progress',
+    '/api/dashboard/quick_stats',
+    '/api/study_activities',
+    '/api/groups',
+    '/api/groups/1/words',
+)
+
+@task(help={
+    'requests': "Requests per endpoint",
+})
+def profile_requests(ctx, requests=200):
+    """Report Python allocations per request on the main read endpoints"""
+    client = create_app(Config).test_client()
+    headers = {LEARNER_HEADER: DEFAULT_LEARNER}
+    for endpoint in PROFILED_ENDPOINTS:
+        client.get(endpoint, headers=headers)  # Imports, caches, first connection
+        tracemalloc.start()
+        try:
+            peaks = []
+            for _ in range(int(requests)):
+                tracemalloc.reset_peak()
+                before = tracemalloc.get_traced_memory()[0]
+                status = client.get(endpoint, headers=headers).status_code
+                peaks.append(tracemalloc.get_traced_memory()[1] - before)
+        finally:
+            tracemalloc.stop()
+        peaks.sort()
+        print(f"{endpoint}: {status}, peak {peaks[len(peaks) // 2] / 1024:.1f} KiB "
+              f"per request (median), {peaks[-1] / 1024:.1f} KiB max")
+
+def benchmark_app(**overrides):
+    """Test client of an app configured with `overrides`"""
+    config = type('BenchmarkConfig', (Config,), {'TESTING': True, **overrides})
+    return create_app(config).test_client()
+
+def time_requests(client, method, path, count, **kwargs):
+    """Median and 95th percentile milliseconds of `count` requests"""
+    durations = []
+    for _ in range(count):
+        started = time.perf_counter()
+        response = client.open(path, method=method, **kwargs)
+        durations.append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            raise RuntimeError(f"{method} {path}: {response.status_code} {response.get_data(as_text=True)}")
+    durations.sort()
+    return durations[len(durations) // 2] * 1000, durations[int(len(durations) * 0.95)] * 1000
+
+def seed_benchmark_vocabulary(conn, words):
+    conn.execute("INSERT INTO groups (name) VALUES ('Benchmark')")
+    conn.execute("INSERT INTO study_activities (name, url) VALUES ('Benchmark', 'https://example.com')")
+    conn.executemany("INSERT INTO words (spanish, pronunciation, english) VALUES (?, ?, ?)", (
+        (f"palabra {i}", f"pa-la-bra {i}", f"word {i}") for i in range(words)
+    ))
+    conn.execute("INSERT INTO word_groups (group_id, word_id) SELECT 1, id FROM words")
+    conn.commit()
+
+# Requests a study session makes while the learner is reviewing
+HOT_PATH_REQUESTS = (
+    ('POST', '/api/study_sessions/{session}/words/{word}/review'),
+    ('GET', '/api/study_sessions/{session}/stats'),
+    ('GET', '/api/study_sessions/{session}/words'),
+    ('GET', '/api/dashboard/quick_stats'),
+    ('GET', '/api/dashboard/study_progress'),
+)
+
+@task(help={
+    'rows': "Reviews the history grows to (100000000 for the full run)",
+    'steps': "History sizes measured on the way",
+    'requests': "Requests timed per endpoint at each size",
+    'days': "Days of history the old reviews are spread over",
+})
+def benchmark_partitions(ctx, rows=1000000, steps=4, requests=200, days=1800):
+    """Time the hot review paths as partitioned review history grows"""
+    rows, steps, requests, days = int(rows), int(steps), int(requests), int(days)
+    scratch = tempfile.mkdtemp()
+    db_path = os.path.join(scratch, 'words.db')
+    archive_path = os.path.join(scratch, 'review_archive.db')
+    words = 1000
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA foreign_keys = ON")
+        run_migrations(conn)
+        seed_benchmark_vocabulary(conn, words)
+        # One session per day of old history, ending before the hot months
+        first_day = int(time.time()) // 86400 - days - 31 * Config.REVIEW_HOT_MONTHS
+        conn.execute("""
+            WITH RECURSIVE d(day) AS (SELECT ? UNION ALL SELECT day + 1 FROM d WHERE day < ?)
+            INSERT INTO study_sessions (group_id, study_activity_id, created_at, created_ts, created_day)
+            SELECT 1, 1, datetime(day * 86400, 'unixepoch'), day * 86400, day FROM d
+        """, (first_day, first_day + days - 1))
+        conn.commit()
+
+        client = benchmark_app(SQLITE_DB_PATH=db_path, REVIEW_ARCHIVE_PATH=archive_path,
+                               STORAGE_LAYOUT='single')
+        loaded = 0
+        for step in range(1, steps + 1):
+            target = rows * step // steps
+            started = time.monotonic()
+            while loaded < target:
+                chunk = min(target - loaded, 1000000)
+                conn.execute("""
+                    WITH RECURSIVE n(i) AS (SELECT ? UNION ALL SELECT i + 1 FROM n WHERE i < ?)
+                    INSERT INTO word_review_items
+                    (word_id, study_session_id, correct, created_at, created_ts, created_day)
+                    SELECT i % ? + 1, s.id, i % 3 != 0, s.created_at, s.created_ts + i % 3600, s.created_day
+                    FROM n JOIN study_sessions s ON s.id = i % ? + 1
+                """, (loaded, loaded + chunk - 1, words, days))
+                conn.commit()
+                loaded += chunk
+            move_review_partitions(conn, archive_path)
+            print(f"{loaded:,} reviews (loaded and partitioned in {time.monotonic() - started:.1f}s)")
+            # A fresh session each time, so only the history size changes
+            session = client.post('/api/study_sessions',
+                                  json={'group_id': 1, 'activity_id': 1}).get_json()['session']['id']
+            for method, path in HOT_PATH_REQUESTS:
+                path = path.format(session=session, word=random.randint(1, words))
+                median, p95 = time_requests(client, method, path, requests,
+                                            json={'correct': True} if method == 'POST' else None)
+                print(f"  {method} {path}: {median:.2f} ms median, {p95:.2f} ms p95")
+    finally:
+        conn.close()
+        shutil.rmtree(scratch)
+
+# Vocabulary reads of the mixed workload, next to review POSTs
+MIXED_READ_REQUESTS = (
+    '/api/words?limit=50&sort=english',
+    '/api/words/{word}',
+    '/api/words?limit=50&studied=true',
+    '/api/dashboard/study_progress',
+)
+
+@task(help={
+    'words': "Vocabulary size",
+    'reviews': "Reviews in the history before the run",
+    'seconds': "Length of each run",
+    'threads': "Concurrent clients",
+    'write_share': "Fraction of requests that are review POSTs",
+})
+def benchmark_storage(ctx, words=50000, reviews=1000000, seconds=20, threads=4, write_share=0.3):
+    """Time a mixed review/vocabulary workload in the single and split storage layouts"""
+    words, reviews, seconds, threads = int(words), int(reviews), float(seconds), int(threads)
+    write_share = float(write_share)
+    for layout in ('single', 'split'):
+        scratch = tempfile.mkdtemp()
+        db_path = os.path.join(scratch, 'words.db')
+        history_path = os.path.join(scratch, 'history.db')
+        try:
+            conn = sqlite3.connect(db_path)
+            try:
+                conn.execute("PRAGMA journal_mode = WAL")
+                conn.execute("PRAGMA foreign_keys = ON")
+                run_migrations(conn)
+                seed_benchmark_vocabulary(conn, words)
+                session = conn.execute("""
+                    INSERT INTO study_sessions (group_id, study_activity_id, created_at)
+                    VALUES (1, 1, datetime('now'))
+                """).lastrowid
+                conn.execute("""
+                    WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < ?)
+                    INSERT INTO word_review_items (word_id, study_session_id, correct, created_at)
+                    SELECT i % ? + 1, ?, i % 3 != 0, datetime('now') FROM n
+                """, (reviews, words, session))
+                conn.commit()
+                if layout == 'split':
+                    split_history(conn, history_path)
+            finally:
+                conn.close()
+
+            app_client = benchmark_app(SQLITE_DB_PATH=db_path, HISTORY_DB_PATH=history_path,
+                                       REVIEW_ARCHIVE_PATH=os.path.join(scratch, 'review_archive.db'),
+                                       STORAGE_LAYOUT=layout)
+            durations = {'write': [], 'read': []}
+            errors = []
+            # Another connection's commits to words.db change its data_version
+            vocab = sqlite3.connect(db_path)
+            vocab_version = vocab.execute("PRAGMA data_version").fetchone()[0]
+            stop = time.monotonic() + seconds
+
+            def run_client():
+                client = app_client.application.test_client()
+                while time.monotonic() < stop:
+                    word = random.randint(1, words)
+                    kind = 'write' if random.random() < write_share else 'read'
+                    started = time.perf_counter()
+                    if kind == 'write':
+                        response = client.post(f'/api/study_sessions/{session}/words/{word}/review',
+                                               json={'correct': random.random() < 0.7})
+                    else:
+                        response = client.get(random.choice(MIXED_READ_REQUESTS).format(word=word))
+                    durations[kind].append(time.perf_counter() - started)
+                    if response.status_code >= 400:
+                        errors.append(f"{response.status_code} {response.get_data(as_text=True)}")
+                        return
+
+            workers = [threading.Thread(target=run_client) for _ in range(threads)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            vocab_written = vocab.execute("PRAGMA data_version").fetchone()[0] != vocab_version
+            vocab.close()
+            if errors:
+                raise RuntimeError(errors[0])
+
+            print(f"{layout}:")
+            for kind, times in durations.items():
+                times.sort()
+                if times:
+                    print(f"  {kind}s: {len(times) / seconds:.0f}/s, {times[len(times) // 2] * 1000:.2f} ms median, "
+                          f"{times[int(len(times) * 0.95)] * 1000:.2f} ms p95")
+            print(f"  words.db written: {'yes' if vocab_written else 'no'}")
+        finally:
+            shutil.rmtree(scratch)
+
+@task(help={
+    'interval': "Seconds between ships; 0 ships once",
+    'directory': "Replication directory (default: Config.REPLICATION_DIR)",
+})
+def ship_replication(ctx, interval=0, directory=None):
+    """Ship pages changed since the last ship to the replication directory"""
+    directory = directory or Config.REPLICATION_DIR
+    shipper = Shipper(replicated_files(app_config()), directory,
+                      Config.REPLICATION_KEEP_SEGMENTS)
+    try:
+        while True:
+            shipped = shipper.ship()
+            if shipped:
+                pages = ', '.join(f"{count} {name}" for name, count in shipped['pages'].items())
+                print(f"Shipped sequence {shipped['sequence']}: {pages} pages")
+            if not float(interval):
+                break
+            time.sleep(float(interval))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        shipper.close()
+
+@task(help={
+    'replica_dir': "Replica directory (default: Config.REPLICA_DIR)",
+    'interval': "Seconds between checks; 0 applies once",
+    'directory': "Replication directory (default: Config.REPLICATION_DIR)",
+})
+def apply_replication(ctx, replica_dir=None, interval=0, directory=None):
+    """Apply shipped segments to a read replica's databases"""
+    directory = directory or Config.REPLICATION_DIR
+    replica_dir = replica_dir or Config.REPLICA_DIR
+    if not replica_dir:
+        print("Pass --replica-dir or set Config.REPLICA_DIR")
+        return
+    try:
+        while True:
+            if apply_segments(directory, replica_dir):
+                status = replication_status(directory, replica_dir)
+                print(f"Replica at sequence {status['sequence']}")
+            if not float(interval):
+                break
+            time.sleep(float(interval))
+    except KeyboardInterrupt:
+        pass
+
+@task(help={
+    'pages': "Pages copied per step",
+    'sleep': "Seconds to pause after each step",
+    'keep': "Verified backups to keep",
+})
+def backup(ctx, pages=Config.BACKUP_PAGES_PER_STEP, sleep=Config.BACKUP_STEP_SLEEP,
+           keep=Config.BACKUP_KEEP):
+    """Back up the databases online into Config.BACKUP_DIR and rotate old backups"""
+    try:
+        manifest = run_backup(backup_files(app_config()), Config.BACKUP_DIR,
+                              int(pages), float(sleep), int(keep))
+    except BackupInProgressError as e:
+        print(e)
+        return
+    for name, stats in manifest['files'].items():
+        steps = 'one step' if stats['single_step'] else f"{stats['steps']} steps"
+        print(f"Backed up {name}: {stats['pages']} pages in {steps}, "
+              f"{stats['restarts']} restarts, integrity ok")
+    print(f"Backup {manifest['name']} complete in {manifest['duration_seconds']:.1f}s")
+    for name in manifest['rotated']:
+        print(f"Removed old backup {name}")
+
 @task
 def reset_db(ctx):
     """Reset database by deleting it and running all migrations"""
-    if os.path.exists(DB_PATH):
-        os.remove(DB_PATH)
-        print(f"Removed existing database: {DB_PATH}")
+    for path in (DB_PATH, HISTORY_PATH):
+        if path and os.path.exists(path):
+            os.remove(path)
+            print(f"Removed existing database: {path}")
+    if SHARDED and os.path.isdir(Config.SHARD_DIR):
+        shutil.rmtree(Config.SHARD_DIR)
+        print(f"Removed learner shards: {Config.SHARD_DIR}")
     
     init_db(ctx)
     migrate(ctx)
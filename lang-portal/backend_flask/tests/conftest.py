@@ -1,9 +1,17 @@
 import pytest
 from app import create_app
 from config import TestConfig
+from lib.db import run_migrations
 import sqlite3
+import shutil
 import os
 
+def remove_database_files(db_path):
+    """Delete a SQLite database along with its -wal and -shm files"""
+    for path in (db_path, db_path + '-wal', db_path + '-shm'):
+        if os.path.exists(path):
+            os.remove(path)
+
 @pytest.fixture
 def app():
     """Create and configure a test Flask application"""
@@ -27,9 +35,12 @@ def test_db():
     """
     db_path = TestConfig.SQLITE_DB_PATH
     
-    # Remove existing test database if it exists
-    if os.path.exists(db_path):
-        os.remove(db_path)
+    # Remove existing test databases (and any WAL sidecar files) if they exist
+    remove_database_files(db_path)
+    remove_database_files(TestConfig.REVIEW_ARCHIVE_PATH)
+    remove_database_files(TestConfig.HISTORY_DB_PATH)
+    shutil.rmtree(TestConfig.SHARD_DIR, ignore_errors=True)
+    shutil.rmtree(TestConfig.BACKUP_DIR, ignore_errors=True)
     
     # Create fresh database and tables
     conn = sqlite3.connect(db_path)
@@ -92,14 +103,20 @@ def test_db():
         );
     """)
     
+    # Apply the migrations layered on top of the base schema above
+    run_migrations(conn, start=7)
+    
     conn.commit()
     conn.close()
     
     yield db_path
     
-    # Clean up - remove test database after test completes
-    if os.path.exists(db_path):
-        os.remove(db_path)
+    # Clean up - remove test databases after test completes
+    remove_database_files(db_path)
+    remove_database_files(TestConfig.REVIEW_ARCHIVE_PATH)
+    remove_database_files(TestConfig.HISTORY_DB_PATH)
+    shutil.rmtree(TestConfig.SHARD_DIR, ignore_errors=True)
+    shutil.rmtree(TestConfig.BACKUP_DIR, ignore_errors=True)
 
 @pytest.fixture
 def seed_db(test_db):
@@ -165,9 +182,7 @@ def seed_db(test_db):
                 VALUES (?, ?, ?, datetime('now'))
             """, (word_id, session_id, True))
     
-    # Update group word count
-    cursor.execute("UPDATE groups SET words_count = ? WHERE id = ?",
-                  (len(word_ids), group_id))
+    # groups.words_count is kept by the word_groups triggers
     
     conn.commit()
     conn.close()
@@ -1,6 +1,19 @@
 import pytest
 import sqlite3
 import os
+import io
+import json
+import fcntl
+import threading
+import time
+import zipfile
+from config import TestConfig
+from lib.backups import (
+    MAX_PACED_RESTARTS, BackupInProgressError, backup_database, backup_files, run_backup,
+    verify_backup
+)
+from lib.partitions import partition_reviews
+from lib.storage import attach_history, shard_archive_path, shard_history, shard_path
 
 def test_reset_history(client, seed_db):
     """Test resetting study history.
@@ -49,4 +62,225 @@ def test_full_reset(client, seed_db):
         cursor.execute(f"SELECT COUNT(*) as count FROM {table}")
         assert cursor.fetchone()['count'] == 0
     
-    conn.close() 
\ No newline at end of file
+    conn.close() 
+def build_anki_package(path, notes, field_names=('Front', 'Back')):
+    """Write a minimal legacy-format .apkg holding one note type."""
+    collection = str(path) + '.anki2'
+    conn = sqlite3.connect(collection)
+    conn.executescript("""
+        CREATE TABLE col (id INTEGER PRIMARY KEY, models TEXT, decks TEXT);
+        CREATE TABLE notes (id INTEGER PRIMARY KEY, mid INTEGER, flds TEXT);
+    """)
+    models = {'1001': {'name': 'Basic', 'flds': [
+        {'name': name, 'ord': i} for i, name in enumerate(field_names)
+    ]}}
+    conn.execute("INSERT INTO col (id, models, decks) VALUES (1, ?, '{}')",
+                 (json.dumps(models),))
+    conn.executemany("INSERT INTO notes (mid, flds) VALUES (1001, ?)",
+                     [('\x1f'.join(note),) for note in notes])
+    conn.commit()
+    conn.close()
+    with zipfile.ZipFile(path, 'w') as package:
+        package.write(collection, 'collection.anki2')
+    os.remove(collection)
+
+def test_import_anki_package(client, seed_db, tmp_path):
+    """Test importing an Anki deck into a new group.
+    
+    Verifies:
+    - Fields are mapped by name and stripped of HTML
+    - Notes with an empty side are skipped
+    - Existing words are linked but not duplicated
+    - The group is named after the uploaded file
+    """
+    package = tmp_path / 'kitchen.apkg'
+    build_anki_package(package, [
+        ('<b>cuchara</b>', 'spoon', 'koo-CHAH-rah'),
+        ('tenedor', 'fork&nbsp;', 'teh-neh-DOR'),
+        ('hola', 'hello', 'OH-lah'),
+        ('vacío', '', '')
+    ], field_names=('Spanish', 'English', 'Pronunciation'))
+    
+    with open(package, 'rb') as f:
+        response = client.post('/api/admin/import', data={'file': (f, 'kitchen.apkg')})
+    assert response.status_code == 200
+    
+    data = response.get_json()
+    assert data['received'] == 3
+    assert data['inserted'] == 2
+    assert data['duplicates'] == 1
+    assert data['linked'] == 3
+    assert data['skipped'] == 1
+    
+    words = client.get(f"/api/groups/{data['group_id']}/words").get_json()['words']
+    assert {w['spanish']: w['english'] for w in words} == {
+        'hola': 'hello', 'cuchara': 'spoon', 'tenedor': 'fork'
+    }
+    groups = client.get('/api/groups').get_json()['items']
+    assert any(g['name'] == 'kitchen' and g['words_count'] == 3 for g in groups)
+
+def test_import_csv_export(client, seed_db):
+    """Test importing a headerless CSV card export into an existing group."""
+    csv_body = b'uno,one\ndos,two\n'
+    response = client.post('/api/admin/import', data={
+        'file': (io.BytesIO(csv_body), 'numbers.csv'),
+        'group_id': '2',
+        'columns': 'spanish,english'
+    })
+    assert response.status_code == 200
+    
+    data = response.get_json()
+    assert data['group_id'] == 2
+    assert data['inserted'] == 2
+    assert data['linked'] == 2
+
+def test_import_invalid_files(client, seed_db, tmp_path):
+    response = client.post('/api/admin/import', data={})
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Missing file'
+    
+    response = client.post('/api/admin/import', data={
+        'file': (io.BytesIO(b'data'), 'deck.pdf')
+    })
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Unsupported file type'
+    
+    response = client.post('/api/admin/import', data={
+        'file': (io.BytesIO(b'not a zip'), 'deck.apkg')
+    })
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Invalid import file'
+    
+    # A field over the csv module's size limit
+    response = client.post('/api/admin/import', data={
+        'file': (io.BytesIO(b'uno,' + b'x' * 200000 + b'\n'), 'huge.csv'),
+        'columns': 'spanish,english'
+    })
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Invalid import file'
+    
+    # Failed imports don't leave the groups they would have created
+    package = tmp_path / 'broken.apkg'
+    with zipfile.ZipFile(package, 'w') as f:
+        f.writestr('collection.anki2', b'not a database')
+    with open(package, 'rb') as f:
+        response = client.post('/api/admin/import', data={'file': (f, 'broken.apkg')})
+    assert response.status_code == 400
+    groups = {g['name'] for g in client.get('/api/groups').get_json()['items']}
+    assert not groups & {'deck', 'huge', 'broken'}
+
+def test_online_backup(client, seed_db, app, tmp_path):
+    """Test on-demand backups.
+    
+    Verifies:
+    - The backup copies the database in several steps and verifies it
+    - Duration and request latency before/during the backup are reported
+    - Only BACKUP_KEEP backups are kept
+    """
+    app.config.update(BACKUP_DIR=str(tmp_path), BACKUP_PAGES_PER_STEP=1,
+                      BACKUP_STEP_SLEEP=0, BACKUP_KEEP=2)
+    runner = app.extensions['backups']
+    client.get('/api/dashboard/study_progress')
+
+    response = client.post('/api/admin/backup')
+    assert response.status_code == 202
+    runner.wait(30)
+
+    data = client.get('/api/admin/backup').get_json()
+    assert data['running'] is False
+    last = data['last']
+    words = last['files']['words']
+    assert words['integrity'] == 'ok' and words['steps'] == words['pages'] > 1
+    assert last['duration_seconds'] >= 0
+    assert set(last['latency']) == {'before', 'during'}
+    assert [backup['name'] for backup in data['backups']] == [last['name']]
+
+    conn = sqlite3.connect(str(tmp_path / last['name'] / 'words.db'))
+    assert conn.execute("SELECT COUNT(*) FROM words").fetchone()[0] == 3
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == 'delete'
+    conn.close()
+
+    for _ in range(2):
+        client.post('/api/admin/backup')
+        runner.wait(30)
+    backups = client.get('/api/admin/backup').get_json()['backups']
+    assert len(backups) == 2 and last['name'] not in [backup['name'] for backup in backups]
+    assert runner.last['rotated'] == [last['name']]
+
+def test_backup_in_progress(client, seed_db, app, tmp_path):
+    """Test that only one backup runs at a time, in and across processes"""
+    release = threading.Event()
+    runner = app.extensions['backups']
+    runner.thread = threading.Thread(target=release.wait)
+    runner.thread.start()
+    try:
+        assert client.post('/api/admin/backup').status_code == 409
+        assert client.get('/api/admin/backup').get_json()['running'] is True
+    finally:
+        release.set()
+        runner.thread.join()
+
+    with open(tmp_path / 'lock', 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        with pytest.raises(BackupInProgressError):
+            run_backup({'words': seed_db}, str(tmp_path), 100, 0, 1)
+
+def test_backup_sharded(seed_db, tmp_path):
+    """Test that a backup of learner shards includes their review archives"""
+    conn = sqlite3.connect(seed_db)
+    conn.execute("PRAGMA foreign_keys = ON")
+    shard_history(conn, TestConfig.SHARD_DIR)
+    attach_history(conn, shard_path(TestConfig.SHARD_DIR, 'default'))
+    old_session = conn.execute("""
+        INSERT INTO study_sessions (group_id, study_activity_id, created_at)
+        VALUES (1, 1, '2024-01-10 09:00:00')
+    """).lastrowid
+    conn.execute("""
+        INSERT INTO word_review_items (word_id, study_session_id, correct, created_at)
+        VALUES (1, ?, 0, '2024-01-10 09:00:00')
+    """, (old_session,))
+    conn.commit()
+    archive_path = shard_archive_path(TestConfig.SHARD_DIR, 'default')
+    result = partition_reviews(conn, archive_path, archive_after_months=1)
+    assert result['archived'] == ['word_review_items_2024_01']
+    conn.close()
+
+    files = backup_files({
+        'SQLITE_DB_PATH': seed_db, 'STORAGE_LAYOUT': 'sharded',
+        'REVIEW_ARCHIVE_PATH': TestConfig.REVIEW_ARCHIVE_PATH, 'SHARD_DIR': TestConfig.SHARD_DIR
+    })
+    assert files['shard-default-archive'] == archive_path
+    manifest = run_backup(files, str(tmp_path), 100, 0, 1)
+    assert manifest['files']['shard-default-archive']['integrity'] == 'ok'
+
+    copy = sqlite3.connect(str(tmp_path / manifest['name'] / 'shard-default-archive.db'))
+    assert copy.execute("SELECT COUNT(*) FROM word_review_items_2024_01").fetchone()[0] == 1
+    copy.close()
+
+def test_backup_alongside_writes(seed_db, tmp_path):
+    """Test that writers keep committing while a paced backup runs"""
+    done = threading.Event()
+    waits = []
+
+    def write():
+        conn = sqlite3.connect(seed_db, timeout=10)
+        while not done.is_set():
+            started = time.perf_counter()
+            conn.execute("UPDATE words SET english = english WHERE id = 1")
+            conn.commit()
+            waits.append(time.perf_counter() - started)
+            time.sleep(0.002)
+        conn.close()
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    try:
+        stats = backup_database(seed_db, str(tmp_path / 'words.db'), 1, 0.005)
+    finally:
+        done.set()
+        writer.join()
+    verify_backup(str(tmp_path / 'words.db'))
+    assert waits and max(waits) < 1
+    # Writes that keep restarting the paced copy push it to a single step
+    assert stats['single_step'] == (stats['restarts'] >= MAX_PACED_RESTARTS)
+    assert stats['single_step'] or stats['steps'] >= stats['pages']
@@ -76,6 +76,22 @@ def test_get_quick_stats(client, seed_db):
     assert data['total_sessions'] >= 5  # At least our 5 test sessions
     assert data['current_streak'] >= 4  # Should have 4-day streak
 
+def test_quick_stats_streak_needs_today(client, seed_db):
+    """A streak that ended yesterday is not current"""
+    assert client.post('/api/reset_history').status_code == 200
+    conn = sqlite3.connect(seed_db)
+    conn.execute("""
+        INSERT INTO study_sessions (group_id, study_activity_id, created_at) VALUES
+            (1, 1, date('now', '-1 day')),
+            (1, 1, date('now', '-2 days'))
+    """)
+    conn.commit()
+    conn.close()
+    assert client.get('/api/dashboard/quick_stats').get_json()['current_streak'] == 0
+
+    client.post('/api/study_sessions', json={'group_id': 1, 'activity_id': 1})
+    assert client.get('/api/dashboard/quick_stats').get_json()['current_streak'] == 3
+
 def test_get_study_stats(client, seed_db):
     """Test retrieving study statistics.
     
@@ -1,7 +1,20 @@
 import pytest
+import json
+import os
 import sqlite3
+import subprocess
+import sys
+import time
+import tracemalloc
 from unittest.mock import patch
-from lib.db import get_db
+from app import create_app
+from config import TestConfig
+from lib.db import ShardRouter, get_db, open_connection, run_migrations
+from lib.models import GroupWord
+from lib.partitions import partition_reviews
+from lib.replication import apply_segments, pinned_path, replica_path
+from lib.repository import QUERIES, fetch_all, fetch_one
+from lib.storage import list_learners, shard_history, split_history
 from flask import current_app
 
 def test_database_connection_error(client, seed_db):
@@ -40,4 +53,365 @@ def test_foreign_key_constraints(client, seed_db):
             cursor.execute("""
                 INSERT INTO word_groups (word_id, group_id)
                 VALUES (999, 999)
-            """)
\ No newline at end of file
+            """)
+class SplitConfig(TestConfig):
+    STORAGE_LAYOUT = 'split'
+
+def test_split_storage_layout(seed_db, tmp_path):
+    """Test moving study history into its own attached database file.
+    
+    Verifies:
+    - Sessions, reviews and main-database partitions move with their rows
+    - The app reads and writes history through the attached file
+    - Review counts and the change feed entries of history rows live in
+      the history file, so writing history leaves words.db untouched
+    - Cross-file foreign keys still work
+    - History-only migrations run against the history file
+    """
+    conn = sqlite3.connect(seed_db)
+    conn.execute("PRAGMA foreign_keys = ON")
+    old_session = conn.execute("""
+        INSERT INTO study_sessions (group_id, study_activity_id, created_at)
+        VALUES (1, 1, '2024-01-10 09:00:00')
+    """).lastrowid
+    conn.execute("""
+        INSERT INTO word_review_items (word_id, study_session_id, correct, created_at)
+        VALUES (1, ?, 0, '2024-01-10 09:00:00')
+    """, (old_session,))
+    conn.commit()
+    partition_reviews(conn, TestConfig.REVIEW_ARCHIVE_PATH, archive_after_months=1200)
+
+    moved = split_history(conn, SplitConfig.HISTORY_DB_PATH)
+    assert moved['study_sessions'] == 3
+    assert moved['word_review_items'] == 6
+    assert moved['word_review_items_2024_01'] == 1
+    assert not conn.execute("""
+        SELECT 1 FROM main.sqlite_master WHERE name IN ('study_sessions', 'word_review_items')
+    """).fetchone()
+    conn.close()
+
+    client = create_app(SplitConfig).test_client()
+    # The first request switches words.db to WAL
+    assert client.get('/api/study_sessions').status_code == 200
+    vocab = sqlite3.connect(seed_db)
+    vocab_version = vocab.execute("PRAGMA data_version").fetchone()[0]
+    response = client.post('/api/study_sessions', json={'group_id': 1, 'activity_id': 1})
+    session_id = response.get_json()['session']['id']
+    assert session_id == old_session + 1
+    assert client.post(f'/api/study_sessions/{session_id}/words/2/review',
+                       json={'correct': True}).status_code == 200
+    assert vocab.execute("PRAGMA data_version").fetchone()[0] == vocab_version
+    assert vocab.execute("SELECT COUNT(*) FROM words WHERE studied").fetchone()[0] == 0
+    assert not vocab.execute("""
+        SELECT 1 FROM change_log WHERE table_name IN ('study_sessions', 'word_review_items')
+    """).fetchone()
+    vocab.close()
+    assert client.get(f'/api/study_sessions/{old_session}/stats').get_json()['total_words'] == 1
+    feed = client.get('/api/changes?since=0&history_since=0').get_json()
+    assert len(feed['upserts']['study_sessions']) == 4
+    assert len(feed['upserts']['word_review_items']) == 8
+    assert feed['history_version'] > feed['version']
+    words = client.get('/api/words?sort=correct_count&order=desc&limit=2').get_json()['items']
+    assert [(w['id'], w['correct_count']) for w in words] == [(2, 3), (3, 2)]
+    assert client.get('/api/dashboard/study_progress').get_json()['total_words_studied'] == 3
+    export = client.get('/api/export/word_review_items')
+    assert export.headers['X-Export-Until'] == '8'
+
+    history = sqlite3.connect(SplitConfig.HISTORY_DB_PATH)
+    assert history.execute("SELECT COUNT(*) FROM word_review_items").fetchone()[0] == 7
+    history.close()
+
+    conn = open_connection(seed_db, history_path=SplitConfig.HISTORY_DB_PATH)
+    assert conn.execute("SELECT correct_count FROM word_review_counts WHERE word_id = 2").fetchone()[0] == 3
+    with pytest.raises(sqlite3.IntegrityError):
+        conn.execute("""
+            INSERT INTO word_review_items (word_id, study_session_id, correct, created_at)
+            VALUES (999, ?, 1, datetime('now'))
+        """, (session_id,))
+    with pytest.raises(sqlite3.IntegrityError):
+        conn.execute("DELETE FROM groups WHERE id = 1")
+    conn.rollback()
+
+    migrations = tmp_path / 'migrations'
+    migrations.mkdir()
+    (migrations / '100_index_review_correct.sql').write_text(
+        "-- database: history\n"
+        "CREATE INDEX IF NOT EXISTS idx_word_review_items_correct ON word_review_items (correct);\n"
+    )
+    assert run_migrations(conn, str(migrations), history_paths=[SplitConfig.HISTORY_DB_PATH]) == [
+        '100_index_review_correct.sql'
+    ]
+    assert conn.execute("""
+        SELECT 1 FROM history.sqlite_master WHERE name = 'idx_word_review_items_correct'
+    """).fetchone()
+    conn.close()
+
+    assert client.post('/api/reset_history').status_code == 200
+    assert client.get('/api/dashboard/study_progress').get_json()['total_words_studied'] == 0
+
+class ShardConfig(TestConfig):
+    STORAGE_LAYOUT = 'sharded'
+    SHARD_CACHE_SIZE = 2
+
+def test_sharded_learners(seed_db):
+    """Test keeping each learner's history in their own shard.
+    
+    Verifies:
+    - Requests need a valid learner id
+    - Existing history belongs to the default learner
+    - Sessions, reviews and the history change feed are per learner
+    - The router keeps at most SHARD_CACHE_SIZE idle connections
+    - Deleting and merging groups sees every learner's sessions
+    - A full reset clears every learner's shard in place
+    """
+    conn = sqlite3.connect(seed_db)
+    conn.execute("PRAGMA foreign_keys = ON")
+    moved = shard_history(conn, ShardConfig.SHARD_DIR)
+    assert moved['study_sessions'] == 2
+    assert moved['word_review_items'] == 6
+    conn.close()
+
+    app = create_app(ShardConfig)
+    client = app.test_client()
+    assert client.get('/api/study_sessions').status_code == 400
+    assert client.get('/api/study_sessions', headers={'X-Learner-Id': '../words'}).status_code == 400
+
+    def sessions_of(learner):
+        return client.get('/api/study_sessions',
+                          headers={'X-Learner-Id': learner}).get_json()['total_sessions']
+
+    assert sessions_of('default') == 2
+    assert sessions_of('alice') == 0
+    for learner in ('alice', 'bob'):
+        response = client.post('/api/study_sessions', json={'group_id': 1, 'activity_id': 1},
+                               headers={'X-Learner-Id': learner})
+        assert response.get_json()['session']['id'] == 1
+    response = client.post('/api/study_sessions/1/words/1/review', json={'correct': False},
+                           headers={'X-Learner-Id': 'alice'})
+    assert response.status_code == 200
+    assert sessions_of('alice') == 1 and sessions_of('default') == 2
+
+    feed = client.get('/api/changes?since=0&history_since=0',
+                      headers={'X-Learner-Id': 'alice'}).get_json()
+    assert [s['id'] for s in feed['upserts']['study_sessions']] == [1]
+    assert len(feed['upserts']['word_review_items']) == 1
+    assert feed['history_version'] == 2
+    bob_feed = client.get('/api/changes?since=0', headers={'X-Learner-Id': 'bob'}).get_json()
+    assert 'word_review_items' not in bob_feed['upserts']
+    assert bob_feed['version'] == feed['version']
+
+    # Review counts are each learner's own, kept in their shard
+    def word_counts(learner, query=''):
+        response = client.get(f'/api/words?limit=10{query}', headers={'X-Learner-Id': learner})
+        return {w['id']: (w['correct_count'], w['wrong_count']) for w in response.get_json()['items']}
+
+    assert word_counts('default')[1] == (2, 0)
+    assert word_counts('alice')[1] == (0, 1)
+    assert word_counts('alice', '&studied=true') == {1: (0, 1)}
+    assert word_counts('carol', '&studied=true') == {}
+    assert set(word_counts('carol').values()) == {(0, 0)}
+    progress = client.get('/api/dashboard/study_progress', headers={'X-Learner-Id': 'carol'}).get_json()
+    assert progress['total_words_studied'] == 0
+    progress = client.get('/api/dashboard/study_progress', headers={'X-Learner-Id': 'default'}).get_json()
+    assert progress['total_words_studied'] == 3
+
+    assert client.post('/api/reset_history', headers={'X-Learner-Id': 'alice'}).status_code == 200
+    assert sessions_of('alice') == 0 and sessions_of('default') == 2
+    assert len(app.extensions['shard_router'].idle) == 2
+    assert list_learners(ShardConfig.SHARD_DIR) == ['alice', 'bob', 'carol', 'default']
+
+    # Only alice has a session in group 2, so bob may not delete it
+    response = client.post('/api/study_sessions', json={'group_id': 2, 'activity_id': 1},
+                           headers={'X-Learner-Id': 'alice'})
+    alice_session = response.get_json()['session']['id']
+    response = client.delete('/api/groups/2', headers={'X-Learner-Id': 'bob'})
+    assert response.status_code == 409
+    response = client.post('/api/groups/1/merge', json={'group_ids': [2]},
+                           headers={'X-Learner-Id': 'bob'})
+    assert response.status_code == 200
+    response = client.get('/api/groups/1/study_sessions', headers={'X-Learner-Id': 'alice'})
+    assert alice_session in [s['id'] for s in response.get_json()['items']]
+
+    assert client.post('/api/full_reset', headers={'X-Learner-Id': 'bob'}).status_code == 200
+    assert list_learners(ShardConfig.SHARD_DIR) == ['alice', 'bob', 'carol', 'default']
+    for conn in app.extensions['shard_router'].idle.values():
+        assert conn.execute("SELECT COUNT(*) FROM study_sessions").fetchone()[0] == 0
+    assert all(sessions_of(learner) == 0 for learner in ('alice', 'bob', 'carol', 'default'))
+
+def test_shard_router_lru():
+    """Test the shard router's connection cache with 10,000 learners.
+    
+    Verifies:
+    - At most `capacity` idle connections stay open, evicting the least
+      recently used
+    - A returning learner gets their open connection back
+    - Concurrent requests of one learner never share a connection
+    - Routing time does not grow with the number of learners
+    """
+    opened = {}
+
+    def open_shard(learner):
+        opened[learner] = sqlite3.connect(':memory:', check_same_thread=False)
+        return opened[learner]
+
+    router = ShardRouter(open_shard, capacity=100)
+
+    def visit(learner):
+        conn = router.checkout(learner)
+        conn.execute("SELECT 1")
+        router.checkin(learner, conn)
+        return conn
+
+    timings = []
+    for n in range(10000):
+        started = time.perf_counter()
+        visit(f"learner-{n}")
+        timings.append(time.perf_counter() - started)
+
+    assert len(opened) == 10000
+    assert list(router.idle) == [f"learner-{n}" for n in range(9900, 10000)]
+    with pytest.raises(sqlite3.ProgrammingError):
+        opened['learner-0'].execute("SELECT 1")
+
+    assert visit('learner-9950') is opened['learner-9950']
+    assert list(router.idle)[-1] == 'learner-9950'
+    assert len(opened) == 10000
+
+    first = router.checkout('learner-9999')
+    second = router.checkout('learner-9999')
+    assert first is not second
+    router.checkin('learner-9999', first)
+    router.checkin('learner-9999', second)
+    assert router.idle['learner-9999'] is first
+    with pytest.raises(sqlite3.ProgrammingError):
+        second.execute("SELECT 1")
+
+    # Median routing time of the last thousand learners against the first
+    early = sorted(timings[:1000])[500]
+    late = sorted(timings[-1000:])[500]
+    assert late < early * 5
+
+    router.close_all()
+    assert not router.idle
+
+def test_repository_queries(seed_db):
+    """Registered queries compile and return slotted row types"""
+    conn = open_connection(seed_db)
+    conn.row_factory = sqlite3.Row
+    for query in QUERIES.values():
+        # EXPLAIN compiles a statement without running it
+        sql = query.sql.format(reviews='word_review_items', counts='words')
+        conn.execute(f"EXPLAIN {sql}", (None,) * sql.count('?')).fetchall()
+
+    words = fetch_all(conn, 'group_words', (1,))
+    assert words and all(isinstance(word, GroupWord) for word in words)
+    assert not hasattr(words[0], '__dict__')
+    assert fetch_one(conn, 'session_created_ts', (999,)) is None
+    stats = fetch_one(conn, 'session_stats', (1,), reviews='word_review_items')
+    assert stats.total_words == 3
+    conn.close()
+
+    app = create_app(TestConfig)
+    with app.app_context():
+        assert json.loads(app.json.dumps(words[0])) == {
+            'id': words[0].id, 'spanish': words[0].spanish,
+            'english': words[0].english, 'pronunciation': words[0].pronunciation
+        }
+
+def test_repository_allocations(test_db):
+    """Rows as slotted objects allocate well under sqlite3.Row-then-dict rows"""
+    conn = open_connection(test_db)
+    conn.execute("INSERT INTO groups (name) VALUES ('Many')")
+    conn.executemany("INSERT INTO words (spanish, pronunciation, english) VALUES (?, ?, ?)",
+                     [(f"palabra {i}", f"pa-la-bra {i}", f"word {i}") for i in range(5000)])
+    conn.execute("INSERT INTO word_groups (group_id, word_id) SELECT 1, id FROM words")
+    conn.commit()
+    conn.row_factory = sqlite3.Row
+
+    def peak(fetch):
+        tracemalloc.start()
+        try:
+            rows = fetch()
+            return len(rows), tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    sql = QUERIES['group_words'].sql
+    count, dict_peak = peak(lambda: [dict(row) for row in conn.execute(sql, (1,)).fetchall()])
+    assert count == 5000
+    count, model_peak = peak(lambda: fetch_all(conn, 'group_words', (1,)))
+    assert count == 5000
+    assert model_peak < dict_peak * 0.75
+    conn.close()
+
+# Stands in for the primary node: writes a word, then ships
+PRIMARY_PROCESS = """
+import json, sqlite3, sys
+from lib.replication import Shipper
+db_path, directory, spanish = sys.argv[1:]
+conn = sqlite3.connect(db_path)
+conn.execute("INSERT INTO words (spanish, pronunciation, english) VALUES (?, '-', ?)",
+             (spanish, spanish))
+conn.commit()
+conn.close()
+shipper = Shipper({'words': db_path}, directory)
+print(json.dumps(shipper.ship()))
+shipper.close()
+"""
+
+def test_read_replica(seed_db, tmp_path):
+    """A primary process ships page diffs; a replica app applies them as
+    whole versions, serves reads and redirects writes"""
+    directory, replica_dir = str(tmp_path / 'replication'), str(tmp_path / 'replica')
+
+    def primary_writes(spanish):
+        result = subprocess.run([sys.executable, '-c', PRIMARY_PROCESS, seed_db, directory, spanish],
+                                capture_output=True, text=True, check=True)
+        return json.loads(result.stdout)
+
+    class ReplicaConfig(TestConfig):
+        REPLICATION_DIR = directory
+        REPLICA_DIR = replica_dir
+        REPLICATION_PRIMARY_URL = 'http://primary.test'
+
+    first = primary_writes('replicado')
+    assert first['sequence'] == 1
+    assert apply_segments(directory, replica_dir) == 1
+
+    client = create_app(ReplicaConfig).test_client()
+    total = client.get('/api/dashboard/study_progress').get_json()['total_words']
+    conn = sqlite3.connect(seed_db)
+    assert total == conn.execute("SELECT COUNT(*) FROM words").fetchone()[0]
+    conn.close()
+
+    # A connection open during an apply keeps reading the version it opened
+    held = sqlite3.connect(replica_path(replica_dir, 'words'))
+    assert held.execute("SELECT COUNT(*) FROM words").fetchone()[0] == total
+
+    second = primary_writes('otra')
+    conn = sqlite3.connect(seed_db)
+    page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+    conn.close()
+    assert second['sequence'] == 2 and 0 < second['pages']['words'] < page_count
+    status = client.get('/api/admin/replication').get_json()
+    assert status['role'] == 'replica'
+    assert (status['sequence'], status['primary_sequence'], status['segments_behind']) == (1, 2, 1)
+    assert status['lag_seconds'] >= 0
+
+    with client.application.app_context():
+        pinned = pinned_path(replica_path(replica_dir, 'words'))
+        assert apply_segments(directory, replica_dir) == 1
+        # Files opened later in a request come from the version it started with
+        archive = pinned_path(replica_path(replica_dir, 'review_archive'))
+        assert os.path.dirname(archive) == os.path.dirname(pinned)
+    assert os.path.exists(pinned)
+    assert os.path.realpath(replica_path(replica_dir, 'words')) != pinned
+    assert client.get('/api/dashboard/study_progress').get_json()['total_words'] == total + 1
+    assert held.execute("SELECT COUNT(*) FROM words").fetchone()[0] == total
+    held.close()
+    status = client.get('/api/admin/replication').get_json()
+    assert (status['sequence'], status['segments_behind'], status['lag_seconds']) == (2, 0, 0)
+
+    response = client.post('/api/study_sessions?source=test', json={'group_id': 1, 'activity_id': 1})
+    assert response.status_code == 307
+    assert response.headers['Location'] == 'http://primary.test/api/study_sessions?source=test'
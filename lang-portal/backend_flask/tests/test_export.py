@@ -0,0 +1,200 @@
+import pytest
+import sqlite3
+import json
+import gzip
+
+def test_export_ndjson(client, seed_db):
+    """Test streaming a table as NDJSON.
+    
+    Verifies:
+    - One JSON object per line in id order
+    - Export bounds are reported in headers
+    """
+    response = client.get('/api/export/words?format=ndjson')
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    assert response.headers['X-Export-Until'] == '3'
+    
+    rows = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert [row['spanish'] for row in rows] == ['hola', 'gracias', 'por favor']
+    assert set(rows[0]) == {'id', 'spanish', 'pronunciation', 'english'}
+
+def test_export_csv_since(client, seed_db):
+    """Test incremental CSV export of review history."""
+    response = client.get('/api/export/word_review_items?format=csv&since=4')
+    assert response.status_code == 200
+    
+    lines = response.data.decode().splitlines()
+    assert lines[0] == 'id,word_id,study_session_id,correct,created_at'
+    assert [line.split(',')[0] for line in lines[1:]] == ['5', '6']
+
+def test_export_word_groups_by_group(client, seed_db):
+    """Test that memberships export in key order with a group id cursor."""
+    client.post('/api/groups/2/words', json={'word_id': 2})
+    response = client.get('/api/export/word_groups?format=csv')
+    assert response.headers['X-Export-Until'] == '2'
+    lines = response.data.decode().splitlines()
+    assert lines == ['group_id,word_id', '1,1', '1,2', '1,3', '2,2']
+
+    response = client.get('/api/export/word_groups?format=csv&since=1')
+    assert response.data.decode().splitlines()[1:] == ['2,2']
+
+def test_export_gzip(client, seed_db):
+    """Test gzip content encoding when the client accepts it."""
+    response = client.get('/api/export/study_sessions',
+                          headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    
+    lines = gzip.decompress(response.data).decode().splitlines()
+    assert len(lines) == 2
+
+def test_export_snapshot_excludes_later_writes(client, seed_db, app):
+    """Test that rows committed mid-export are not streamed.
+    
+    Verifies:
+    - The export reads from the snapshot taken when it started
+    - Writers are not blocked while the export is open
+    """
+    app.config['EXPORT_BATCH_SIZE'] = 1
+    response = client.get('/api/export/words', buffered=False)
+    chunks = iter(response.response)
+    first = next(chunks)
+    
+    conn = sqlite3.connect(seed_db, timeout=0)
+    conn.execute("""
+        INSERT INTO words (spanish, pronunciation, english)
+        VALUES ('nuevo', 'NWEH-voh', 'new')
+    """)
+    conn.commit()
+    conn.close()
+    
+    body = first + b''.join(chunks)
+    response.close()
+    assert b'nuevo' not in body
+    assert len(body.splitlines()) == 3
+
+def test_export_invalid_requests(client, seed_db):
+    response = client.get('/api/export/schema_migrations')
+    assert response.status_code == 404
+    assert response.get_json()['error'] == 'Unknown table'
+    
+    response = client.get('/api/export/words?format=xml')
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Invalid format'
+
+def test_columnar_export_incremental(client, seed_db, app, tmp_path):
+    """Test monthly columnar export of review history.
+    
+    Verifies:
+    - Reviews are partitioned by month of created_at
+    - Parts decode back to the original rows
+    - A second run only appends reviews added since the first
+    """
+    from lib.columnar import read_review_part
+    
+    app.config['REVIEW_EXPORT_DIR'] = str(tmp_path)
+    conn = sqlite3.connect(seed_db)
+    conn.execute("UPDATE word_review_items SET created_at = '2024-01-31 23:59:59', correct = 0 WHERE id = 2")
+    conn.commit()
+    
+    response = client.post('/api/export/columnar?format=npz')
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['rows'] == 6
+    assert data['last_id'] == 6
+    assert {p['month'] for p in data['parts']} >= {'2024-01'}
+    
+    january = next(p for p in data['parts'] if p['month'] == '2024-01')
+    columns = read_review_part(str(tmp_path / '2024-01' / january['file']))
+    assert list(columns['id']) == [2]
+    assert list(columns['correct']) == [False]
+    assert list(columns['created_at']) == [1706745599]
+    
+    others = [p for p in data['parts'] if p['month'] != '2024-01']
+    columns = read_review_part(str(tmp_path / others[0]['month'] / others[0]['file']))
+    assert list(columns['id']) == [1, 3, 4, 5, 6]
+    assert columns['word_id'].dtype.name == 'int32'
+    
+    conn.execute("""
+        INSERT INTO word_review_items (word_id, study_session_id, correct, created_at)
+        VALUES (1, 1, 1, '2024-02-01 08:00:00')
+    """)
+    conn.commit()
+    conn.close()
+    
+    data = client.post('/api/export/columnar?format=npz').get_json()
+    assert data['rows'] == 1
+    assert data['parts'] == [{'month': '2024-02', 'file': 'part-0000000007-0000000007.npz', 'rows': 1}]
+    
+    state = client.get('/api/export/columnar').get_json()
+    assert state['last_id'] == 7
+    assert len(state['parts']) == 3
+    
+    response = client.get('/api/export/columnar/2024-02/part-0000000007-0000000007.npz')
+    assert response.status_code == 200
+
+def test_columnar_export_parquet(client, seed_db, app, tmp_path):
+    pytest.importorskip('pyarrow')
+    from lib.columnar import read_review_part
+    
+    app.config['REVIEW_EXPORT_DIR'] = str(tmp_path)
+    data = client.post('/api/export/columnar?format=parquet').get_json()
+    assert data['format'] == 'parquet'
+    
+    part = data['parts'][0]
+    columns = read_review_part(str(tmp_path / part['month'] / part['file']))
+    assert list(columns['id']) == [1, 2, 3, 4, 5, 6]
+    assert columns['correct'].all()
+
+def test_columnar_export_invalid_format(client, seed_db, app, tmp_path):
+    app.config['REVIEW_EXPORT_DIR'] = str(tmp_path)
+    response = client.post('/api/export/columnar?format=xlsx')
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Invalid format'
+
+def test_vocab_pack_download(client, seed_db, app, tmp_path):
+    """Test building and downloading the binary vocabulary pack.
+    
+    Verifies:
+    - The pack records the change_log version it was built from
+    - Downloads carry an ETag and honour If-None-Match
+    - Range requests return partial content
+    """
+    app.config['VOCAB_PACK_PATH'] = str(tmp_path / 'vocab.pack')
+    response = client.get('/api/export/pack')
+    assert response.status_code == 404
+    assert response.get_json()['error'] == 'Pack not built'
+    
+    data = client.post('/api/export/pack').get_json()
+    assert data['words'] == 3
+    assert data['memberships'] == 3
+    assert data['data_version'] > 0
+    
+    response = client.get('/api/export/pack')
+    assert response.status_code == 200
+    assert response.data[:4] == b'VPAK'
+    assert len(response.data) == data['size']
+    etag = response.headers['ETag']
+    assert data['checksum'] in etag
+    
+    response = client.get('/api/export/pack', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    
+    response = client.get('/api/export/pack', headers={'Range': 'bytes=0-3'})
+    assert response.status_code == 206
+    assert response.data == b'VPAK'
+
+def test_vocab_pack_rejects_corrupt_file(app, seed_db, tmp_path):
+    from lib.vocab_pack import VocabPack, VocabPackError, build_vocab_pack
+    
+    path = str(tmp_path / 'vocab.pack')
+    conn = sqlite3.connect(seed_db)
+    build_vocab_pack(conn, path)
+    conn.close()
+    
+    with open(path, 'r+b') as f:
+        f.seek(-1, 2)
+        f.write(b'X')
+    with pytest.raises(VocabPackError):
+        VocabPack(path)
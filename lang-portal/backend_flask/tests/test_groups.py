@@ -3,6 +3,11 @@ from app import create_app
 from config import Config
 import sqlite3
 import os
+import threading
+from lib.counters import find_words_count_drift, reconcile_words_count
+from lib.db import open_connection
+from lib import group_ops
+from unittest.mock import patch
 
 def test_get_groups_first_page(client, seed_db):
     """Test retrieving the first page of word groups.
@@ -278,4 +283,209 @@ def test_get_group_words_invalid_group(client, seed_db):
     """
     response = client.get('/api/groups/999/words')
     assert response.status_code == 404
-    assert response.get_json()['error'] == 'Group not found' 
\ No newline at end of file
+    assert response.get_json()['error'] == 'Group not found' 
+
+def test_word_groups_membership_key(client, seed_db):
+    """Test memberships keyed by (group_id, word_id).
+    
+    Verifies:
+    - A pair can only be stored once, even outside the API
+    - Failed adds leave the group count untouched
+    - Deleting a word removes its memberships
+    - Group words come back in word id order
+    """
+    conn = sqlite3.connect(seed_db)
+    conn.execute("PRAGMA foreign_keys = ON")
+    with pytest.raises(sqlite3.IntegrityError):
+        conn.execute("INSERT INTO word_groups (group_id, word_id) VALUES (1, 1)")
+    conn.rollback()
+
+    assert client.post('/api/groups/2/words', json={'word_id': 3}).status_code == 200
+    assert client.post('/api/groups/2/words', json={'word_id': 3}).status_code == 400
+    assert client.post('/api/groups/2/words', json={'word_id': 999}).status_code == 404
+    assert client.post('/api/groups/2/words', json={'word_id': 1}).status_code == 200
+    group = next(g for g in client.get('/api/groups').get_json()['items'] if g['id'] == 2)
+    assert group['words_count'] == 2
+    assert [w['id'] for w in client.get('/api/groups/2/words').get_json()['words']] == [1, 3]
+
+    conn.execute("DELETE FROM word_review_items WHERE word_id = 3")
+    conn.execute("DELETE FROM words WHERE id = 3")
+    conn.commit()
+    assert conn.execute("SELECT group_id FROM word_groups WHERE word_id = 3").fetchall() == []
+    conn.close()
+
+def test_words_count_follows_membership_changes(client, seed_db):
+    """Test the trigger-maintained group word count.
+    
+    Verifies:
+    - Seeded memberships are counted without any application update
+    - Direct inserts and deletes on word_groups adjust the count
+    - Deleting a word cascades into the count of its groups
+    - Drift is reported and reconciled
+    """
+    conn = sqlite3.connect(seed_db)
+    conn.execute("PRAGMA foreign_keys = ON")
+    counts = lambda: dict(conn.execute("SELECT id, words_count FROM groups"))
+    assert counts() == {1: 3, 2: 0}
+
+    conn.executemany("INSERT INTO word_groups (group_id, word_id) VALUES (2, ?)", [(1,), (2,)])
+    conn.execute("DELETE FROM word_groups WHERE group_id = 1 AND word_id = 3")
+    assert counts() == {1: 2, 2: 2}
+
+    conn.execute("DELETE FROM word_review_items WHERE word_id = 1")
+    conn.execute("DELETE FROM words WHERE id = 1")
+    assert counts() == {1: 1, 2: 1}
+
+    conn.execute("UPDATE groups SET words_count = 7 WHERE id = 2")
+    assert find_words_count_drift(conn) == [(2, 'Numbers', 7, 1)]
+    assert reconcile_words_count(conn) == 1
+    assert find_words_count_drift(conn) == []
+    assert counts() == {1: 1, 2: 1}
+    conn.commit()
+    conn.close()
+
+    assert client.post('/api/full_reset').status_code == 200
+    conn = sqlite3.connect(seed_db)
+    assert find_words_count_drift(conn) == []
+    conn.close()
+
+def test_words_count_under_concurrent_writers(client, seed_db):
+    """Test the group word count with many threads changing memberships.
+    
+    Verifies:
+    - Interleaved adds and removes from separate connections never lose an update
+    - The stored count matches the memberships afterwards
+    """
+    conn = sqlite3.connect(seed_db)
+    conn.executemany(
+        "INSERT INTO words (spanish, pronunciation, english) VALUES (?, '', ?)",
+        [(f'palabra {i}', f'word {i}') for i in range(40)]
+    )
+    word_ids = [row[0] for row in conn.execute("SELECT id FROM words ORDER BY id")]
+    conn.commit()
+    conn.close()
+
+    def churn(offset):
+        worker = open_connection(seed_db, 'wal', timeout=30)
+        try:
+            for round_number in range(5):
+                for word_id in word_ids[offset::8]:
+                    with worker:
+                        if round_number % 2:
+                            worker.execute(
+                                "DELETE FROM word_groups WHERE group_id = 2 AND word_id = ?",
+                                (word_id,)
+                            )
+                        else:
+                            worker.execute(
+                                "INSERT OR IGNORE INTO word_groups (group_id, word_id) VALUES (2, ?)",
+                                (word_id,)
+                            )
+        finally:
+            worker.close()
+
+    threads = [threading.Thread(target=churn, args=(offset,)) for offset in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    conn = sqlite3.connect(seed_db)
+    stored = conn.execute("SELECT words_count FROM groups WHERE id = 2").fetchone()[0]
+    actual = conn.execute("SELECT COUNT(*) FROM word_groups WHERE group_id = 2").fetchone()[0]
+    assert stored == actual == len(word_ids)
+    assert find_words_count_drift(conn) == []
+    conn.close()
+
+def test_bulk_add_and_remove_group_words(client, seed_db):
+    """Test adding and removing many words at once.
+    
+    Verifies:
+    - Unknown words and existing members are skipped
+    - Chunked execution gives the same result as one chunk
+    - The group count is reported after each operation
+    - Invalid id lists and unknown groups are rejected
+    """
+    client.application.config['GROUP_BATCH_SIZE'] = 2
+
+    response = client.post('/api/groups/2/words/bulk', json={'word_ids': [3, 1, 2, 1, 999]})
+    assert response.status_code == 200
+    assert response.get_json() == {'requested': 4, 'added': 3, 'words_count': 3}
+
+    response = client.post('/api/groups/2/words/remove', json={'word_ids': [1, 3, 42]})
+    assert response.status_code == 200
+    assert response.get_json() == {'requested': 3, 'removed': 2, 'words_count': 1}
+    assert [w['id'] for w in client.get('/api/groups/2/words').get_json()['words']] == [2]
+
+    assert client.post('/api/groups/2/words/bulk', json={'word_ids': []}).status_code == 400
+    assert client.post('/api/groups/2/words/bulk', json={'word_ids': ['1']}).status_code == 400
+    assert client.post('/api/groups/2/words/remove', json={}).status_code == 400
+    response = client.post('/api/groups/999/words/bulk', json={'word_ids': [1]})
+    assert response.status_code == 404
+    assert response.get_json()['error'] == 'Group not found'
+
+def test_clone_merge_and_delete_groups(client, seed_db):
+    """Test cloning, merging and deleting groups in chunks.
+    
+    Verifies:
+    - A clone gets every word of its source
+    - Merging moves words and study sessions, then drops the sources
+    - Groups with study sessions cannot be deleted
+    - Deleting a group unlinks its words but keeps the words
+    """
+    client.application.config['GROUP_BATCH_SIZE'] = 2
+
+    response = client.post('/api/groups/1/clone', json={'name': 'Phrases again'})
+    assert response.status_code == 201
+    clone = response.get_json()
+    assert clone['name'] == 'Phrases again'
+    assert clone['words_count'] == 3
+    assert client.post('/api/groups/1/clone').get_json()['name'] == 'Basic Phrases (copy)'
+    assert client.post('/api/groups/999/clone').status_code == 404
+
+    client.post('/api/groups/2/words', json={'word_id': 1})
+    response = client.post('/api/groups/2/merge', json={'group_ids': [1, 2]})
+    assert response.status_code == 200
+    assert response.get_json() == {'merged': 1, 'added': 2, 'words_count': 3}
+
+    conn = sqlite3.connect(seed_db)
+    assert conn.execute("SELECT 1 FROM groups WHERE id = 1").fetchone() is None
+    assert {row[0] for row in conn.execute("SELECT group_id FROM study_sessions")} == {2}
+    conn.close()
+
+    response = client.delete('/api/groups/2')
+    assert response.status_code == 409
+    assert response.get_json()['error'] == 'Group in use'
+
+    response = client.delete(f"/api/groups/{clone['id']}")
+    assert response.status_code == 200
+    assert response.get_json()['words_removed'] == 3
+    assert client.delete(f"/api/groups/{clone['id']}").status_code == 404
+
+    conn = sqlite3.connect(seed_db)
+    assert conn.execute("SELECT COUNT(*) FROM words").fetchone()[0] == 3
+    assert find_words_count_drift(conn) == []
+    conn.close()
+
+def test_delete_group_raced_by_session(client, seed_db):
+    """A session created while a group's words are unlinked keeps the group
+    and its words"""
+    client.application.config['GROUP_BATCH_SIZE'] = 1
+    group_id = client.post('/api/groups/1/clone').get_json()['id']
+    ranges = group_ops.membership_ranges
+
+    def racing_ranges(db, group_id, batch_size):
+        for n, bounds in enumerate(ranges(db, group_id, batch_size)):
+            yield bounds
+            if n == 0:
+                client.post('/api/study_sessions', json={'group_id': group_id, 'activity_id': 1})
+
+    with patch.object(group_ops, 'membership_ranges', racing_ranges):
+        response = client.delete(f'/api/groups/{group_id}')
+    assert response.status_code == 409
+    assert len(client.get(f'/api/groups/{group_id}/words').get_json()['words']) == 3
+
+    conn = sqlite3.connect(seed_db)
+    assert conn.execute("SELECT words_count FROM groups WHERE id = ?", (group_id,)).fetchone()[0] == 3
+    assert find_words_count_drift(conn) == []
+    conn.close()
@@ -1,6 +1,13 @@
 import pytest
 from app import create_app
-from config import Config
+from config import Config, TestConfig
+from lib.history import history_query, count_query, encode_cursor
+from lib.timestamps import backfill_timestamps, day_of, epoch_now, epoch_of
+from lib.partitions import (
+    delete_reviews, delete_study_sessions, partition_reviews, review_source, review_tables
+)
+import calendar
+import itertools
 import sqlite3
 import os
 
@@ -440,4 +447,265 @@ def test_get_session_history_combined_filters(client, seed_db):
     for session in data['items']:
         assert session['group_id'] == 1
         assert session['activity_name'] == 'Typing Tutor'
-        # Would also verify date here 
\ No newline at end of file
+        # Would also verify date here 
+def test_session_history_filters_and_cursor(client, seed_db):
+    """Test session history filters, nested listings and cursor pages.
+    
+    Verifies:
+    - group, activity and inclusive date range filters combine
+    - Nested group and activity listings apply their filter
+    - Cursor pages walk the history newest first without repeats
+    - Invalid filters, cursors and unknown parents are rejected
+    """
+    conn = sqlite3.connect(seed_db)
+    conn.executemany("""
+        INSERT INTO study_sessions (group_id, study_activity_id, created_at)
+        VALUES (?, ?, ?)
+    """, [
+        (1, 1, '2024-03-01 09:00:00'),
+        (2, 1, '2024-03-01 18:30:00'),
+        (2, 2, '2024-03-02 08:00:00'),
+        (1, 2, '2024-03-04 12:00:00'),
+    ])
+    conn.commit()
+    conn.close()
+    
+    items = client.get('/api/study_sessions?from=2024-03-01&to=2024-03-02').get_json()['items']
+    assert [s['created_at'] for s in items] == [
+        '2024-03-02 08:00:00', '2024-03-01 18:30:00', '2024-03-01 09:00:00'
+    ]
+    items = client.get('/api/study_sessions?group_id=2&activity_id=1&date=2024-03-01').get_json()['items']
+    assert [(s['group_id'], s['study_activity_id']) for s in items] == [(2, 1)]
+    
+    items = client.get('/api/groups/2/study_sessions').get_json()['items']
+    assert [s['created_at'] for s in items] == ['2024-03-02 08:00:00', '2024-03-01 18:30:00']
+    data = client.get('/api/study_activities/2/study_sessions?to=2024-12-31').get_json()
+    assert data['total_sessions'] == 2
+    assert all(s['activity_name'] == 'Flashcards' for s in data['items'])
+    
+    everything = client.get('/api/study_sessions').get_json()['items']
+    paged = []
+    data = client.get('/api/study_sessions?limit=2').get_json()
+    assert data['total_pages'] == 3
+    while True:
+        paged.extend(data['items'])
+        if data['next_cursor'] is None:
+            break
+        data = client.get(f"/api/study_sessions?limit=2&cursor={data['next_cursor']}").get_json()
+    assert [s['id'] for s in paged] == [s['id'] for s in everything]
+    assert len(paged) == 6
+    
+    assert client.get('/api/study_sessions?date=03/01/2024').get_json()['error'] == 'Invalid date'
+    assert client.get('/api/study_sessions?group_id=x').get_json()['error'] == 'Invalid group ID'
+    assert client.get('/api/study_sessions?cursor=bogus').get_json()['error'] == 'Invalid cursor'
+    assert client.get('/api/groups/99/study_sessions').status_code == 404
+    assert client.get('/api/study_activities/99/study_sessions').status_code == 404
+
+def test_session_history_queries_use_indexes(seed_db):
+    """Test that every history filter combination is served by an index.
+    
+    Verifies:
+    - study_sessions is always searched through an index, never scanned
+    - Rows come out of the index in order, with no sort step
+    """
+    filters = {
+        'group_id': 1, 'activity_id': 1, 'date': day_of('now'),
+        'from': day_of('2024-01-01'), 'to': day_of('2024-12-31')
+    }
+    conn = sqlite3.connect(seed_db)
+    for size in range(len(filters) + 1):
+        for names in itertools.combinations(filters, size):
+            chosen = {name: filters[name] for name in names}
+            for cursor in (None, encode_cursor(1717200000, 5)):
+                sql, params = history_query(chosen, cursor)
+                plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params + [10, 0])]
+                session_steps = [step for step in plan if ' s ' in f"{step} "]
+                assert len(session_steps) == 1, (names, plan)
+                assert 'USING INDEX idx_study_sessions_' in session_steps[0], (names, plan)
+                assert not any('TEMP B-TREE' in step for step in plan), (names, plan)
+            
+            sql, params = count_query(chosen)
+            plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+            assert all('INDEX idx_study_sessions_' in step for step in plan), (names, plan)
+    conn.close()
+
+def test_session_timestamps_and_backfill(client, seed_db):
+    """Test the integer created_ts/created_day columns.
+    
+    Verifies:
+    - API-created sessions and reviews get all three timestamp columns
+    - Rows written with only created_at are filled by the insert triggers
+    - The batched backfill fills rows that predate the columns without
+      touching the change feed
+    - API output still carries created_at only
+    """
+    session = client.post('/api/study_sessions', json={'group_id': 1, 'activity_id': 1}).get_json()['session']
+    assert set(session) == {'id', 'group_id', 'study_activity_id', 'created_at', 'completed_at'}
+    client.post(f"/api/study_sessions/{session['id']}/words/1/review", json={'correct': True})
+
+    conn = sqlite3.connect(seed_db)
+    conn.execute("""
+        INSERT INTO study_sessions (group_id, study_activity_id, created_at)
+        VALUES (1, 1, '2024-03-01 09:00:00')
+    """)
+    rows = conn.execute("""
+        SELECT created_at, created_ts, created_day FROM study_sessions
+        UNION ALL
+        SELECT created_at, created_ts, created_day FROM word_review_items
+    """).fetchall()
+    for created_at, created_ts, created_day in rows:
+        assert created_ts == epoch_of(created_at)
+        assert created_day == created_ts // 86400
+    assert (1709283600, day_of('2024-03-01')) in [(ts, day) for _, ts, day in rows]
+
+    conn.execute("UPDATE study_sessions SET created_ts = NULL, created_day = NULL")
+    conn.execute("UPDATE word_review_items SET created_ts = NULL, created_day = NULL")
+    conn.commit()
+    version = conn.execute("SELECT MAX(version) FROM change_log").fetchone()[0]
+
+    filled = backfill_timestamps(conn, batch_size=2)
+    assert filled == {'study_sessions': 4, 'word_review_items': 7}
+    assert conn.execute("""
+        SELECT COUNT(*) FROM study_sessions
+        WHERE created_ts IS NOT CAST(strftime('%s', created_at) AS INTEGER)
+    """).fetchone()[0] == 0
+    assert conn.execute("SELECT MAX(version) FROM change_log").fetchone()[0] == version
+    assert backfill_timestamps(conn) == {'study_sessions': 0, 'word_review_items': 0}
+    conn.close()
+
+    assert client.get('/api/study_sessions?date=2024-03-01').get_json()['items'][0]['created_at'] == '2024-03-01 09:00:00'
+
+def test_review_partitions(client, seed_db):
+    """Test moving old reviews into monthly and archived partitions.
+    
+    Verifies:
+    - Old months leave the hot table; words' review counts and the change
+      feed are untouched by the move
+    - Old sessions still read their reviews from the partitions
+    - Current sessions read only the hot table
+    - Exports and the change feed see every partition
+    - Resetting history drops the partitions
+    """
+    conn = sqlite3.connect(seed_db)
+    conn.execute("PRAGMA foreign_keys = ON")
+    for created_at in ('2024-01-10 09:00:00', '2025-03-05 18:00:00'):
+        session_id = conn.execute("""
+            INSERT INTO study_sessions (group_id, study_activity_id, created_at)
+            VALUES (1, 1, ?)
+        """, (created_at,)).lastrowid
+        conn.executemany("""
+            INSERT INTO word_review_items (word_id, study_session_id, correct, created_at)
+            VALUES (?, ?, ?, ?)
+        """, [(word_id, session_id, word_id != 2, created_at) for word_id in (1, 2, 3)])
+    conn.commit()
+    old_session = session_id
+    counts = conn.execute("SELECT id, correct_count, wrong_count FROM words").fetchall()
+    version = conn.execute("SELECT MAX(version) FROM change_log").fetchone()[0]
+
+    # As of mid June 2025: March 2025 gets a partition, January 2024 is archived
+    result = partition_reviews(conn, TestConfig.REVIEW_ARCHIVE_PATH, hot_months=2,
+                               archive_after_months=12, batch_size=2,
+                               now=calendar.timegm((2025, 6, 15, 0, 0, 0)))
+    assert result == {
+        'moved': {'word_review_items_2024_01': 3, 'word_review_items_2025_03': 3},
+        'archived': ['word_review_items_2024_01'],
+    }
+    assert conn.execute("SELECT COUNT(*) FROM word_review_items").fetchone()[0] == 6
+    assert conn.execute("SELECT id, correct_count, wrong_count FROM words").fetchall() == counts
+    assert conn.execute("SELECT MAX(version) FROM change_log").fetchone()[0] == version
+    assert review_source(conn, TestConfig.REVIEW_ARCHIVE_PATH, epoch_now()) == 'word_review_items'
+    conn.close()
+
+    stats = client.get(f'/api/study_sessions/{old_session}/stats').get_json()
+    assert stats['total_words'] == 3 and stats['correct_count'] == 2
+    assert [w['id'] for w in client.get(f'/api/study_sessions/{old_session}/words').get_json()['words']] == [1, 2, 3]
+    assert client.get('/api/study_sessions/1/stats').get_json()['total_words'] == 3
+    assert client.get('/api/dashboard/study_progress').get_json()['total_words_studied'] == 3
+
+    # Closing the response ends the export's read snapshot
+    with client.get('/api/export/word_review_items') as response:
+        assert len(response.get_data(as_text=True).splitlines()) == 12
+    feed = client.get('/api/changes?since=0').get_json()
+    assert len(feed['upserts']['word_review_items']) == 12
+
+    assert client.post('/api/reset_history').status_code == 200
+    conn = sqlite3.connect(seed_db)
+    assert conn.execute("SELECT COUNT(*) FROM review_partitions").fetchone()[0] == 0
+    assert conn.execute("SELECT COUNT(*) FROM words WHERE studied").fetchone()[0] == 0
+    conn.close()
+
+def test_partition_duplicate_client_ids(seed_db):
+    """A hot review whose client id is already partitioned is dropped
+    from the review counts as it is moved"""
+    conn = sqlite3.connect(seed_db)
+    conn.execute("PRAGMA foreign_keys = ON")
+    session_id = conn.execute("""
+        INSERT INTO study_sessions (group_id, study_activity_id, created_at)
+        VALUES (1, 1, '2025-03-05 18:00:00')
+    """).lastrowid
+    insert = """
+        INSERT INTO word_review_items (word_id, study_session_id, correct, created_at, client_id)
+        VALUES (1, ?, 1, '2025-03-05 18:00:00', ?)
+    """
+    conn.execute(insert, (session_id, 'review-1'))
+    conn.commit()
+    now = calendar.timegm((2025, 6, 15, 0, 0, 0))
+    partition_reviews(conn, TestConfig.REVIEW_ARCHIVE_PATH, hot_months=2, now=now)
+
+    # A retried upload that raced the partition check
+    conn.execute(insert, (session_id, 'review-1'))
+    conn.execute(insert, (session_id, 'review-2'))
+    conn.commit()
+    correct = conn.execute("SELECT correct_count FROM words WHERE id = 1").fetchone()[0]
+    result = partition_reviews(conn, TestConfig.REVIEW_ARCHIVE_PATH, hot_months=2, now=now)
+    assert result['moved'] == {'word_review_items_2025_03': 1}
+    assert conn.execute("""
+        SELECT client_id FROM word_review_items_2025_03 ORDER BY client_id
+    """).fetchall() == [('review-1',), ('review-2',)]
+    assert conn.execute("SELECT correct_count FROM words WHERE id = 1").fetchone()[0] == correct - 1
+    assert conn.execute("""
+        SELECT COUNT(*) FROM word_review_items WHERE created_day < ?
+    """, (day_of('2025-04-01'),)).fetchone()[0] == 0
+    conn.close()
+
+def test_delete_partitioned_reviews(seed_db):
+    """Test deleting sessions and words whose reviews were partitioned.
+    
+    Verifies:
+    - Reviews go from the hot table, partitions and the archive alike
+    - Deleted partitioned reviews leave the words' review counts
+    """
+    conn = sqlite3.connect(seed_db)
+    conn.execute("PRAGMA foreign_keys = ON")
+    sessions = []
+    for created_at in ('2024-01-10 09:00:00', '2025-03-05 18:00:00'):
+        sessions.append(conn.execute("""
+            INSERT INTO study_sessions (group_id, study_activity_id, created_at)
+            VALUES (1, 1, ?)
+        """, (created_at,)).lastrowid)
+        conn.executemany("""
+            INSERT INTO word_review_items (word_id, study_session_id, correct, created_at)
+            VALUES (?, ?, ?, ?)
+        """, [(word_id, sessions[-1], word_id != 2, created_at) for word_id in (1, 2, 3)])
+    conn.commit()
+    partition_reviews(conn, TestConfig.REVIEW_ARCHIVE_PATH, hot_months=2,
+                      archive_after_months=12, now=calendar.timegm((2025, 6, 15, 0, 0, 0)))
+    counts = dict(conn.execute("SELECT id, correct_count + wrong_count FROM words").fetchall())
+
+    assert delete_study_sessions(conn, TestConfig.REVIEW_ARCHIVE_PATH, [sessions[0]]) == {
+        'sessions': 1, 'reviews': 3
+    }
+    assert delete_reviews(conn, TestConfig.REVIEW_ARCHIVE_PATH, 'word_id', [3]) >= 2
+    conn.execute("DELETE FROM words WHERE id = 3")
+    conn.commit()
+
+    tables = review_tables(conn, TestConfig.REVIEW_ARCHIVE_PATH)
+    assert len(tables) == 3
+    reviews = [row for table in tables
+               for row in conn.execute(f"SELECT word_id, study_session_id FROM {table}")]
+    assert not [row for row in reviews if row[0] == 3 or row[1] == sessions[0]]
+    assert (1, sessions[1]) in reviews
+    assert dict(conn.execute("SELECT id, correct_count + wrong_count FROM words").fetchall()) == {
+        1: counts[1] - 1, 2: counts[2] - 1
+    }
+    conn.close()
@@ -0,0 +1,188 @@
+import pytest
+import sqlite3
+from lib.timestamps import day_of
+
+def test_changes_initial_sync(client, seed_db):
+    """Test a full sync from version 0.
+
+    Verifies:
+    - Every seeded row is returned as an upsert
+    - Rows are grouped by table
+    - Version points at the last change returned
+    """
+    response = client.get('/api/changes?since=0')
+    assert response.status_code == 200
+
+    data = response.get_json()
+    assert data['has_more'] is False
+    assert len(data['upserts']['words']) == 3
+    assert len(data['upserts']['groups']) == 2
+    assert len(data['upserts']['word_groups']) == 3
+    assert len(data['upserts']['study_sessions']) == 2
+    assert len(data['upserts']['word_review_items']) == 6
+    assert data['upserts']['words'][0]['spanish'] == 'hola'
+    assert data['version'] > 0
+
+def test_changes_delta_is_compacted(client, seed_db):
+    """Test that the feed only returns the latest state of changed rows.
+
+    Verifies:
+    - Rows changed since the client's version are returned once
+    - Unchanged rows are not resent
+    - Deletes are reported as tombstones
+    """
+    version = client.get('/api/changes?since=0').get_json()['version']
+
+    conn = sqlite3.connect(seed_db)
+    conn.execute("UPDATE words SET english = 'hi' WHERE id = 1")
+    conn.execute("UPDATE words SET english = 'hey' WHERE id = 1")
+    conn.execute("DELETE FROM word_groups WHERE word_id = 2")
+    conn.commit()
+    conn.close()
+
+    data = client.get(f'/api/changes?since={version}').get_json()
+    assert data['upserts'] == {
+        'words': [{'id': 1, 'spanish': 'hola', 'pronunciation': 'OH-lah', 'english': 'hey'}],
+        # The membership delete also lowered the group's words_count
+        'groups': [{'id': 1, 'name': 'Basic Phrases', 'words_count': 2}]
+    }
+    assert data['deletes'] == {'word_groups': [[2, 1]]}
+
+    # Nothing new after catching up
+    data = client.get(f"/api/changes?since={data['version']}").get_json()
+    assert data['upserts'] == {}
+    assert data['deletes'] == {}
+
+def test_changes_pagination(client, seed_db):
+    """Test paging through the change feed with limit."""
+    first = client.get('/api/changes?since=0&limit=5').get_json()
+    assert first['has_more'] is True
+
+    second = client.get(f"/api/changes?since={first['version']}&limit=100").get_json()
+    assert second['has_more'] is False
+    assert second['version'] > first['version']
+
+def test_changes_invalid_version(client, seed_db):
+    response = client.get('/api/changes?since=-1')
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Invalid version'
+
+def test_sync_upload_is_idempotent(client, seed_db):
+    """Test that retrying an upload does not duplicate rows.
+
+    Verifies:
+    - Sessions and reviews are created on first upload
+    - Reviews can reference sessions by client id
+    - A retried upload inserts nothing and reports duplicates
+    """
+    payload = {
+        'sessions': [{
+            'client_id': 'session-a',
+            'group_id': 1,
+            'activity_id': 1,
+            'created_at': '2024-05-01T10:00:00',
+            'completed_at': '2024-05-01T10:15:00'
+        }],
+        'reviews': [
+            {'client_id': 'review-1', 'session_client_id': 'session-a',
+             'word_id': 1, 'correct': True, 'created_at': '2024-05-01T10:01:00'},
+            {'client_id': 'review-2', 'session_client_id': 'session-a',
+             'word_id': 2, 'correct': False, 'created_at': '2024-05-01T10:02:00'}
+        ]
+    }
+
+    response = client.post('/api/sync/upload', json=payload)
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['inserted'] == {'sessions': 1, 'reviews': 2}
+    session_id = data['sessions']['session-a']
+
+    response = client.post('/api/sync/upload', json=payload)
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['inserted'] == {'sessions': 0, 'reviews': 0}
+    assert data['duplicates'] == {'sessions': 1, 'reviews': 2}
+    assert data['sessions']['session-a'] == session_id
+
+    conn = sqlite3.connect(seed_db)
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM word_review_items WHERE study_session_id = ?", (session_id,))
+    assert cursor.fetchone()[0] == 2
+    cursor.execute("SELECT created_at FROM study_sessions WHERE id = ?", (session_id,))
+    assert cursor.fetchone()[0] == '2024-05-01 10:00:00'
+    conn.close()
+
+def test_sync_upload_timestamp_offsets(client, seed_db):
+    """Test that timestamps with an offset are stored as UTC"""
+    response = client.post('/api/sync/upload', json={
+        'sessions': [{'client_id': 'session-tz', 'group_id': 1, 'activity_id': 1,
+                      'created_at': '2024-05-01T01:00:00+02:00'}],
+        'reviews': [{'client_id': 'review-tz', 'session_client_id': 'session-tz',
+                     'word_id': 1, 'correct': True, 'created_at': '2024-05-01T01:30:00+02:00'}]
+    })
+    assert response.status_code == 200
+
+    conn = sqlite3.connect(seed_db)
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT created_at, created_ts, created_day FROM study_sessions
+        WHERE client_id = 'session-tz'
+    """)
+    assert cursor.fetchone() == ('2024-04-30 23:00:00', 1714518000, 1714518000 // 86400)
+    cursor.execute("SELECT created_at, created_ts FROM word_review_items WHERE client_id = 'review-tz'")
+    assert cursor.fetchone() == ('2024-04-30 23:30:00', 1714519800)
+    conn.close()
+
+def test_sync_upload_review_before_session(client, seed_db):
+    """Test that reviews stamped before their session start with it"""
+    response = client.post('/api/sync/upload', json={
+        'sessions': [{'client_id': 'session-late', 'group_id': 1, 'activity_id': 1,
+                      'created_at': '2024-05-01T10:00:00'}],
+        'reviews': [{'client_id': 'review-early', 'session_client_id': 'session-late',
+                     'word_id': 1, 'correct': True, 'created_at': '2024-04-30T09:00:00'}]
+    })
+    assert response.status_code == 200
+
+    conn = sqlite3.connect(seed_db)
+    assert conn.execute("""
+        SELECT created_at, created_day FROM word_review_items WHERE client_id = 'review-early'
+    """).fetchone() == ('2024-05-01 10:00:00', day_of('2024-05-01'))
+    conn.close()
+
+def test_sync_upload_invalid(client, seed_db):
+    """Test validation of upload payloads.
+
+    Verifies:
+    - Missing fields are rejected with 400
+    - Reviews for unknown sessions are rejected
+    - Nothing is written when the upload is rejected
+    """
+    response = client.post('/api/sync/upload', json={
+        'sessions': [{'client_id': 'x', 'group_id': 1}]
+    })
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Invalid upload'
+
+    # Without a client id a retry could not be recognized
+    for client_id in (None, '', 7):
+        response = client.post('/api/sync/upload', json={
+            'sessions': [{'client_id': client_id, 'group_id': 1, 'activity_id': 1,
+                          'created_at': '2024-05-01T10:00:00'}]
+        })
+        assert response.status_code == 400
+        assert 'client_id' in response.get_json()['message']
+
+    response = client.post('/api/sync/upload', json={
+        'sessions': [{'client_id': 'ok', 'group_id': 1, 'activity_id': 1,
+                      'created_at': '2024-05-01T10:00:00'}],
+        'reviews': [{'client_id': 'r', 'session_client_id': 'missing',
+                     'word_id': 1, 'correct': True, 'created_at': '2024-05-01T10:00:00'}]
+    })
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Unknown session'
+
+    conn = sqlite3.connect(seed_db)
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM study_sessions WHERE client_id = 'ok'")
+    assert cursor.fetchone()[0] == 0
+    conn.close()
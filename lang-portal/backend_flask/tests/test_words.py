@@ -420,4 +420,463 @@ def test_get_word(client, seed_db):
     # Test non-existent word
     response = client.get('/api/words/999')
     assert response.status_code == 404
-    assert response.get_json()['error'] == 'Word not found' 
\ No newline at end of file
+    assert response.get_json()['error'] == 'Word not found' 
+def test_bulk_import_words(client, seed_db):
+    """Test bulk importing vocab_importer output into a new group.
+    
+    Verifies:
+    - Group is created by name
+    - New words are inserted and linked
+    - Words already in the database are reported as duplicates
+    - Group word count is updated once for all links
+    """
+    response = client.post('/api/words/bulk?group_name=Kitchen', json=[
+        {'spanish': 'cuchara', 'english': 'spoon', 'pronunciation': 'koo-CHAH-rah'},
+        {'spanish': 'tenedor', 'english': 'fork', 'pronunciation': 'teh-neh-DOR'},
+        {'spanish': 'hola', 'english': 'hello', 'pronunciation': 'OH-lah'},
+        {'spanish': 'cuchara', 'english': 'spoon', 'pronunciation': 'koo-CHAH-rah'}
+    ])
+    assert response.status_code == 200
+    
+    data = response.get_json()
+    assert data['received'] == 4
+    assert data['inserted'] == 2
+    assert data['duplicates'] == 2
+    assert data['linked'] == 3
+    
+    response = client.get(f"/api/groups/{data['group_id']}/words")
+    assert len(response.get_json()['words']) == 3
+    
+    groups = client.get('/api/groups').get_json()['items']
+    group = next(g for g in groups if g['id'] == data['group_id'])
+    assert group['words_count'] == 3
+
+def test_bulk_import_words_ndjson(client, seed_db):
+    """Test streaming an NDJSON body into an existing group."""
+    body = '\n'.join([
+        '{"spanish": "uno", "english": "one", "pronunciation": "OO-noh"}',
+        '',
+        '{"spanish": "dos", "english": "two", "pronunciation": "dohs"}'
+    ])
+    response = client.post('/api/words/bulk?group_id=2', data=body,
+                           content_type='application/x-ndjson')
+    assert response.status_code == 200
+    
+    data = response.get_json()
+    assert data['group_id'] == 2
+    assert data['inserted'] == 2
+    assert data['linked'] == 2
+    
+    # Re-importing links nothing new
+    response = client.post('/api/words/bulk?group_id=2', data=body,
+                           content_type='application/x-ndjson')
+    data = response.get_json()
+    assert data['inserted'] == 0
+    assert data['linked'] == 0
+
+    # Malformed lines are rejected with their position
+    for line in (b'{"spanish": "tres",', b'{"spanish": "\xff"}'):
+        response = client.post('/api/words/bulk?group_id=2', data=body.encode() + b'\n' + line,
+                               content_type='application/x-ndjson')
+        assert response.status_code == 400
+        assert response.get_json()['message'].startswith('Item 4 is not valid JSON')
+
+def test_bulk_import_words_invalid(client, seed_db):
+    """Test that an invalid item rejects the whole import.
+    
+    Verifies:
+    - Missing fields return 400 with the item position
+    - Unknown groups return 404
+    - No words are written when the import is rejected
+    """
+    response = client.post('/api/words/bulk', json=[
+        {'spanish': 'uno', 'english': 'one', 'pronunciation': 'OO-noh'},
+        {'spanish': 'dos', 'english': 'two'}
+    ])
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Invalid word'
+    assert 'Item 2' in response.get_json()['message']
+    
+    response = client.post('/api/words/bulk?group_id=999', json=[
+        {'spanish': 'uno', 'english': 'one', 'pronunciation': 'OO-noh'}
+    ])
+    assert response.status_code == 404
+    
+    response = client.post('/api/words/bulk', json={'spanish': 'uno'})
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Invalid JSON'
+    
+    conn = sqlite3.connect(seed_db)
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM words")
+    assert cursor.fetchone()[0] == 3
+    conn.close()
+
+def test_lookup_word(client, seed_db):
+    """Test accent- and case-insensitive lookup by Spanish text.
+    
+    Verifies:
+    - Exact text finds the word
+    - Accents, case and surrounding spaces are ignored
+    - Unknown words return an empty list
+    - Missing parameter returns 400
+    """
+    response = client.get('/api/words/lookup?spanish=gracias')
+    assert response.status_code == 200
+    assert [w['english'] for w in response.get_json()['items']] == ['thank you']
+    
+    response = client.get('/api/words/lookup?spanish=  GRÁCIAS ')
+    assert [w['english'] for w in response.get_json()['items']] == ['thank you']
+    
+    response = client.get('/api/words/lookup?spanish=adios')
+    assert response.get_json()['items'] == []
+    
+    response = client.get('/api/words/lookup')
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Missing spanish parameter'
+
+def test_words_unique_by_folded_key(client, seed_db):
+    """Test that folded duplicates are rejected and merged by imports.
+    
+    Verifies:
+    - Inserting 'Hola' / 'hello' violates the unique key
+    - Bulk import treats accent/case variants as duplicates, including
+      decomposed accents and accented capitals
+    - The database key matches normalize_key
+    """
+    from lib.normalize import normalize_key
+    
+    conn = sqlite3.connect(seed_db)
+    with pytest.raises(sqlite3.IntegrityError):
+        conn.execute("""
+            INSERT INTO words (spanish, pronunciation, english)
+            VALUES ('Hola', 'OH-lah', 'hello')
+        """)
+    
+    for text in ['Habló', ' ÑANDÚ ', 'pingüino', 'Canción']:
+        key = conn.execute("""
+            INSERT INTO words (spanish, pronunciation, english)
+            VALUES (?, 'x', 'key test') RETURNING spanish_key
+        """, (text,)).fetchone()[0]
+        assert key == normalize_key(text)
+    conn.rollback()
+    conn.close()
+    
+    response = client.post('/api/words/bulk', json=[
+        {'spanish': 'HOLA', 'english': 'hello', 'pronunciation': 'OH-lah'},
+        {'spanish': 'canción', 'english': 'song', 'pronunciation': 'kahn-SYOHN'},
+        {'spanish': 'Cancion', 'english': 'song', 'pronunciation': 'kahn-SYOHN'}
+    ])
+    data = response.get_json()
+    assert data['inserted'] == 1
+    assert data['duplicates'] == 2
+    
+    # 'a' + combining acute, and a capital Á: both the same word as 'está'
+    response = client.post('/api/words/bulk', json=[
+        {'spanish': 'esta\u0301', 'english': 'is', 'pronunciation': 'ehs-TAH'},
+        {'spanish': 'ESTÁ', 'english': 'is', 'pronunciation': 'ehs-TAH'}
+    ])
+    data = response.get_json()
+    assert data['inserted'] == 1
+    assert data['duplicates'] == 1
+    
+    response = client.get('/api/words/lookup?spanish=esta\u0301')
+    assert [w['spanish'] for w in response.get_json()['items']] == ['está']
+
+def test_get_word_from_vocab_pack(client, seed_db, app, tmp_path):
+    """Test answering word and group lookups from the mapped pack.
+    
+    Verifies:
+    - Responses match the SQLite-backed endpoints
+    - Once words, groups or memberships change the pack is not served
+      until it is rebuilt
+    - Other change_log entries (reviews) leave the pack current
+    """
+    from lib.db import get_db
+    from lib.timestamps import timestamp_columns
+    from lib.vocab_pack import current_pack
+    
+    expected_word = client.get('/api/words/1').get_json()
+    expected_group = client.get('/api/groups/1/words').get_json()
+    
+    app.config['VOCAB_PACK_PATH'] = str(tmp_path / 'vocab.pack')
+    app.config['SERVE_FROM_VOCAB_PACK'] = True
+    assert client.post('/api/export/pack').status_code == 200
+    with app.app_context():
+        assert current_pack(get_db()) is not None
+    assert client.get('/api/words/1').get_json() == expected_word
+    assert client.get('/api/groups/1/words').get_json() == expected_group
+    
+    conn = sqlite3.connect(seed_db)
+    conn.execute("UPDATE words SET english = 'hi' WHERE id = 1")
+    conn.execute("""
+        INSERT INTO words (spanish, pronunciation, english)
+        VALUES ('adiós', 'ah-DYOHS', 'goodbye')
+    """)
+    conn.commit()
+    conn.close()
+    
+    # The pack is behind the change_log, so SQLite answers
+    assert client.get('/api/words/1').get_json()['english'] == 'hi'
+    assert client.get('/api/words/4').get_json()['spanish'] == 'adiós'
+    assert client.get('/api/groups/99/words').status_code == 404
+    
+    assert client.post('/api/words/bulk?group_id=1', json=[
+        {'spanish': 'gato', 'english': 'cat', 'pronunciation': 'GAH-toh'}
+    ]).status_code == 200
+    assert 'gato' in [w['spanish'] for w in client.get('/api/groups/1/words').get_json()['words']]
+    
+    assert client.post('/api/export/pack').status_code == 200
+    with app.app_context():
+        db = get_db()
+        assert current_pack(db) is not None
+        db.execute("""
+            INSERT INTO word_review_items
+            (word_id, study_session_id, correct, created_at, created_ts, created_day)
+            VALUES (1, 1, 1, ?, ?, ?)
+        """, timestamp_columns())
+        db.commit()
+        assert current_pack(db) is not None
+        db.execute("DELETE FROM word_groups WHERE word_id = 4")
+        db.execute("DELETE FROM words WHERE id = 4")
+        db.commit()
+        assert current_pack(db) is None
+    assert client.get('/api/words/4').status_code == 404
+
+def test_search_words_ranked_pages(client, seed_db):
+    """Test accent-insensitive search with group filter and cursor pages.
+    
+    Verifies:
+    - Accents in the text or the query do not affect matching
+    - Spanish matches rank above English matches
+    - Cursor pages cover every match exactly once
+    - The index follows inserts, updates and deletes
+    """
+    response = client.post('/api/words/bulk', json=[
+        {'spanish': 'canción', 'english': 'song', 'pronunciation': 'kahn-SYOHN'},
+        {'spanish': 'cantar', 'english': 'to sing', 'pronunciation': 'kahn-TAHR'},
+        {'spanish': 'melodía', 'english': 'canticle', 'pronunciation': 'meh-loh-DEE-ah'}
+    ])
+    assert response.get_json()['inserted'] == 3
+    
+    items = client.get('/api/words/search?q=CANCION').get_json()['items']
+    assert [item['spanish'] for item in items] == ['canción']
+    
+    items = client.get('/api/words/search?q=cant').get_json()['items']
+    assert [item['spanish'] for item in items] == ['cantar', 'melodía']
+    
+    seen = []
+    url = '/api/words/search?q=can&limit=1'
+    while url:
+        data = client.get(url).get_json()
+        seen.extend(item['spanish'] for item in data['items'])
+        url = data['next_cursor'] and f"/api/words/search?q=can&limit=1&cursor={data['next_cursor']}"
+    assert sorted(seen) == ['canción', 'cantar', 'melodía']
+    
+    items = client.get('/api/words/search?q=hola&group_id=2').get_json()['items']
+    assert items == []
+    items = client.get('/api/words/search?q=hola&group_id=1').get_json()['items']
+    assert len(items) == 1
+    
+    conn = sqlite3.connect(seed_db)
+    conn.execute("UPDATE words SET english = 'hi there' WHERE spanish = 'hola'")
+    conn.execute("DELETE FROM words WHERE spanish = 'cantar'")
+    conn.commit()
+    conn.close()
+    assert len(client.get('/api/words/search?q=there').get_json()['items']) == 1
+    assert client.get('/api/words/search?q=cantar').get_json()['items'] == []
+    
+    response = client.get('/api/words/search?q=can&cursor=bogus')
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Invalid cursor'
+
+def test_search_words_broad_query_unranked(client, seed_db, monkeypatch):
+    """Test that queries with too many matches page in id order."""
+    import lib.search
+    monkeypatch.setattr(lib.search, 'RANK_LIMIT', 1)
+    client.post('/api/words/bulk', json=[
+        {'spanish': 'hablar', 'english': 'to speak', 'pronunciation': 'ah-BLAHR'}
+    ])
+    
+    data = client.get('/api/words/search?q=h&limit=1').get_json()
+    assert data['ranked'] is False
+    assert [item['id'] for item in data['items']] == [1]
+    
+    data = client.get(f"/api/words/search?q=h&limit=1&cursor={data['next_cursor']}").get_json()
+    assert data['ranked'] is False
+    assert [item['id'] for item in data['items']] == [4]
+    assert data['next_cursor'] is None
+
+def test_autocomplete_words(client, seed_db):
+    """Test typeahead over folded Spanish and English forms.
+    
+    Verifies:
+    - Prefixes match either language, ignoring accents and case
+    - Results follow word inserts, updates and deletes
+    - Empty prefixes are rejected
+    """
+    items = client.get('/api/words/autocomplete?prefix=GRA').get_json()['items']
+    assert items == [{'id': 2, 'spanish': 'gracias', 'english': 'thank you'}]
+    
+    items = client.get('/api/words/autocomplete?prefix=h').get_json()['items']
+    assert [item['id'] for item in items] == [1]
+    
+    conn = sqlite3.connect(seed_db)
+    conn.execute("""
+        INSERT INTO words (spanish, pronunciation, english)
+        VALUES ('habló', 'ah-BLOH', 'spoke')
+    """)
+    conn.execute("UPDATE words SET english = 'many thanks' WHERE id = 2")
+    conn.execute("DELETE FROM word_review_items WHERE word_id = 1")
+    conn.execute("DELETE FROM word_groups WHERE word_id = 1")
+    conn.execute("DELETE FROM words WHERE id = 1")
+    conn.commit()
+    conn.close()
+    
+    items = client.get('/api/words/autocomplete?prefix=hablo').get_json()['items']
+    assert [item['spanish'] for item in items] == ['habló']
+    assert client.get('/api/words/autocomplete?prefix=hol').get_json()['items'] == []
+    assert client.get('/api/words/autocomplete?prefix=thank').get_json()['items'] == []
+    items = client.get('/api/words/autocomplete?prefix=many&limit=5').get_json()['items']
+    assert items[0]['english'] == 'many thanks'
+    
+    response = client.get('/api/words/autocomplete?prefix=')
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Missing prefix parameter'
+
+def test_fuzzy_search_words(client, seed_db):
+    """Test typo-tolerant search backed by the trigram index.
+    
+    Verifies:
+    - Misspellings within the edit distance find the word
+    - Closer matches come first and report their distance
+    - The index follows inserts, updates and deletes
+    """
+    client.post('/api/words/bulk', json=[
+        {'spanish': 'hablar', 'english': 'to speak', 'pronunciation': 'ah-BLAHR'},
+        {'spanish': 'hablador', 'english': 'talkative', 'pronunciation': 'ah-blah-DOHR'}
+    ])
+    
+    items = client.get('/api/words/fuzzy?q=avlar').get_json()['items']
+    assert items[0]['spanish'] == 'hablar'
+    assert items[0]['distance'] == 2
+    
+    items = client.get('/api/words/fuzzy?q=GRASIAS').get_json()['items']
+    assert [(item['spanish'], item['distance']) for item in items] == [('gracias', 1)]
+    
+    items = client.get('/api/words/fuzzy?q=thnak you').get_json()['items']
+    assert items[0]['spanish'] == 'gracias'
+    
+    assert client.get('/api/words/fuzzy?q=avlar&max_distance=1').get_json()['items'] == []
+    
+    conn = sqlite3.connect(seed_db)
+    conn.execute("UPDATE words SET spanish = 'charlar' WHERE spanish = 'hablar'")
+    conn.execute("DELETE FROM words WHERE spanish = 'hablador'")
+    conn.commit()
+    assert conn.execute("SELECT COUNT(*) FROM word_trigrams WHERE trigram = 'hab'").fetchone()[0] == 0
+    conn.close()
+    items = client.get('/api/words/fuzzy?q=charlr').get_json()['items']
+    assert items[0]['spanish'] == 'charlar'
+    
+    response = client.get('/api/words/fuzzy?q=hola&max_distance=9')
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Invalid max_distance'
+
+def test_similar_words(app, client, seed_db, tmp_path):
+    """Test semantic search over the on-disk vector index.
+    
+    Verifies:
+    - Words sharing stems or translations with the query rank first
+    - New words are appended to the index without rebuilding it
+    - Deleted words drop out of the results
+    - An unreachable embedding service returns 503
+    """
+    app.config['VECTOR_INDEX_DIR'] = str(tmp_path / 'vectors')
+    client.post('/api/words/bulk', json=[
+        {'spanish': 'cocina', 'english': 'kitchen', 'pronunciation': 'koh-SEE-nah'},
+        {'spanish': 'mesa de cocina', 'english': 'kitchen table', 'pronunciation': 'MEH-sah deh koh-SEE-nah'},
+        {'spanish': 'perro', 'english': 'dog', 'pronunciation': 'PEH-rroh'}
+    ])
+    
+    items = client.get('/api/words/similar?q=kitchen').get_json()['items']
+    assert [item['spanish'] for item in items[:2]] == ['cocina', 'mesa de cocina']
+    assert 0 < items[1]['score'] < items[0]['score'] <= 1
+    
+    conn = sqlite3.connect(seed_db)
+    conn.execute("""
+        INSERT INTO words (spanish, english, pronunciation)
+        VALUES ('cocinero', 'cook', 'koh-see-NEH-roh')
+    """)
+    conn.execute("DELETE FROM words WHERE spanish = 'cocina'")
+    conn.commit()
+    conn.close()
+    items = client.get('/api/words/similar?q=cocinero').get_json()['items']
+    assert items[0]['spanish'] == 'cocinero'
+    assert 'cocina' not in [item['spanish'] for item in items]
+    assert sorted(os.listdir(tmp_path / 'vectors')) == ['ids-1.npy', 'lock', 'meta.json', 'vectors-1.npy']
+    
+    assert client.get('/api/words/similar?q=').status_code == 400
+    
+    app.extensions.pop('vector_index')
+    app.config['EMBEDDER'] = 'openai'
+    app.config['EMBEDDING_URL'] = 'http://127.0.0.1:9'
+    response = client.get('/api/words/similar?q=kitchen')
+    assert response.status_code == 503
+    assert response.get_json()['error'] == 'Embedding service unavailable'
+
+def test_word_list_sort_and_filter(client, seed_db, monkeypatch):
+    """Test sorting and filtering the word list by review counts.
+    
+    Verifies:
+    - Reviews update each word's correct and wrong counts
+    - Every sort field and direction, studied and group filters
+    - Cursor pages follow the requested order
+    - Reviews are not published to the sync change feed
+    """
+    version = client.get('/api/changes').get_json()['version']
+    session_id = client.post('/api/study_sessions', json={
+        'group_id': 1, 'activity_id': 1
+    }).get_json()['session']['id']
+    for word_id, correct in ((1, True), (1, True), (1, True), (1, False), (2, False), (2, False)):
+        client.post(f'/api/study_sessions/{session_id}/words/{word_id}/review', json={'correct': correct})
+    assert 'words' not in client.get(f'/api/changes?since={version}').get_json()['upserts']
+    
+    def spanish(query):
+        return [word['spanish'] for word in client.get(f'/api/words?{query}').get_json()['items']]
+    
+    # Seeded sessions already reviewed every word correctly twice
+    items = client.get('/api/words?sort=correct_count&order=desc').get_json()['items']
+    assert [(w['spanish'], w['correct_count'], w['wrong_count']) for w in items] == [
+        ('hola', 5, 1), ('por favor', 2, 0), ('gracias', 2, 2)
+    ]
+    assert spanish('sort=wrong_count') == ['por favor', 'hola', 'gracias']
+    assert spanish('sort=spanish&order=desc') == ['por favor', 'hola', 'gracias']
+    assert spanish('sort=english') == ['hola', 'por favor', 'gracias']
+    
+    client.post('/api/reset_history')
+    assert spanish('studied=true') == []
+    session_id = client.post('/api/study_sessions', json={
+        'group_id': 1, 'activity_id': 1
+    }).get_json()['session']['id']
+    client.post(f'/api/study_sessions/{session_id}/words/3/review', json={'correct': False})
+    
+    conn = sqlite3.connect(seed_db)
+    conn.execute("INSERT INTO words (spanish, pronunciation, english) VALUES ('adiós', 'ah-DYOHS', 'goodbye')")
+    conn.commit()
+    conn.close()
+    assert spanish('studied=false&sort=spanish') == ['adiós', 'gracias', 'hola']
+    
+    for group_sort_limit in (5000, 0):
+        monkeypatch.setattr('lib.word_list.GROUP_SORT_LIMIT', group_sort_limit)
+        data = client.get('/api/words?group_id=1&sort=wrong_count&order=desc&limit=2').get_json()
+        assert data['total_words'] == 3
+        paged = [word['spanish'] for word in data['items']]
+        data = client.get(f"/api/words?group_id=1&sort=wrong_count&order=desc&limit=2&cursor={data['next_cursor']}").get_json()
+        paged += [word['spanish'] for word in data['items']]
+        assert data['next_cursor'] is None
+        assert paged == ['por favor', 'gracias', 'hola']
+    
+    assert client.get('/api/words?sort=pronunciation').get_json()['error'] == 'Invalid sort field'
+    assert client.get('/api/words?order=up').get_json()['error'] == 'Invalid sort order'
+    assert client.get('/api/words?studied=maybe').get_json()['error'] == 'Invalid studied filter'
+    assert client.get('/api/words?sort=spanish&cursor=WzFd').get_json()['error'] == 'Invalid cursor'